@@ -0,0 +1,509 @@
+/* Optional compiled kernels for apply_bpe.py and learn_bpe.py.
+ *
+ * Build in place with:  python setup.py build_ext --inplace
+ *
+ * Each function computes exactly what the pure Python function of the same
+ * name computes (apply_bpe.apply_merges, learn_bpe.replace_pair and
+ * learn_bpe.update_pair_statistics); the scripts fall back to those when this
+ * module is not built, or when SUBWORD_NMT_NO_ACCEL is set.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+static PyObject *endword;       /* '</w>' */
+static PyObject *empty;         /* '' */
+static PyObject *version01;     /* (0, 1) */
+static PyObject *version02;     /* (0, 2) */
+static PyObject *str_add;       /* 'add' */
+static PyObject *str_words;     /* 'words' */
+static PyObject *str_reset;     /* 'reset' */
+
+/* mapping[key] += delta, with mapping[key] going through __missing__ like Python's += */
+static int
+add_to(PyObject *mapping, PyObject *key, PyObject *delta)
+{
+    PyObject *old, *new;
+    int r;
+    old = PyObject_GetItem(mapping, key);
+    if (old == NULL)
+        return -1;
+    new = PyNumber_Add(old, delta);
+    Py_DECREF(old);
+    if (new == NULL)
+        return -1;
+    r = PyObject_SetItem(mapping, key, new);
+    Py_DECREF(new);
+    return r;
+}
+
+/* stats[key] += delta; indices.add(key, j, one) (indices is a pair_index.PairIndex) */
+static int
+add_pair(PyObject *stats, PyObject *indices, PyObject *key, PyObject *delta, PyObject *j, PyObject *one)
+{
+    PyObject *r;
+    if (add_to(stats, key, delta) < 0)
+        return -1;
+    r = PyObject_CallMethodObjArgs(indices, str_add, key, j, one, NULL);
+    if (r == NULL)
+        return -1;
+    Py_DECREF(r);
+    return 0;
+}
+
+/* tuple(word[start:start+2]) for a tuple word */
+static PyObject *
+pair_at(PyObject *word, Py_ssize_t start)
+{
+    return PyTuple_GetSlice(word, start, start + 2);
+}
+
+static int
+eq(PyObject *a, PyObject *b)
+{
+    if (a == b)
+        return 1;
+    return PyObject_RichCompareBool(a, b, Py_EQ);
+}
+
+/* tuple of word with every non-overlapping occurrence of (first, second) replaced by merged,
+   scanning left to right */
+static PyObject *
+merge_tuple(PyObject *word, PyObject *first, PyObject *second, PyObject *merged)
+{
+    Py_ssize_t n = PyTuple_GET_SIZE(word), i = 0;
+    PyObject *out = PyList_New(0), *result;
+    int c;
+    if (out == NULL)
+        return NULL;
+    while (i < n) {
+        PyObject *x = PyTuple_GET_ITEM(word, i);
+        c = eq(x, first);
+        if (c < 0)
+            goto error;
+        if (c && i < n - 1) {
+            c = eq(PyTuple_GET_ITEM(word, i + 1), second);
+            if (c < 0)
+                goto error;
+            if (c) {
+                if (PyList_Append(out, merged) < 0)
+                    goto error;
+                i += 2;
+                continue;
+            }
+        }
+        if (PyList_Append(out, x) < 0)
+            goto error;
+        i += 1;
+    }
+    result = PyList_AsTuple(out);
+    Py_DECREF(out);
+    return result;
+error:
+    Py_DECREF(out);
+    return NULL;
+}
+
+static PyObject *
+accel_apply_merges(PyObject *self, PyObject *args)
+{
+    PyObject *orig, *bpe_codes, *version;
+    PyObject *word = NULL, *result = NULL;
+    Py_ssize_t len, n, i;
+    int v01, c;
+
+    if (!PyArg_ParseTuple(args, "UO!O", &orig, &PyDict_Type, &bpe_codes, &version))
+        return NULL;
+    c = PyObject_RichCompareBool(version, version01, Py_EQ);
+    if (c < 0)
+        return NULL;
+    v01 = c;
+    if (!v01) {
+        c = PyObject_RichCompareBool(version, version02, Py_EQ);
+        if (c < 0)
+            return NULL;
+        if (!c) {
+            PyErr_SetNone(PyExc_NotImplementedError);
+            return NULL;
+        }
+    }
+
+    len = PyUnicode_GET_LENGTH(orig);
+    if (len == 0 && !v01) {
+        PyErr_SetString(PyExc_IndexError, "string index out of range");
+        return NULL;
+    }
+    word = PyList_New(0);
+    if (word == NULL)
+        return NULL;
+    for (i = 0; i < len; i++) {
+        PyObject *ch = PyUnicode_Substring(orig, i, i + 1);
+        if (ch == NULL)
+            goto done;
+        if (!v01 && i == len - 1) {
+            PyObject *last = PyUnicode_Concat(ch, endword);
+            Py_DECREF(ch);
+            if (last == NULL)
+                goto done;
+            ch = last;
+        }
+        c = PyList_Append(word, ch);
+        Py_DECREF(ch);
+        if (c < 0)
+            goto done;
+    }
+    if (v01 && PyList_Append(word, endword) < 0)
+        goto done;
+
+    n = PyList_GET_SIZE(word);
+    if (n < 2) {
+        result = Py_None;
+        Py_INCREF(result);
+        goto done;
+    }
+
+    while (1) {
+        PyObject *best = NULL, *first = NULL, *second = NULL;
+        long long best_rank = 0;
+        PyObject *new_word, *merged;
+        n = PyList_GET_SIZE(word);
+        for (i = 0; i < n - 1; i++) {
+            PyObject *key = PyTuple_Pack(2, PyList_GET_ITEM(word, i), PyList_GET_ITEM(word, i + 1));
+            PyObject *rank;
+            long long r;
+            if (key == NULL)
+                goto done;
+            rank = PyDict_GetItemWithError(bpe_codes, key);
+            Py_DECREF(key);
+            if (rank == NULL) {
+                if (PyErr_Occurred())
+                    goto done;
+                continue;
+            }
+            r = PyLong_AsLongLong(rank);
+            if (r == -1 && PyErr_Occurred())
+                goto done;
+            if (best == NULL || r < best_rank) {
+                best = rank;
+                best_rank = r;
+                first = PyList_GET_ITEM(word, i);
+                second = PyList_GET_ITEM(word, i + 1);
+            }
+        }
+        if (best == NULL)
+            break;
+        merged = PyUnicode_Concat(first, second);
+        if (merged == NULL)
+            goto done;
+        Py_INCREF(first);
+        Py_INCREF(second);
+        {
+            PyObject *t = PyList_AsTuple(word);
+            if (t == NULL) {
+                Py_DECREF(first);
+                Py_DECREF(second);
+                Py_DECREF(merged);
+                goto done;
+            }
+            new_word = merge_tuple(t, first, second, merged);
+            Py_DECREF(t);
+        }
+        Py_DECREF(first);
+        Py_DECREF(second);
+        Py_DECREF(merged);
+        if (new_word == NULL)
+            goto done;
+        Py_DECREF(word);
+        word = PySequence_List(new_word);
+        Py_DECREF(new_word);
+        if (word == NULL)
+            goto done;
+        if (PyList_GET_SIZE(word) == 1)
+            break;
+    }
+
+    /* don't print end-of-word symbols */
+    n = PyList_GET_SIZE(word);
+    {
+        PyObject *last = PyList_GET_ITEM(word, n - 1);
+        c = PyUnicode_Compare(last, endword);
+        if (c == -1 && PyErr_Occurred())
+            goto done;
+        if (c == 0) {
+            if (PyList_SetSlice(word, n - 1, n, NULL) < 0)
+                goto done;
+        } else {
+            Py_ssize_t found = PyUnicode_Tailmatch(last, endword, 0, PY_SSIZE_T_MAX, 1);
+            if (found < 0)
+                goto done;
+            if (found) {
+                PyObject *stripped = PyUnicode_Replace(last, endword, empty, -1);
+                if (stripped == NULL)
+                    goto done;
+                if (PyList_SetItem(word, n - 1, stripped) < 0)
+                    goto done;
+            }
+        }
+    }
+    result = PyList_AsTuple(word);
+
+done:
+    Py_XDECREF(word);
+    return result;
+}
+
+static PyObject *
+accel_replace_pair(PyObject *self, PyObject *args)
+{
+    PyObject *pair, *vocab, *indices;
+    PyObject *first, *second, *merged = NULL, *words = NULL, *iter = NULL, *j;
+    PyObject *changes = NULL, *result = NULL;
+
+    if (!PyArg_ParseTuple(args, "O!OO", &PyTuple_Type, &pair, &vocab, &indices))
+        return NULL;
+    if (PyTuple_GET_SIZE(pair) != 2) {
+        PyErr_SetString(PyExc_ValueError, "pair must have two symbols");
+        return NULL;
+    }
+    first = PyTuple_GET_ITEM(pair, 0);
+    second = PyTuple_GET_ITEM(pair, 1);
+    merged = PyUnicode_Concat(first, second);
+    if (merged == NULL)
+        return NULL;
+    changes = PyList_New(0);
+    if (changes == NULL)
+        goto done;
+    words = PyObject_CallMethodObjArgs(indices, str_words, pair, NULL);
+    if (words == NULL)
+        goto done;
+    iter = PyObject_GetIter(words);
+    if (iter == NULL)
+        goto done;
+    while ((j = PyIter_Next(iter)) != NULL) {
+        PyObject *entry, *word, *freq, *new_word, *t;
+        int c;
+        entry = PyObject_GetItem(vocab, j);
+        if (entry == NULL) {
+            Py_DECREF(j);
+            goto done;
+        }
+        if (!PyArg_ParseTuple(entry, "O!O", &PyTuple_Type, &word, &freq)) {
+            Py_DECREF(entry);
+            Py_DECREF(j);
+            goto done;
+        }
+        new_word = merge_tuple(word, first, second, merged);
+        if (new_word == NULL) {
+            Py_DECREF(entry);
+            Py_DECREF(j);
+            goto done;
+        }
+        t = PyTuple_Pack(2, new_word, freq);
+        if (t == NULL || PyObject_SetItem(vocab, j, t) < 0) {
+            Py_XDECREF(t);
+            Py_DECREF(new_word);
+            Py_DECREF(entry);
+            Py_DECREF(j);
+            goto done;
+        }
+        Py_DECREF(t);
+        t = PyTuple_Pack(4, j, new_word, word, freq);
+        Py_DECREF(new_word);
+        Py_DECREF(entry);
+        Py_DECREF(j);
+        if (t == NULL)
+            goto done;
+        c = PyList_Append(changes, t);
+        Py_DECREF(t);
+        if (c < 0)
+            goto done;
+    }
+    if (PyErr_Occurred())
+        goto done;
+    result = changes;
+    changes = NULL;
+
+done:
+    Py_XDECREF(merged);
+    Py_XDECREF(changes);
+    Py_XDECREF(words);
+    Py_XDECREF(iter);
+    return result;
+}
+
+static PyObject *
+accel_update_pair_statistics(PyObject *self, PyObject *args)
+{
+    PyObject *pair, *changed, *stats, *indices;
+    PyObject *first, *second, *new_pair = NULL, *iter = NULL, *change, *zero = NULL, *one = NULL, *minus_one = NULL;
+    PyObject *reset, *result = NULL;
+
+    if (!PyArg_ParseTuple(args, "O!OOO", &PyTuple_Type, &pair, &changed, &stats, &indices))
+        return NULL;
+    if (PyTuple_GET_SIZE(pair) != 2) {
+        PyErr_SetString(PyExc_ValueError, "pair must have two symbols");
+        return NULL;
+    }
+    first = PyTuple_GET_ITEM(pair, 0);
+    second = PyTuple_GET_ITEM(pair, 1);
+    zero = PyLong_FromLong(0);
+    one = PyLong_FromLong(1);
+    minus_one = PyLong_FromLong(-1);
+    if (zero == NULL || one == NULL || minus_one == NULL)
+        goto done;
+    if (PyObject_SetItem(stats, pair, zero) < 0)
+        goto done;
+    reset = PyObject_CallMethodObjArgs(indices, str_reset, pair, NULL);
+    if (reset == NULL)
+        goto done;
+    Py_DECREF(reset);
+    new_pair = PyUnicode_Concat(first, second);
+    if (new_pair == NULL)
+        goto done;
+    iter = PyObject_GetIter(changed);
+    if (iter == NULL)
+        goto done;
+
+    while ((change = PyIter_Next(iter)) != NULL) {
+        PyObject *j, *word, *old_word, *freq, *neg_freq;
+        Py_ssize_t i, n;
+        int c, ok = 0;
+        if (!PyArg_ParseTuple(change, "OO!O!O", &j, &PyTuple_Type, &word, &PyTuple_Type, &old_word, &freq)) {
+            Py_DECREF(change);
+            goto done;
+        }
+        neg_freq = PyNumber_Negative(freq);
+        if (neg_freq == NULL) {
+            Py_DECREF(change);
+            goto done;
+        }
+
+        /* find all instances of pair, and update frequency/indices around it */
+        n = PyTuple_GET_SIZE(old_word);
+        i = 0;
+        while (i < n) {
+            c = eq(PyTuple_GET_ITEM(old_word, i), first);
+            if (c < 0)
+                goto change_done;
+            if (!c) {
+                i += 1;
+                continue;
+            }
+            c = i < n - 1 ? eq(PyTuple_GET_ITEM(old_word, i + 1), second) : 0;
+            if (c < 0)
+                goto change_done;
+            if (c) {
+                /* assuming a symbol sequence "A B C", if "B C" is merged, reduce the frequency of "A B" */
+                if (i) {
+                    PyObject *prev = pair_at(old_word, i - 1);
+                    int r = prev == NULL ? -1 : add_pair(stats, indices, prev, neg_freq, j, minus_one);
+                    Py_XDECREF(prev);
+                    if (r < 0)
+                        goto change_done;
+                }
+                if (i < n - 2) {
+                    /* skip "C B" in A B C B C, it was reduced as the "A B" of the next occurrence */
+                    int skip = 0;
+                    c = eq(PyTuple_GET_ITEM(old_word, i + 2), first);
+                    if (c < 0)
+                        goto change_done;
+                    if (c && i < n - 3) {
+                        c = eq(PyTuple_GET_ITEM(old_word, i + 3), second);
+                        if (c < 0)
+                            goto change_done;
+                        skip = c;
+                    }
+                    if (!skip) {
+                        PyObject *nex = pair_at(old_word, i + 1);
+                        int r = nex == NULL ? -1 : add_pair(stats, indices, nex, neg_freq, j, minus_one);
+                        Py_XDECREF(nex);
+                        if (r < 0)
+                            goto change_done;
+                    }
+                }
+                i += 2;
+            } else {
+                i += 1;
+            }
+        }
+
+        n = PyTuple_GET_SIZE(word);
+        for (i = 0; i < n; i++) {
+            c = eq(PyTuple_GET_ITEM(word, i), new_pair);
+            if (c < 0)
+                goto change_done;
+            if (!c)
+                continue;
+            /* assuming a symbol sequence "A BC D", if "B C" is merged, increase the frequency of "A BC" */
+            if (i) {
+                PyObject *prev = pair_at(word, i - 1);
+                int r = prev == NULL ? -1 : add_pair(stats, indices, prev, freq, j, one);
+                Py_XDECREF(prev);
+                if (r < 0)
+                    goto change_done;
+            }
+            /* assuming a symbol sequence "A BC B", if "B C" is merged, increase the frequency of "BC B",
+               unless it is "BC BC", which is counted by the previous block */
+            if (i < n - 1) {
+                c = eq(PyTuple_GET_ITEM(word, i + 1), new_pair);
+                if (c < 0)
+                    goto change_done;
+                if (!c) {
+                    PyObject *nex = pair_at(word, i);
+                    int r = nex == NULL ? -1 : add_pair(stats, indices, nex, freq, j, one);
+                    Py_XDECREF(nex);
+                    if (r < 0)
+                        goto change_done;
+                }
+            }
+        }
+        ok = 1;
+    change_done:
+        Py_DECREF(neg_freq);
+        Py_DECREF(change);
+        if (!ok)
+            goto done;
+    }
+    if (PyErr_Occurred())
+        goto done;
+    result = Py_None;
+    Py_INCREF(result);
+
+done:
+    Py_XDECREF(zero);
+    Py_XDECREF(one);
+    Py_XDECREF(minus_one);
+    Py_XDECREF(new_pair);
+    Py_XDECREF(iter);
+    return result;
+}
+
+static PyMethodDef methods[] = {
+    {"apply_merges", accel_apply_merges, METH_VARARGS,
+     "apply_merges(orig, bpe_codes, version): same as apply_bpe.apply_merges"},
+    {"replace_pair", accel_replace_pair, METH_VARARGS,
+     "replace_pair(pair, vocab, indices): same as learn_bpe.replace_pair (indices is a pair_index.PairIndex)"},
+    {"update_pair_statistics", accel_update_pair_statistics, METH_VARARGS,
+     "update_pair_statistics(pair, changed, stats, indices): same as learn_bpe.update_pair_statistics"},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef module = {
+    PyModuleDef_HEAD_INIT, "_bpe_accel", "compiled BPE kernels", -1, methods
+};
+
+PyMODINIT_FUNC
+PyInit__bpe_accel(void)
+{
+    endword = PyUnicode_FromString("</w>");
+    empty = PyUnicode_FromString("");
+    version01 = Py_BuildValue("(ii)", 0, 1);
+    version02 = Py_BuildValue("(ii)", 0, 2);
+    str_add = PyUnicode_InternFromString("add");
+    str_words = PyUnicode_InternFromString("words");
+    str_reset = PyUnicode_InternFromString("reset");
+    if (endword == NULL || empty == NULL || version01 == NULL || version02 == NULL ||
+        str_add == NULL || str_words == NULL || str_reset == NULL)
+        return NULL;
+    return PyModule_Create(&module);
+}
@@ -15,17 +15,14 @@ from __future__ import unicode_literals, division
 
 import sys
 import codecs
-import argparse
-import json
-import re
+import os
 from collections import defaultdict
 
 # hack for python2/3 compatibility
 from io import open
-argparse.open = open
 
 def unicodeutf8(s):
-    return unicode(s, 'utf8') if type(s)==str else s
+    return s.decode('utf8') if isinstance(s, bytes) else s
 
 def common_parser_arguments(parser):
     parser.add_argument('--unkchar', type=unicodeutf8,
@@ -80,25 +77,158 @@ def maybe_header_version(line):
         return None
 
 
-class BPE(object):
+class SubwordCache(object):
+    """Word -> segmentation cache (used like a dict by encode) that stores each
+    segmentation as subword ids into a shared table of distinct subwords.
 
-    def __init__(self, codes, separator='@@', vocab=None, glossaries=None, rglossaries=None, unkchar=u'\uFDEA', unktag='<unk>'):
+    A one-segment word stores the subword's id itself (the int object held by
+    the table's index, so no allocation), others a tuple of ids; the subword
+    strings are stored only once however many words contain them.
 
-        # check version information
-        firstline = codes.readline()
-        self.version = maybe_header_version(firstline)
-        if self.version is None:
-            log("no version header in %s"%codes)
-            self.version = (0, 1)
-            codes.seek(0)
-        log("version %s"%str(self.version))
+    outputs is BPE's table of whole (whitespace-free) words -> final output
+    (pieces with separators, joined by spaces), in front of glossary isolation
+    and this cache; it holds for the BPE settings in state (see BPE.word_outputs).
 
-        self.bpe_codes = [tuple(item.split()) for item in codes]
+    With max_words, the cache is emptied whenever its words (or outputs) would
+    exceed that many, so its memory stays bounded however many distinct words
+    are seen. Not thread-safe: share a BPE object between threads only under a lock.
+    """
 
-        # some hacking to deal with duplicates (only consider first instance)
-        self.bpe_codes = dict([(code,i) for (i,code) in reversed(list(enumerate(self.bpe_codes)))])
+    def __init__(self, max_words=None):
+        self.max_words = max_words
+        self.ids = {}
+        self.subwords = []
+        self.words = {}
+        self.outputs = {}
+        self.state = None
+        # number of times emptied
+        self.clears = 0
+        self.hits = 0
+        self.misses = 0
+
+    def intern(self, subword):
+        try:
+            return self.ids[subword]
+        except KeyError:
+            i = self.ids[subword] = len(self.subwords)
+            self.subwords.append(subword)
+            return i
+
+    def __setitem__(self, word, segments):
+        if self.max_words is not None and len(self.words) >= self.max_words:
+            self.clear()
+        if len(segments) == 1:
+            self.words[word] = self.intern(segments[0])
+        else:
+            self.words[word] = tuple([self.intern(x) for x in segments])
+
+    def get(self, word, default=None):
+        ids = self.words.get(word)
+        if ids is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        subwords = self.subwords
+        if ids.__class__ is tuple:
+            return [subwords[i] for i in ids]
+        return [subwords[ids]]
+
+    def __getitem__(self, word):
+        segments = self.get(word)
+        if segments is None:
+            raise KeyError(word)
+        return segments
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def __len__(self):
+        return len(self.words)
+
+    def clear(self):
+        self.ids.clear()
+        del self.subwords[:]
+        self.words.clear()
+        self.clear_outputs()
+
+    def clear_outputs(self):
+        """empty outputs (only); every emptying of the cache is counted in clears"""
+        self.outputs.clear()
+        self.clears += 1
+
+
+class MergeDAG(object):
+    """Dependency DAG over merged symbols, for computing which merges a vocabulary needs.
+
+    Symbols are the merge results (keys of bpe_codes_reverse), numbered by the
+    rank of the merge producing them; children[i] are the ids of symbol i's two
+    parts that are themselves merged symbols. A subset query is an iterative
+    traversal from the symbols whose written form is in the vocabulary, so it is
+    linear in the size of the DAG and has no recursion depth limit.
+    """
 
-        self.bpe_codes_reverse = dict([(pair[0] + pair[1], pair) for pair,i in self.bpe_codes.items()])
+    def __init__(self, bpe_codes, bpe_codes_reverse, separator='@@'):
+        by_rank = sorted(bpe_codes_reverse.items(), key=lambda x: bpe_codes[x[1]])
+        self.symbols = [ab for ab, _ in by_rank]
+        self.ids = dict((ab, i) for i, ab in enumerate(self.symbols))
+        ids = self.ids
+        self.children = [tuple(ids[x] for x in pair if x in ids) for _, pair in by_rank]
+        # written form -> symbol ids (more than one only with an empty separator)
+        self.written = defaultdict(list)
+        for i, ab in enumerate(self.symbols):
+            self.written[written(ab, separator)].append(i)
+        # every merge in rank order, with the id of the symbol it produces (several merges may produce the same symbol)
+        self.ordered = [(pair, ids[pair[0] + pair[1]]) for pair, _ in sorted(bpe_codes.items(), key=lambda x: x[1])]
+
+    def roots(self, vocab):
+        """ids of merged symbols whose written form is in vocab"""
+        w = self.written
+        if len(vocab) < len(w):
+            return [i for x in vocab if x in w for i in w[x]]
+        return [i for x, ids in w.items() if x in vocab for i in ids]
+
+    def closure(self, roots):
+        """ids of roots and everything they are (transitively) merged from"""
+        needed = bytearray(len(self.symbols))
+        children = self.children
+        stack = list(roots)
+        result = []
+        while stack:
+            i = stack.pop()
+            if not needed[i]:
+                needed[i] = 1
+                result.append(i)
+                stack.extend(children[i])
+        return result
+
+    def needed(self, vocab):
+        needed = bytearray(len(self.symbols))
+        for i in self.closure(self.roots(vocab)):
+            needed[i] = 1
+        return needed
+
+    def subset(self, vocab):
+        """merges (in rank order) needed to produce vocab"""
+        needed = self.needed(vocab)
+        return [pair for pair, i in self.ordered if needed[i]]
+
+    def subsets(self, vocabs):
+        return [self.subset(vocab) for vocab in vocabs]
+
+
+class BPE(object):
+
+    def __init__(self, codes, separator='@@', vocab=None, glossaries=None, rglossaries=None, unkchar=u'\uFDEA', unktag='<unk>',
+                 max_cache_words=None):
+        """codes is a codes file, or another BPE object whose (read-only) codes tables are shared.
+        max_cache_words bounds the word cache (see SubwordCache)"""
+
+        if isinstance(codes, BPE):
+            self.version = codes.version
+            self.bpe_codes = codes.bpe_codes
+            self.bpe_codes_reverse = codes.bpe_codes_reverse
+        else:
+            self.read_codes(codes)
 
         self.separator = separator
 
@@ -107,56 +237,119 @@ class BPE(object):
         self.unktag = unktag
         self.unkchar = unkchar
 
+        self.set_glossaries(glossaries, rglossaries)
+
+        self.cache = SubwordCache(max_cache_words)
+        load_kernels()
+        self.dag = None
+
+    def set_glossaries(self, glossaries=None, rglossaries=None):
+        """use these glossaries (strings) and rglossaries (regexes) from now on"""
         self.glossaries = glossaries if glossaries else []
         self.rglossaries = rglossaries if rglossaries else []
-        relist = [re.escape(x) for x in self.glossaries] + self.rglossaries
-        if len(relist):
-            retext = '(%s)' % '|'.join(relist)
+        if self.glossaries or self.rglossaries:
+            import re
+            retext = '(%s)' % '|'.join([re.escape(x) for x in self.glossaries] + self.rglossaries)
             sys.stderr.write('glossaries re: %s\n' % retext)
             self.glossary_re = re.compile(retext)
         else:
             self.glossary_re = None
 
-        self.cache = {}
+    def read_codes(self, codes):
+        # check version information
+        firstline = codes.readline()
+        self.version = maybe_header_version(firstline)
+        if self.version is None:
+            log("no version header in %s"%codes)
+            self.version = (0, 1)
+            codes.seek(0)
+        log("version %s"%str(self.version))
+
+        self.bpe_codes = [tuple(item.split()) for item in codes]
+
+        # some hacking to deal with duplicates (only consider first instance)
+        self.bpe_codes = dict([(code,i) for (i,code) in reversed(list(enumerate(self.bpe_codes)))])
+
+        self.bpe_codes_reverse = dict([(pair[0] + pair[1], pair) for pair,i in self.bpe_codes.items()])
 
     def ordered_codes(self):
         return sorted(self.bpe_codes.items(), key=lambda x: x[1])
 
+    def merge_dag(self):
+        if self.dag is None:
+            self.dag = MergeDAG(self.bpe_codes, self.bpe_codes_reverse, self.separator)
+        return self.dag
+
     def prereqs(self, vocab, seen=None):
+        """merged symbols needed (directly, or as part of a longer merged symbol) to produce vocab"""
         if seen is None: seen=set()
-        def prereqs2(s, pair):
-            seen.add(s)
-            prereqs(pair[0])
-            prereqs(pair[1])
-        def prereqs(s):
-            if len(s) > 1 and s not in seen:
-                seen.add(s)
-                pair = self.bpe_codes_reverse.get(s, None)
-                if pair is not None:
-                    prereqs2(s, pair)
-        for ab, pair in self.bpe_codes_reverse.items():
-            if written(ab, self.separator) in vocab:
-                prereqs2(ab, pair)
+        dag = self.merge_dag()
+        seen.update(dag.symbols[x] for x in dag.closure(dag.roots(vocab)))
         return seen
 
     def write_subset(self, out, bpevocab, pre=None):
         """only include merges that are useful to reach vocab"""
         write_header(out, self.version)
-        if pre is None: pre = self.prereqs(bpevocab)
+        if pre is None:
+            for pair in self.merge_dag().subset(bpevocab):
+                write_pair(pair, out)
+            return
         for pair,_ in self.ordered_codes():
             ab = pair[0] + pair[1]
             if written(ab, self.separator) in bpevocab or ab in pre:
                 write_pair(pair, out)
 
+    def write_subsets(self, outs, bpevocabs):
+        """write_subset for each (out, bpevocab); the merge DAG is built once for all of them"""
+        for out, pairs in zip(outs, self.merge_dag().subsets(bpevocabs)):
+            write_header(out, self.version)
+            for pair in pairs:
+                write_pair(pair, out)
+
+    def word_outputs(self):
+        """the cache's word -> output table, emptied first if the glossaries (see set_glossaries),
+        separator, vocabulary, unknown character handling or codes tables were replaced since
+        it was filled"""
+        cache = self.cache
+        state = (self.glossary_re, self.separator, self.vocab, self.unkchar, self.unktag, self.bpe_codes)
+        if cache.state is None or any(a is not b for a, b in zip(cache.state, state)):
+            if cache.outputs:
+                cache.clear_outputs()
+            cache.state = state
+        return cache.outputs
+
     def segment(self, sentence):
         """segment single sentence (whitespace-tokenized string) with BPE encoding"""
+        outputs = self.word_outputs()
         output = []
+        hits = 0
         for word in sentence.split():
-            self.pieces(word, output)
+            s = outputs.get(word)
+            if s is None:
+                pieces = self.encode_word(word, outputs)
+                if pieces:
+                    output.append(' '.join(pieces))
+            else:
+                hits += 1
+                # (may be empty: e.g. the word '</w>' can merge into nothing)
+                output.append(s)
+        self.cache.hits += hits
         return ' '.join(output)
 
     def pieces(self, word, output=None):
         if output is None: output = []
+        outputs = self.word_outputs()
+        s = outputs.get(word)
+        if s is None:
+            output += self.encode_word(word, outputs)
+        else:
+            self.cache.hits += 1
+            output += s.split(' ')
+        return output
+
+    def encode_word(self, word, outputs):
+        """the output pieces of word (with separators), also stored in outputs if
+        joining them by spaces can be undone"""
         new_word = []
         isolated = False
         for segment in self._isolate_glossaries(word):
@@ -175,14 +368,43 @@ class BPE(object):
                                           unkchar=self.unkchar,
                                           unktag=self.unktag)
             isolated = not isolated
+        output = []
         remain = len(new_word)
         sep = self.separator
         for item in new_word:
             remain -= 1
             if remain == 0: sep = ''
             output.append(item + sep)
+        s = ' '.join(output)
+        if s.count(' ') == len(output) - 1:
+            max_words = self.cache.max_words
+            if max_words is not None and len(outputs) >= max_words:
+                self.cache.clear_outputs()
+            outputs[word] = s
         return output
 
+    def cache_words(self, words):
+        """Encode the (not yet cached) words of the list words together, with apply_merges_batch,
+        so that segmenting them finds them cached. Only without the compiled kernels, which
+        encode single words faster."""
+        if accel is not None:
+            return
+        cache = self.cache
+        outputs = self.word_outputs()
+        missing = {}
+        for word in words:
+            if word in outputs:
+                continue
+            isolated = False
+            for segment in self._isolate_glossaries(word):
+                if len(segment) and not isolated and segment not in cache:
+                    missing[segment] = True
+                isolated = not isolated
+        if missing:
+            cache.misses += len(missing)
+            encode_batch(list(missing), self.bpe_codes, self.bpe_codes_reverse, self.vocab, self.separator,
+                         self.version, cache, unkchar=self.unkchar, unktag=self.unktag)
+
     def _isolate_glossaries(self, word):
         """
         Isolate a glossary present inside a word.
@@ -196,7 +418,118 @@ class BPE(object):
         return [word] if gre is None else gre.split(word)
 
 
+class Dropout(object):
+    """BPE-dropout (Provilkov et al., 2020): stochastic segmentation for subword regularization.
+
+    At each merge step, every applicable merge is skipped with probability
+    dropout, and the lowest-ranked remaining one is applied. Symbols of a word
+    are (start, end) offsets, and the rank of merging adjacent symbols is memoized
+    per word type, so after the first sample of a word no strings are built or
+    looked up in the codes. dropout=0 gives the deterministic BPE segmentation.
+    """
+
+    def __init__(self, bpe, dropout=0.1, seed=None):
+        self.bpe = bpe
+        self.dropout = dropout
+        self.seed = seed
+        import random
+        self.random = random.Random(seed)
+        # word -> (number of symbols before merging, memo of (start, middle, end) -> merge rank or None)
+        self.words = {}
+
+    def symbol(self, orig, start, end):
+        n = len(orig)
+        if self.bpe.version == (0, 1):
+            return orig[start:min(end, n)] + (endword if end == n + 1 else '')
+        return orig[start:end] + (endword if end == n else '')
+
+    def sample(self, orig):
+        """one random segmentation of orig, as a list of (start, end) offsets"""
+        try:
+            n, memo = self.words[orig]
+        except KeyError:
+            n = len(orig) + 1 if self.bpe.version == (0, 1) else len(orig)
+            memo = {}
+            self.words[orig] = (n, memo)
+        bounds = list(range(n + 1))
+        bpe_codes = self.bpe.bpe_codes
+        dropout = self.dropout
+        rnd = self.random.random
+        while len(bounds) > 2:
+            pairs = []
+            for k in range(len(bounds) - 2):
+                key = (bounds[k], bounds[k+1], bounds[k+2])
+                try:
+                    rank = memo[key]
+                except KeyError:
+                    rank = memo[key] = bpe_codes.get((self.symbol(orig, key[0], key[1]), self.symbol(orig, key[1], key[2])))
+                if rank is not None and (not dropout or rnd() >= dropout):
+                    pairs.append((rank, k))
+            if not pairs:
+                break
+            best = min(pairs)[0]
+            # merge all non-overlapping occurrences of the best pair, left to right
+            new_bounds = []
+            i = 0
+            for rank, k in pairs:
+                if rank == best and k >= i:
+                    new_bounds.extend(bounds[i:k+1])
+                    i = k + 2
+            new_bounds.extend(bounds[i:])
+            bounds = new_bounds
+        return list(zip(bounds, bounds[1:]))
+
+    def encode(self, orig):
+        """like encode(orig, ...), but with a new random segmentation on every call"""
+        if len(orig) < 2 and self.bpe.version != (0, 1):
+            return orig
+        bpe = self.bpe
+        word = [self.symbol(orig, start, end) for start, end in self.sample(orig)]
+        # don't print end-of-word symbols
+        if word[-1] == endword:
+            word = word[:-1]
+        elif word[-1].endswith(endword):
+            word[-1] = word[-1].replace(endword, '')
+        if bpe.vocab:
+            word = check_vocab_and_split(word, bpe.bpe_codes_reverse, bpe.vocab, bpe.separator)
+        return [bpe.unktag if x == bpe.unkchar else x for x in word]
+
+    def pieces(self, word, output=None):
+        if output is None: output = []
+        new_word = []
+        isolated = False
+        for segment in self.bpe._isolate_glossaries(word):
+            if len(segment):
+                if isolated:
+                    new_word.append(segment)
+                else:
+                    new_word += self.encode(segment)
+            isolated = not isolated
+        sep = self.bpe.separator
+        output.extend(item + sep for item in new_word[:-1])
+        output.extend(new_word[-1:])
+        return output
+
+    def segment(self, sentence):
+        """segment single sentence (whitespace-tokenized string) with a random BPE-dropout segmentation"""
+        output = []
+        for word in sentence.split():
+            self.pieces(word, output)
+        return ' '.join(output)
+
+    def segment_epoch(self, sentences, epoch=None):
+        """segment a whole epoch of sentences. given an epoch number, the samples
+        depend only on (seed, epoch), so any epoch can be reproduced on its own"""
+        if epoch is not None:
+            self.random.seed('%s-%s' % (self.seed, epoch))
+        return [self.segment(sentence) for sentence in sentences]
+
+
 def create_parser():
+    import argparse
+    # hack for python2/3 compatibility
+    argparse.open = open
+
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter,
         description="learn BPE-based word segmentation")
@@ -208,8 +541,7 @@ def create_parser():
         help="Input file (default: standard input).")
     parser.add_argument(
         '--codes', '-c', type=argparse.FileType('r'), metavar='PATH',
-        required=True,
-        help="File with BPE codes (created by learn_bpe.py).")
+        help="File with BPE codes (created by learn_bpe.py). Required, except with --read-types.")
     parser.add_argument(
         '--output', '-o', type=argparse.FileType('w'), default=sys.stdout,
         metavar='PATH',
@@ -222,6 +554,34 @@ def create_parser():
         '--vocabulary-threshold', type=int, default=1,
         metavar="INT",
         help="Vocabulary threshold. If vocabulary is provided, any word with frequency < threshold will be treated as OOV")
+    parser.add_argument(
+        '--dropout', type=float, default=0,
+        metavar="P",
+        help="BPE-dropout: skip each applicable merge with probability P, for a new random segmentation per occurrence (default: %(default)s)")
+    parser.add_argument(
+        '--seed', type=int, default=None,
+        help="random seed for --dropout")
+    parser.add_argument(
+        '--sweep-thresholds', type=int, nargs='+', default=None,
+        metavar="INT",
+        help="Segment once for all these vocabulary thresholds (requires --vocabulary and --output): "+
+             "output for threshold INT is written to OUTPUT.INT, and a table of token counts per threshold to OUTPUT (and stderr)")
+    parser.add_argument(
+        '--bytes', action='store_true',
+        help="read and write raw UTF-8 bytes, decoding each distinct word only once (faster; same output; python 3 only, not with --dropout or --sweep-thresholds)")
+    parser.add_argument(
+        '--write-types', type=argparse.FileType('wb'), default=None,
+        metavar="PATH",
+        help="First pass of type-first segmentation (python 3 only): segment each distinct word of the input once, "
+             "and write the table of their segmentations to PATH instead of any output")
+    parser.add_argument(
+        '--read-types', default=None,
+        metavar="PATH",
+        help="Second pass of type-first segmentation (python 3 only): segment the input with the --write-types table PATH "
+             "(words not in it are segmented with --codes, if given)")
+    parser.add_argument(
+        '--num-workers', type=int, default=1,
+        help="Number of processes for --write-types. If -1, use multiprocessing.cpu_count() (default: %(default)s)")
     parser.add_argument(
         '--glossaries', type=str, nargs='+', default=None,
         metavar="STR",
@@ -250,13 +610,12 @@ def get_pairs(word):
     return pairs
 
 
-def encode(orig, bpe_codes, bpe_codes_reverse, vocab, separator, version, cache, unkchar=u'\uFDEA', unktag='<unk>'):
-    """Encode word based on list of BPE merge operations, which are applied consecutively
-    """
-
-    if orig in cache:
-        return cache[orig]
+def apply_merges_py(orig, bpe_codes, version):
+    """Apply BPE merge operations to word orig, in order of their rank.
 
+    Returns the tuple of resulting segments without end-of-word symbols, or None
+    if orig has fewer than two symbols (so there is nothing to merge).
+    """
     if version == (0, 1):
         word = tuple(orig) + (endword,)
     elif version == (0, 2): # more consistent handling of word-final segments
@@ -267,7 +626,7 @@ def encode(orig, bpe_codes, bpe_codes_reverse, vocab, separator, version, cache,
     pairs = get_pairs(word)
 
     if not pairs:
-        return orig
+        return None
 
     while True:
         bigram = min(pairs, key = lambda pair: bpe_codes.get(pair, float('inf')))
@@ -304,19 +663,172 @@ def encode(orig, bpe_codes, bpe_codes_reverse, vocab, separator, version, cache,
         word = word[:-1]
     elif word[-1].endswith(endword):
         word = word[:-1] + (word[-1].replace(endword,''),)
+    return word
+
+
+def apply_merges_batch(origs, bpe_codes, version):
+    """[apply_merges(orig, bpe_codes, version) for orig in origs], computed for all words together.
+
+    Instead of searching each word for its lowest-ranked pair after every merge,
+    a heap holds the ranks of the pairs that occur in any word, with the words
+    each occurs in: the lowest-ranked pair is merged in all its words at once,
+    and only the pairs next to the merged symbols are added. Each word still
+    sees its merges in order of rank, so results are identical.
+    """
+    import heapq
+    if version == (0, 1):
+        words = [list(orig) + [endword] for orig in origs]
+    elif version == (0, 2):
+        words = [list(orig[:-1]) + [orig[-1] + endword] if orig else [] for orig in origs]
+    else:
+        raise NotImplementedError
+
+    # (words without pairs are returned as None)
+    single = [len(word) < 2 for word in words]
+
+    # pair -> ids of the words it (may still) occur in (a word may be listed more than once)
+    where = {}
+    heap = []
+    rank_of = bpe_codes.get
+    for k, word in enumerate(words):
+        for pair in zip(word, word[1:]):
+            rank = rank_of(pair)
+            if rank is not None:
+                if pair in where:
+                    where[pair].append(k)
+                else:
+                    where[pair] = [k]
+                    heap.append((rank, pair))
+    heapq.heapify(heap)
+    push = heapq.heappush
+    pop = heapq.heappop
+
+    while heap:
+        rank, pair = pop(heap)
+        ks = where.pop(pair, None)
+        if ks is None:
+            continue
+        first, second = pair
+        merged = first + second
+        for k in ks:
+            word = words[k]
+            n = len(word)
+            new_word = []
+            created = []
+            i = 0
+            while i < n:
+                if i < n - 1 and word[i] == first and word[i+1] == second:
+                    created.append(len(new_word))
+                    new_word.append(merged)
+                    i += 2
+                else:
+                    new_word.append(word[i])
+                    i += 1
+            if not created:
+                continue
+            words[k] = new_word
+            last = len(new_word) - 1
+            for i in created:
+                if i:
+                    new_pair = (new_word[i-1], merged)
+                    new_rank = rank_of(new_pair)
+                    if new_rank is not None:
+                        if new_pair in where:
+                            where[new_pair].append(k)
+                        else:
+                            where[new_pair] = [k]
+                            push(heap, (new_rank, new_pair))
+                if i < last:
+                    new_pair = (merged, new_word[i+1])
+                    new_rank = rank_of(new_pair)
+                    if new_rank is not None:
+                        if new_pair in where:
+                            where[new_pair].append(k)
+                        else:
+                            where[new_pair] = [k]
+                            push(heap, (new_rank, new_pair))
+
+    results = []
+    for word, nothing in zip(words, single):
+        if nothing:
+            results.append(None)
+            continue
+        if word[-1] == endword:
+            word = word[:-1]
+        elif word[-1].endswith(endword):
+            word = word[:-1] + [word[-1].replace(endword, '')]
+        results.append(tuple(word))
+    return results
+
+
+def load_accel():
+    """the compiled kernels (python setup.py build_ext --inplace), unless unavailable or $SUBWORD_NMT_NO_ACCEL is set"""
+    if os.environ.get('SUBWORD_NMT_NO_ACCEL'):
+        return None
+    try:
+        import _bpe_accel
+        return _bpe_accel
+    except ImportError:
+        return None
+
+# the compiled kernels module (None without it) and the apply_merges used: set by
+# load_kernels() on first use (unless set before), so importing this module does not
+# load _bpe_accel
+accel = None
+apply_merges = None
 
-    if vocab:
-        word = check_vocab_and_split(word, bpe_codes_reverse, vocab, separator)
 
-    word = [unktag if x == unkchar else x for x in word]
+def load_kernels():
+    global accel, apply_merges
+    if apply_merges is None:
+        accel = load_accel()
+        apply_merges = accel.apply_merges if accel else apply_merges_py
+
+
+def encode(orig, bpe_codes, bpe_codes_reverse, vocab, separator, version, cache, unkchar=u'\uFDEA', unktag='<unk>'):
+    """Encode word based on list of BPE merge operations, which are applied consecutively
+    """
+
+    cached = cache.get(orig)
+    if cached is not None:
+        return cached
+
+    if apply_merges is None:
+        load_kernels()
+    word = apply_merges(orig, bpe_codes, version)
+    if word is None:
+        return orig
+
+    word = final_segments(word, bpe_codes_reverse, vocab, separator, unkchar, unktag)
     cache[orig] = word
     return word
 
 
+def encode_batch(origs, bpe_codes, bpe_codes_reverse, vocab, separator, version, cache, unkchar=u'\uFDEA', unktag='<unk>'):
+    """encode each of origs (distinct, not in cache) into cache, merging all of them together (see apply_merges_batch)"""
+    for orig, word in zip(origs, apply_merges_batch(origs, bpe_codes, version)):
+        if word is not None:
+            cache[orig] = final_segments(word, bpe_codes_reverse, vocab, separator, unkchar, unktag)
+
+
+def final_segments(word, bpe_codes_reverse, vocab, separator, unkchar, unktag):
+    """the segments of encode for the merged word (apply_merges result)"""
+    if vocab:
+        word = check_vocab_and_split(word, bpe_codes_reverse, vocab, separator)
+
+    return [unktag if x == unkchar else x for x in word]
+
+
 def recursive_split(segment, bpe_codes, vocab, separator, final=False):
     """Recursively split segment into smaller units (by reversing BPE merges)
     until all units are either in-vocabulary, or cannot be split futher."""
 
+    if not segment:
+        # (the right part of a final merge with '</w>'; looking up '' + '</w>' can find a merge
+        # of '</w>' itself, from words containing '</w>', and recurse forever)
+        yield segment
+        return
+
     try:
         if final:
             left, right = bpe_codes[segment + endword]
@@ -379,6 +891,209 @@ def read_vocabulary_set(vocab_file, threshold=1):
 
     return vocabulary
 
+
+def read_vocabulary_counts(vocab_file):
+    """read vocabulary file produced by get_vocab.py into a dict of word -> frequency
+    (the highest, for a word listed more than once, as read_vocabulary_set would keep it)
+    """
+
+    counts = {}
+
+    for line in vocab_file:
+        word, freq = line.split()
+        counts[word] = max(int(freq), counts.get(word, 0))
+
+    return counts
+
+
+class AtLeast(object):
+    """the set of words with count >= threshold, as a view of counts (so no per-threshold copy)"""
+
+    def __init__(self, counts, threshold):
+        self.counts = counts
+        self.threshold = threshold
+
+    def __contains__(self, word):
+        return self.counts.get(word, 0) >= self.threshold
+
+
+class ThresholdSweep(object):
+    """Segment with several --vocabulary-threshold values at once.
+
+    Merges are applied to each word type only once. A word's segments are then
+    split further only for thresholds above the lowest vocabulary count among
+    its segments; below that, every threshold shares the unsplit segmentation.
+    Output per threshold is identical to apply_bpe.py --vocabulary-threshold.
+    """
+
+    def __init__(self, bpe, counts, thresholds):
+        self.bpe = bpe
+        self.counts = counts
+        self.thresholds = list(thresholds)
+        maxcount = max(counts.values()) if counts else 0
+        # a threshold that leaves no vocabulary at all means no vocabulary filter (as in BPE)
+        self.vocabs = [AtLeast(counts, t) if t <= maxcount else None for t in self.thresholds]
+        self.cache = {}
+        self.tokens = [0] * len(self.thresholds)
+        self.types = [set() for _ in self.thresholds]
+
+    def encode_all(self, orig):
+        """encode(orig) for each threshold"""
+        if orig in self.cache:
+            return self.cache[orig]
+        bpe = self.bpe
+        if apply_merges is None:
+            load_kernels()
+        word = apply_merges(orig, bpe.bpe_codes, bpe.version)
+        if word is None:
+            return [orig] * len(self.thresholds)
+        sep = bpe.separator
+        counts = self.counts
+        minfreq = min([counts.get(x + sep, 0) for x in word[:-1]] + [counts.get(word[-1], 0)])
+        unkchar, unktag = bpe.unkchar, bpe.unktag
+        base = [unktag if x == unkchar else x for x in word]
+        result = []
+        for t, vocab in zip(self.thresholds, self.vocabs):
+            if vocab is None or t <= minfreq:
+                result.append(base)
+            else:
+                split = check_vocab_and_split(word, bpe.bpe_codes_reverse, vocab, sep)
+                result.append([unktag if x == unkchar else x for x in split])
+        self.cache[orig] = result
+        return result
+
+    def pieces_all(self, word, outputs):
+        """BPE.pieces(word) for each threshold, appended to outputs[i]"""
+        n = len(self.thresholds)
+        new_words = [[] for _ in range(n)]
+        isolated = False
+        for segment in self.bpe._isolate_glossaries(word):
+            if len(segment):
+                if isolated:
+                    for new_word in new_words:
+                        new_word.append(segment)
+                else:
+                    for new_word, pieces in zip(new_words, self.encode_all(segment)):
+                        new_word += pieces
+            isolated = not isolated
+        sep = self.bpe.separator
+        for new_word, output in zip(new_words, outputs):
+            output.extend(item + sep for item in new_word[:-1])
+            output.extend(new_word[-1:])
+        return outputs
+
+    def segment_all(self, sentence):
+        """BPE.segment(sentence) for each threshold; also updates the token statistics"""
+        outputs = [[] for _ in self.thresholds]
+        for word in sentence.split():
+            self.pieces_all(word, outputs)
+        for i, output in enumerate(outputs):
+            self.tokens[i] += len(output)
+            self.types[i].update(output)
+        return [' '.join(output) for output in outputs]
+
+    def write_stats(self, out, words):
+        out.write('threshold\ttokens\ttypes\ttokens/word\n')
+        for t, tokens, types in zip(self.thresholds, self.tokens, self.types):
+            out.write('%s\t%s\t%s\t%.4f\n' % (t, tokens, len(types), tokens / words if words else 0))
+
+
+
+# line breaks of str.splitlines (so of the codecs readers) other than \n (compiled on first use)
+other_breaks = None
+
+
+def line_blocks(infile, block_size=1 << 20):
+    """read binary file infile in blocks of complete lines (each without its final newline)"""
+    rest = b''
+    while True:
+        block = infile.read(block_size)
+        if not block:
+            break
+        cut = block.rfind(b'\n')
+        if cut < 0:
+            rest += block
+            continue
+        yield rest + block[:cut]
+        rest = block[cut+1:]
+    if rest:
+        yield rest
+
+
+def block_lines(block):
+    """the lines of a line_blocks block, as the text path would read them"""
+    global other_breaks
+    if other_breaks is None:
+        import re
+        # \r, \v, \f, \x1c-\x1e, U+0085, U+2028, U+2029 in UTF-8
+        other_breaks = re.compile(b'[\r\x0b\x0c\x1c-\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]')
+    if other_breaks.search(block) is None:
+        return block.split(b'\n')
+    return [line.encode('utf-8') for line in block.decode('utf-8').splitlines()]
+
+
+class ByteSegmenter(object):
+    """Apply a BPE object to UTF-8 bytes, without decoding words seen before.
+
+    Input is read in blocks and split into lines and words on the raw bytes;
+    each distinct word is decoded, segmented and encoded once, and its output
+    bytes are cached by its bytes. Output for a block is written with one
+    writelines. Output is identical to BPE.segment per line. (Python 3 only.)
+
+    words may be a table of segmentations (see type_table.py); with bpe None,
+    only words in it can be segmented.
+
+    Without the compiled kernels, the new words of a block are encoded
+    together (BPE.cache_words), as long as blocks have many new words.
+    """
+
+    def __init__(self, bpe, block_size=1 << 20, words=None):
+        self.bpe = bpe
+        self.block_size = block_size
+        self.words = {} if words is None else words
+        # of the words of the last block, the fraction not seen before
+        self.new_words = 1.0
+
+    def word(self, word):
+        """segmentation of bytes word, as bytes (may be empty, e.g. if word is only non-ASCII whitespace)"""
+        try:
+            return self.words[word]
+        except KeyError:
+            if self.bpe is None:
+                raise KeyError('word %r is not in the segmentation table' % word.decode('utf-8', 'replace'))
+            # str.split also splits on non-ASCII whitespace, so word may be several words
+            segmented = self.words[word] = self.bpe.segment(word.decode('utf-8')).encode('utf-8')
+            return segmented
+
+    def segment_lines(self, lines, parts):
+        words = self.words
+        if accel is None and self.bpe is not None and self.new_words >= 0.01:
+            new = set(word for line in lines for word in line.split() if word not in words)
+            self.bpe.cache_words([w for word in new for w in word.decode('utf-8').split()])
+        total = misses = 0
+        for line in lines:
+            segmented = []
+            for word in line.split():
+                total += 1
+                s = words.get(word)
+                if s is None:
+                    misses += 1
+                    s = self.word(word)
+                # (an empty segmentation is output as BPE.segment does, unless word is only whitespace)
+                if s or word.decode('utf-8').split():
+                    segmented.append(s)
+            parts.append(b' '.join(segmented))
+            parts.append(b'\n')
+        if total:
+            self.new_words = float(misses) / total
+
+    def segment_file(self, infile, out):
+        """segment binary file infile to binary file out"""
+        for block in line_blocks(infile, self.block_size):
+            parts = []
+            self.segment_lines(block_lines(block), parts)
+            out.writelines(parts)
+
 if __name__ == '__main__':
     # python 2/3 compatibility
     if sys.version_info < (3, 0):
@@ -393,9 +1108,12 @@ if __name__ == '__main__':
     parser = create_parser()
     args = parser.parse_args()
     verbose = args.verbose
+    if args.codes is None and args.read_types is None:
+        parser.error('argument --codes/-c is required')
 
     # read/write files as UTF-8
-    args.codes = codecs.open(args.codes.name, encoding='utf-8')
+    if args.codes is not None:
+        args.codes = codecs.open(args.codes.name, encoding='utf-8')
     if args.input.name != '<stdin>':
         args.input = codecs.open(args.input.name, encoding='utf-8')
     if args.output.name != '<stdout>':
@@ -403,12 +1121,65 @@ if __name__ == '__main__':
     if args.vocabulary:
         args.vocabulary = codecs.open(args.vocabulary.name, encoding='utf-8')
 
+    if args.sweep_thresholds:
+        if not args.vocabulary or args.output.name == '<stdout>':
+            sys.stderr.write('Error: --sweep-thresholds requires --vocabulary and --output\n')
+            sys.exit(1)
+        bpe = BPE(args.codes, args.separator, None, args.glossaries, args.rglossaries, unkchar=args.unkchar, unktag=args.unktag)
+        sweep = ThresholdSweep(bpe, read_vocabulary_counts(args.vocabulary), args.sweep_thresholds)
+        outputs = [codecs.open('%s.%s' % (args.output.name, t), 'w', encoding='utf-8') for t in sweep.thresholds]
+        words = 0
+        for line in args.input:
+            words += len(line.split())
+            for out, segmented in zip(outputs, sweep.segment_all(line)):
+                out.write(segmented.strip())
+                out.write('\n')
+        for out in outputs:
+            out.close()
+        # (argparse has opened OUTPUT already; it gets the table rather than being left empty)
+        sweep.write_stats(args.output, words)
+        args.output.close()
+        sweep.write_stats(sys.stderr, words)
+        sys.exit(0)
+
     if args.vocabulary:
         vocabulary = read_vocabulary_set(args.vocabulary, args.vocabulary_threshold)
     else:
         vocabulary = None
 
-    bpe = BPE(args.codes, args.separator, vocabulary, args.glossaries, args.rglossaries, unkchar=args.unkchar, unktag=args.unktag)
+    bpe = None
+    if args.codes is not None:
+        bpe = BPE(args.codes, args.separator, vocabulary, args.glossaries, args.rglossaries, unkchar=args.unkchar, unktag=args.unktag)
+
+    if args.write_types or args.read_types:
+        import type_table
+        if args.num_workers < 0:
+            from multiprocessing import cpu_count
+            args.num_workers = cpu_count()
+        if args.write_types:
+            n = type_table.first_pass(bpe, args.input.stream, args.write_types, args.num_workers)
+            args.write_types.close()
+            sys.stderr.write('wrote segmentations of %s types to %s\n' % (n, args.write_types.name))
+        else:
+            try:
+                type_table.second_pass(type_table.read_table(args.read_types), args.input.stream, args.output.stream, bpe)
+            except KeyError as e:
+                sys.stderr.write('Error: %s (give --codes to segment it)\n' % e.args[0])
+                sys.exit(1)
+            args.output.stream.flush()
+        sys.exit(0)
+
+    if args.dropout:
+        bpe = Dropout(bpe, args.dropout, args.seed)
+
+    if args.bytes:
+        if args.dropout:
+            sys.stderr.write('Error: --bytes cannot be used with --dropout\n')
+            sys.exit(1)
+        # the binary files under the codecs readers/writers
+        ByteSegmenter(bpe).segment_file(args.input.stream, args.output.stream)
+        args.output.stream.flush()
+        sys.exit(0)
 
     for line in args.input:
         args.output.write(bpe.segment(line).strip())
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Author: Jonathan Graehl
+
+"""Local content-addressed cache of learned BPE codes and vocabularies.
+
+An entry is a directory named by the sha1 of everything the artifact depends
+on (the word counts in their iteration order, and every learning option), so a
+hit is always identical to what relearning would write. When the cache grows
+past max_bytes, the least recently used entries are removed.
+"""
+
+from __future__ import unicode_literals
+
+import os
+import io
+import shutil
+import hashlib
+import tempfile
+
+# change when learning output changes, so older entries are not served
+CACHE_VERSION = 1
+
+
+def vocab_fingerprint(vocab):
+    """sha1 of (word, count) items in iteration order (ties in vocabulary files follow it)"""
+    h = hashlib.sha1()
+    items = list(vocab.items())
+    for i in range(0, len(items), 100000):
+        h.update(''.join('%s %s\n' % x for x in items[i:i+100000]).encode('utf-8'))
+    return h.hexdigest()
+
+
+def file_fingerprint(path):
+    if path is None:
+        return None
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def bpe_fingerprint(bpe):
+    """sha1 of everything that determines BPE.pieces output"""
+    h = hashlib.sha1()
+    for part in (bpe.version, bpe.separator, bpe.unkchar, bpe.unktag, bpe.glossaries, bpe.rglossaries):
+        h.update(('%r\n' % (part,)).encode('utf-8'))
+    for pair, _ in bpe.ordered_codes():
+        h.update(('%s %s\n' % pair).encode('utf-8'))
+    if bpe.vocab:
+        for word in sorted(bpe.vocab):
+            h.update(('%s\n' % word).encode('utf-8'))
+    return h.hexdigest()
+
+
+class ArtifactCache(object):
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, *parts):
+        h = hashlib.sha1(('%s\n' % CACHE_VERSION).encode('utf-8'))
+        for part in parts:
+            h.update(('%r\n' % (part,)).encode('utf-8'))
+        return h.hexdigest()
+
+    def path(self, key, name):
+        return os.path.join(self.directory, key, name)
+
+    def get(self, key, name):
+        """cached text of artifact name for key, or None"""
+        path = self.path(key, name)
+        try:
+            with io.open(path, encoding='utf-8') as f:
+                text = f.read()
+        except (IOError, OSError):
+            return None
+        # mark as recently used
+        os.utime(os.path.dirname(path), None)
+        return text
+
+    def put(self, key, name, text):
+        entry = os.path.join(self.directory, key)
+        if not os.path.isdir(entry):
+            try:
+                os.makedirs(entry)
+            except OSError:
+                pass
+        # write then rename, so concurrent jobs never see a partial artifact
+        fd, tmp = tempfile.mkstemp(dir=entry)
+        with io.open(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.rename(tmp, self.path(key, name))
+        self.evict(keep=key)
+
+    def entries(self):
+        """(last use, size, path) of each entry"""
+        result = []
+        for key in os.listdir(self.directory):
+            entry = os.path.join(self.directory, key)
+            if os.path.isdir(entry):
+                size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+                result.append((os.path.getmtime(entry), size, entry))
+        return result
+
+    def evict(self, keep=None):
+        """remove least recently used entries until the cache fits in max_bytes"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            if os.path.basename(entry) == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -0,0 +1,173 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Author: Jonathan Graehl
+
+"""BPE segmentation for asyncio services (Python 3.7+).
+
+AsyncBPE collects the segment requests made within a short window (or until
+max_batch sentences wait) into one batch. The words of a batch not segmented
+before are segmented in an executor, off the event loop: a thread (sharing the
+BPE object) by default, or with processes=N, a process pool each holding a copy
+of the BPE object. Segmentations are kept in one word cache in the event loop's
+process, so every executor benefits from words any of them segmented before,
+and output is identical to BPE.segment.
+
+The BPE object (and its cache) is not thread-safe, so with a thread executor
+of several workers its batches are segmented one at a time. AsyncBPE segments
+with its own copy of the BPE object (sharing the codes tables) and cache, so
+the caller's object is neither shared between threads nor changed. Both word
+caches are emptied when they reach max_words words.
+
+    bpe = AsyncBPE(apply_bpe.BPE(codes))
+    segmented = await bpe.asegment('a sentence')
+    bpe.metrics()['latency_p95']
+"""
+
+import asyncio
+import collections
+import copy
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+def segment_words(bpe, words):
+    """segmentation of each of words, as in BPE.segment"""
+    bpe.cache_words(words)
+    return [' '.join(bpe.pieces(word)) for word in words]
+
+
+def segment_words_locked(lock, bpe, words):
+    with lock:
+        return segment_words(bpe, words)
+
+
+# BPE object of an executor process (set by the pool initializer)
+worker_bpe = None
+
+
+def init_worker(bpe):
+    global worker_bpe
+    worker_bpe = bpe
+
+
+def segment_words_job(words):
+    return segment_words(worker_bpe, words)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+class AsyncBPE(object):
+
+    def __init__(self, bpe, window=0.002, max_batch=256, processes=None, executor=None, history=1000,
+                 max_words=1 << 20):
+        """window: seconds a request waits for others to share its batch. executor: use this
+        (thread) executor instead of a private one. history: number of recent requests and
+        batches the latency and batch size metrics are computed over. max_words: bound on the
+        word caches (of AsyncBPE, and of its copy of bpe)"""
+        from apply_bpe import SubwordCache
+        bpe = copy.copy(bpe)
+        bpe.cache = SubwordCache(max_words)
+        self.bpe = bpe
+        self.window = window
+        self.max_batch = max_batch
+        self.max_words = max_words
+        self.owns_executor = executor is None
+        if processes:
+            self.executor = ProcessPoolExecutor(processes, initializer=init_worker, initargs=(bpe,))
+            self.segment_words = segment_words_job
+        else:
+            self.executor = executor or ThreadPoolExecutor(1)
+            self.segment_words = functools.partial(segment_words_locked, threading.Lock(), bpe)
+        self.words = {}
+        self.pending = []
+        self.timer = None
+        self.requests = 0
+        self.batches = 0
+        self.misses = 0
+        self.latencies = collections.deque(maxlen=history)
+        self.batch_sizes = collections.deque(maxlen=history)
+
+    async def asegment(self, sentence):
+        """BPE.segment(sentence), batched with other concurrent calls"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((sentence, future, time.monotonic()))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    async def asegment_many(self, sentences):
+        """[BPE.segment(s) for s in sentences]"""
+        return await asyncio.gather(*[self.asegment(s) for s in sentences])
+
+    def flush(self):
+        """start segmenting the waiting requests"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            asyncio.ensure_future(self.run_batch(batch))
+
+    async def run_batch(self, batch):
+        words = self.words
+        missing = list(set(w for sentence, _, _ in batch for w in sentence.split() if w not in words))
+        try:
+            if missing:
+                loop = asyncio.get_running_loop()
+                segmented = await loop.run_in_executor(self.executor, self.segment_words, missing)
+                if words is self.words and len(words) + len(missing) > self.max_words:
+                    # start a new cache with just this batch's words (batches still
+                    # being segmented keep the old one until they finish)
+                    kept = set(w for sentence, _, _ in batch for w in sentence.split())
+                    words = self.words = dict((w, words[w]) for w in kept if w in words)
+                words.update(zip(missing, segmented))
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        now = time.monotonic()
+        self.requests += len(batch)
+        self.batches += 1
+        self.misses += len(missing)
+        self.batch_sizes.append(len(batch))
+        for sentence, future, start in batch:
+            self.latencies.append(now - start)
+            if not future.done():
+                future.set_result(' '.join(words[w] for w in sentence.split()))
+
+    def metrics(self):
+        """totals, and latency (seconds from request to result) and batch size over the recent history"""
+        latencies = sorted(self.latencies)
+        sizes = self.batch_sizes
+        return dict(requests=self.requests,
+                    batches=self.batches,
+                    word_misses=self.misses,
+                    cached_words=len(self.words),
+                    pending=len(self.pending),
+                    batch_size_mean=float(sum(sizes)) / len(sizes) if sizes else 0.0,
+                    batch_size_max=max(sizes) if sizes else 0,
+                    latency_mean=sum(latencies) / len(latencies) if latencies else 0.0,
+                    latency_p50=percentile(latencies, 0.5),
+                    latency_p95=percentile(latencies, 0.95),
+                    latency_p99=percentile(latencies, 0.99),
+                    latency_max=latencies[-1] if latencies else 0.0)
+
+    def close(self):
+        if self.owns_executor:
+            self.executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
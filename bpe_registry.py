@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Author: Jonathan Graehl
+
+"""Serve many BPE models (e.g. one per language pair) from one process.
+
+Models are registered by name and loaded on first use. Models whose codes files
+have identical contents share one parsed copy of the codes tables. When the
+estimated memory of the loaded models exceeds the budget, the least recently
+used models other than the one being requested are unloaded (and reloaded on
+their next use). The estimate is kept up to date as the models' word caches
+grow, and checked against the budget on every get and segment.
+
+    registry = BPERegistry(memory_budget=2 << 30)
+    registry.register('en-de', 'codes.en-de', vocab='vocab.en-de.de', vocabulary_threshold=50)
+    registry.segment('en-de', 'a sentence')
+    registry.stats()['en-de']['hits']
+"""
+
+from __future__ import unicode_literals
+
+import io
+import sys
+import hashlib
+from itertools import islice
+
+from apply_bpe import BPE, read_vocabulary_set
+
+
+def table_bytes(bpe):
+    """estimated memory of a BPE object's codes tables (counting shared strings once)"""
+    seen = set()
+    total = 0
+    for obj in (bpe.bpe_codes, bpe.bpe_codes_reverse):
+        total += sys.getsizeof(obj)
+        for k, v in obj.items():
+            for x in (k, v) + (k if isinstance(k, tuple) else ()) + (v if isinstance(v, tuple) else ()):
+                if id(x) not in seen:
+                    seen.add(id(x))
+                    total += sys.getsizeof(x)
+    return total
+
+
+def cache_counts(cache):
+    """the state of a SubwordCache that entry_bytes can count on from"""
+    return (cache.clears, len(cache.words), len(cache.subwords), len(cache.outputs))
+
+
+def container_bytes(cache):
+    return sum(sys.getsizeof(x) for x in (cache.words, cache.ids, cache.subwords, cache.outputs))
+
+
+def entry_bytes(cache, since=None):
+    """estimated memory of the entries of a SubwordCache (added since it had cache_counts since)"""
+    if since is None:
+        since = (cache.clears, 0, 0, 0)
+    _, words, subwords, outputs = since
+    # keys are shared with the input text; values are mostly shared ints or short tuples
+    total = 40 * (len(cache.words) - words)
+    total += sum(sys.getsizeof(x) for x in cache.subwords[subwords:])
+    # (the keys of outputs are shared with the input text; new entries are the last ones)
+    new = len(cache.outputs) - outputs
+    if new:
+        try:
+            values = islice(reversed(cache.outputs.values()), new)
+        except TypeError:
+            # (python < 3.8: dict views are not reversible)
+            values = islice(cache.outputs.values(), outputs, None)
+        total += sum(sys.getsizeof(x) for x in values)
+    return total
+
+
+def cache_bytes(cache):
+    """estimated memory of a SubwordCache word cache"""
+    return container_bytes(cache) + entry_bytes(cache)
+
+
+class Model(object):
+
+    def __init__(self, name, codes, separator, vocab, vocabulary_threshold, glossaries, rglossaries, unkchar, unktag):
+        self.name = name
+        self.codes = codes
+        self.options = dict(separator=separator, glossaries=glossaries, rglossaries=rglossaries, unkchar=unkchar, unktag=unktag)
+        self.vocab = vocab
+        self.vocabulary_threshold = vocabulary_threshold
+        self.bpe = None
+        self.table = None
+        self.loads = 0
+        self.last_used = None
+        # memory estimate (see BPERegistry.track): total, of the vocabulary, of the cache entries
+        # counted when the cache had cache_counts counts
+        self.bytes = 0
+        self.vocab_bytes = 0
+        self.entry_bytes = 0
+        self.counts = None
+        # totals of the caches of earlier loads
+        self.hits = 0
+        self.misses = 0
+
+
+class BPERegistry(object):
+
+    def __init__(self, memory_budget=None):
+        self.memory_budget = memory_budget
+        self.models = {}
+        # codes content hash -> [BPE object owning the tables, number of loaded models using it, table bytes]
+        self.tables = {}
+        self.clock = 0
+        # memory estimate of the loaded models and codes tables
+        self.bytes = 0
+
+    def register(self, name, codes, separator='@@', vocab=None, vocabulary_threshold=1,
+                 glossaries=None, rglossaries=None, unkchar=u'﷪', unktag='<unk>'):
+        """codes and vocab are paths (as for apply_bpe.py -c and --vocabulary); nothing is read until first use"""
+        self.models[name] = Model(name, codes, separator, vocab, vocabulary_threshold, glossaries, rglossaries, unkchar, unktag)
+
+    def get(self, name):
+        """the loaded BPE object of model name"""
+        model = self.models[name]
+        self.clock += 1
+        model.last_used = self.clock
+        if model.bpe is None:
+            self.load(model)
+        else:
+            # (counts cache growth from using the BPE object directly)
+            self.track(model)
+        self.enforce_budget(keep=model)
+        return model.bpe
+
+    def segment(self, name, sentence):
+        result = self.get(name).segment(sentence)
+        model = self.models[name]
+        self.track(model)
+        self.enforce_budget(keep=model)
+        return result
+
+    def load(self, model):
+        with open(model.codes, 'rb') as f:
+            text = f.read()
+        key = hashlib.sha1(text).hexdigest()
+        if key not in self.tables:
+            owner = BPE(io.StringIO(text.decode('utf-8')))
+            self.tables[key] = [owner, 0, table_bytes(owner)]
+            self.bytes += self.tables[key][2]
+        table = self.tables[key]
+        table[1] += 1
+        vocab = None
+        if model.vocab is not None:
+            with io.open(model.vocab, encoding='utf-8') as f:
+                vocab = read_vocabulary_set(f, model.vocabulary_threshold)
+        model.bpe = BPE(table[0], vocab=vocab, **model.options)
+        model.table = key
+        model.loads += 1
+        model.vocab_bytes = sys.getsizeof(vocab) + sum(sys.getsizeof(x) for x in vocab) if vocab else 0
+        model.entry_bytes = 0
+        model.counts = None
+        self.track(model)
+
+    def track(self, model):
+        """update the memory estimate of (loaded) model, counting only the cache entries
+        added since its last update"""
+        cache = model.bpe.cache
+        counts = cache_counts(cache)
+        # (a table that shrank was emptied since, even if not counted in clears)
+        if model.counts is None or model.counts[0] != counts[0] or any(n < m for n, m in zip(counts[1:], model.counts[1:])):
+            model.entry_bytes = entry_bytes(cache)
+        else:
+            model.entry_bytes += entry_bytes(cache, model.counts)
+        model.counts = counts
+        size = model.vocab_bytes + container_bytes(cache) + model.entry_bytes
+        self.bytes += size - model.bytes
+        model.bytes = size
+
+    def unload(self, name):
+        model = self.models[name]
+        if model.bpe is None:
+            return
+        model.hits += model.bpe.cache.hits
+        model.misses += model.bpe.cache.misses
+        model.bpe = None
+        self.bytes -= model.bytes
+        model.bytes = 0
+        table = self.tables[model.table]
+        table[1] -= 1
+        if not table[1]:
+            self.bytes -= table[2]
+            del self.tables[model.table]
+        model.table = None
+
+    def model_bytes(self, model):
+        """estimated memory of a loaded model, not counting its (possibly shared) codes tables"""
+        if model.bpe is None:
+            return 0
+        self.track(model)
+        return model.bytes
+
+    def memory(self):
+        """estimated memory of all loaded models and codes tables (as of their last use)"""
+        return self.bytes
+
+    def enforce_budget(self, keep=None):
+        """unload least recently used models until memory() is within the budget"""
+        if self.memory_budget is None or self.bytes <= self.memory_budget:
+            return
+        loaded = sorted((m for m in self.models.values() if m.bpe is not None and m is not keep), key=lambda m: m.last_used)
+        for model in loaded:
+            if self.memory() <= self.memory_budget:
+                break
+            self.unload(model.name)
+
+    def stats(self):
+        """per model: loaded, number of loads, cache size, cache hits/misses (over all loads) and estimated bytes"""
+        result = {}
+        for name, model in self.models.items():
+            cache = model.bpe.cache if model.bpe is not None else None
+            result[name] = dict(loaded=cache is not None,
+                                loads=model.loads,
+                                cache_size=len(cache) if cache is not None else 0,
+                                hits=model.hits + (cache.hits if cache is not None else 0),
+                                misses=model.misses + (cache.misses if cache is not None else 0),
+                                bytes=self.model_bytes(model),
+                                shared_codes=model.table is not None and self.tables[model.table][1] > 1)
+        return result
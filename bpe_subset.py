@@ -13,27 +13,28 @@ Rico Sennrich, Barry Haddow and Alexandra Birch (2016). Neural Machine Translati
 Proceedings of the 54th Annual Meeting of the Association for Computational Linguistics (ACL 2016). Berlin, Germany.
 """
 
-import argparse
 import sys
 import codecs
 import learn_bpe
 import apply_bpe
-from collections import Counter
 
 # hack for python2/3 compatibility
 from io import open
-argparse.open = open
 
 def create_parser():
+    import argparse
+    # hack for python2/3 compatibility
+    argparse.open = open
+
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter,
         description="create BPE-segmented vocabulary subset")
 
     apply_bpe.common_parser_arguments(parser)
     parser.add_argument(
-        '--input', '-i', type=argparse.FileType('r'), default=sys.stdin,
+        '--input', '-i', type=argparse.FileType('r'), default=[sys.stdin], nargs='+',
         metavar='PATH',
-        help="running or vocab text input file (default: standard input).")
+        help="running or vocab text input files, e.g. one per language (default: standard input).")
     parser.add_argument(
         '--input-is-vocab', '-V', type=bool, dest='dict_input', default=True)
     parser.add_argument(
@@ -43,17 +44,22 @@ def create_parser():
     parser.add_argument(
         '--min-count,', '-m', type=int, dest='mincount', default=1, help="drop from pre-bpe vocab any word with count below this")
     parser.add_argument(
-        '--outcodes', '-o', type=argparse.FileType('w'), metavar='PATH', help="output vocabulary restricted bpe codes subset to this file")
-    parser.add_argument('--bpevocab', '-b', type=argparse.FileType('w'), metavar='PATH', help="output bpe vocab (default: standard output")
+        '--outcodes', '-o', type=argparse.FileType('w'), nargs='+', metavar='PATH', help="output vocabulary restricted bpe codes subset to these files (one per input)")
+    parser.add_argument('--bpevocab', '-b', type=argparse.FileType('w'), nargs='+', metavar='PATH', help="output bpe vocab to these files (one per input)")
     return parser
 
 def main(args):
-    vocab = learn_bpe.get_vocabulary(args.input, args.dict_input, args.mincount)
-    assert isinstance(vocab, Counter)
+    for outs in (args.outcodes, args.bpevocab):
+        if outs is not None and len(outs) != len(args.input):
+            sys.stderr.write('Error: number of input files and --outcodes/--bpevocab files must match\n')
+            sys.exit(1)
+    vocabs = [learn_bpe.get_vocabulary(f, args.dict_input, args.mincount) for f in args.input]
     bpe = apply_bpe.BPE(args.codes, args.separator, vocab=None, unkchar=args.unkchar, unktag=args.unktag)
-    bpevocab = learn_bpe.restricted_vocabulary(bpe, vocab)
-    if args.outcodes is not None: bpe.write_subset(args.outcodes, bpevocab)
-    if args.bpevocab is not None: learn_bpe.write_vocabulary(bpevocab, args.bpevocab)
+    bpevocabs = [learn_bpe.restricted_vocabulary(bpe, vocab) for vocab in vocabs]
+    if args.outcodes is not None: bpe.write_subsets(args.outcodes, bpevocabs)
+    if args.bpevocab is not None:
+        for bpevocab, out in zip(bpevocabs, args.bpevocab):
+            learn_bpe.write_vocabulary(bpevocab, out)
 
 if __name__ == '__main__':
     # python 2/3 compatibility
@@ -11,23 +11,17 @@ Maja Popović (2015). chrF: character n-gram F-score for automatic MT evaluation
 from __future__ import print_function, unicode_literals, division
 import sys
 import codecs
-import io
-import argparse
 from collections import defaultdict
-from math import log, exp
 
 # hack for python2/3 compatibility
 from io import open
-argparse.open = open
-
-# python 2/3 compatibility
-if sys.version_info < (3, 0):
-  sys.stderr = codecs.getwriter('UTF-8')(sys.stderr)
-  sys.stdout = codecs.getwriter('UTF-8')(sys.stdout)
-  sys.stdin = codecs.getreader('UTF-8')(sys.stdin)
 
 
 def create_parser():
+    import argparse
+    # hack for python2/3 compatibility
+    argparse.open = open
+
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter,
         description="learn BPE-based word segmentation")
@@ -129,6 +123,12 @@ def main(args):
 
 if __name__ == '__main__':
 
+    # python 2/3 compatibility
+    if sys.version_info < (3, 0):
+        sys.stderr = codecs.getwriter('UTF-8')(sys.stderr)
+        sys.stdout = codecs.getwriter('UTF-8')(sys.stdout)
+        sys.stdin = codecs.getreader('UTF-8')(sys.stdin)
+
     parser = create_parser()
     args = parser.parse_args()
 
@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Author: Jonathan Graehl
+
+"""Binary word count files (get_vocab.py --binary, read by learn_bpe.py --dict-input).
+
+Layout: the MAGIC line, then little-endian uint8 flags (1 = counts are sorted
+most frequent first), uint64 number of words and uint64 byte length of the
+words, then the counts as uint64 array, then the UTF-8 words separated by
+newlines. Both arrays are read and written in bulk, and a sorted file is cut at
+a minimum count by binary search instead of a scan; iter_counts reads them a
+block at a time instead. (Python 3 only: the uint64 array type.)
+"""
+
+from __future__ import unicode_literals
+
+import sys
+import struct
+from array import array
+from collections import Counter
+
+MAGIC = b'#bpecounts 1\n'
+HEADER = struct.Struct('<BQQ')
+SORTED = 1
+
+
+def uint64_array(values=()):
+    a = array(str('Q'))
+    a.extend(values)
+    return a
+
+
+def is_count_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except (IOError, OSError):
+        return False
+
+
+def write_counts(items, out):
+    """write (word, count) items to binary file out"""
+    words = [w for w, _ in items]
+    counts = uint64_array(c for _, c in items)
+    is_sorted = all(counts[i] >= counts[i+1] for i in range(len(counts) - 1))
+    blob = '\n'.join(words).encode('utf-8')
+    if sys.byteorder != 'little':
+        counts.byteswap()
+    out.write(MAGIC)
+    out.write(HEADER.pack(SORTED if is_sorted else 0, len(words), len(blob)))
+    out.write(counts.tobytes())
+    out.write(blob)
+
+
+def sorted_cut(counts, mincount):
+    """number of leading counts >= mincount, for counts sorted most frequent first"""
+    lo, hi = 0, len(counts)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if counts[mid] >= mincount:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def read_counts(path, mincount=1):
+    """Counter of the words of binary count file path with count >= mincount, in file order"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a binary count file' % path)
+        flags, n, nbytes = HEADER.unpack(f.read(HEADER.size))
+        counts = uint64_array()
+        counts.frombytes(f.read(8 * n))
+        if sys.byteorder != 'little':
+            counts.byteswap()
+        words = f.read(nbytes).decode('utf-8').split('\n') if n else []
+    if flags & SORTED:
+        n = sorted_cut(counts, mincount)
+        return Counter(dict(zip(words[:n], counts[:n])))
+    if mincount > 1:
+        return Counter(dict((w, c) for w, c in zip(words, counts) if c >= mincount))
+    return Counter(dict(zip(words, counts)))
+
+
+def iter_counts(path, mincount=1, block=1 << 16):
+    """(word, count) items of binary count file path with count >= mincount, in file order,
+    reading block counts (and their words) at a time, so memory does not grow with the file"""
+    with open(path, 'rb') as f, open(path, 'rb') as blob:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a binary count file' % path)
+        flags, n, nbytes = HEADER.unpack(f.read(HEADER.size))
+        blob.seek(f.tell() + 8 * n)
+        words = blob_words(blob, nbytes, 8 * block)
+        while n:
+            counts = uint64_array()
+            counts.frombytes(f.read(8 * min(n, block)))
+            n -= len(counts)
+            if sys.byteorder != 'little':
+                counts.byteswap()
+            if flags & SORTED and counts[-1] < mincount:
+                cut = sorted_cut(counts, mincount)
+                for c in counts[:cut]:
+                    yield next(words), c
+                return
+            for c in counts:
+                w = next(words)
+                if c >= mincount:
+                    yield w, c
+
+
+def blob_words(f, nbytes, size):
+    """the newline-separated UTF-8 words of the next nbytes of f"""
+    rest = b''
+    while nbytes:
+        chunk = f.read(min(size, nbytes))
+        if not chunk:
+            break
+        nbytes -= len(chunk)
+        words = (rest + chunk).split(b'\n')
+        rest = words.pop()
+        for w in words:
+            yield w.decode('utf-8')
+    yield rest.decode('utf-8')
@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Author: Jonathan Graehl
+
+"""Out-of-core learning for learn_bpe.py --out-of-core (Python 3 only).
+
+DiskVocab replaces the list of (symbols, frequency) words: the words are
+symbol ids in memory-mapped files (each word keeps the slot of its initial
+length, and merges rewrite it in place), and a word is decoded only when a
+merge reads it. DiskPairIndex keeps the initial pair -> words index in a
+memory-mapped file too; only the changes made by merges are kept in memory
+(as in pair_index.PairIndex). The kernels and the learning loop are the same
+as in memory, so the codes are identical.
+
+The words are written to the files as they are read, so the word counts need
+not be in memory at all: learn_bpe.py streams a dictionary (--dict-input, text
+or binary count file) straight into DiskVocab, unless --write-vocabulary needs
+the counts afterwards. What stays in memory: the pair statistics (and their
+pruned copy), the distinct symbols, the position of each pair's postings, and
+the postings added by merges. The word table takes 20 bytes per word plus 4 per
+symbol on disk, and the index 8 per pair occurrence. Each merge reads its words from the files (the operating
+system keeps recently used pages cached), so learning is slower than in
+memory: about 1.5 times as slow when the files fit in the page cache, and
+bound by disk reads when they do not.
+"""
+
+from __future__ import unicode_literals
+
+import mmap
+import os
+import shutil
+import tempfile
+from array import array
+from collections import Counter, defaultdict
+
+from pair_index import PairIndex
+
+
+# symbols of DiskVocab words buffered in memory before they are written
+WRITE_BLOCK = 1 << 20
+
+
+class MappedArray(object):
+    """a memory-mapped file of n typecode items (a new file), or with n None, of the
+    items already written to path, as a memoryview"""
+
+    def __init__(self, path, typecode, n=None):
+        itemsize = array(typecode).itemsize
+        if n is None:
+            self.file = open(path, 'r+b')
+            size = os.fstat(self.file.fileno()).st_size
+        else:
+            self.file = open(path, 'w+b')
+            size = n * itemsize
+        # (an empty file cannot be mapped)
+        size = max(itemsize, size)
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.view = memoryview(self.map).cast(typecode)
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+
+class DiskVocab(object):
+    """Sequence of (tuple of symbols, frequency) words, kept in memory-mapped files in directory"""
+
+    def __init__(self, words, directory=None):
+        """words: (tuple of symbols, frequency) words, in any iterable (read once, and written
+        to the files a block at a time); the files are in a new temporary directory in directory"""
+        self.directory = tempfile.mkdtemp(prefix='bpe-', dir=directory)
+        self.strings = []
+        self.ids = {}
+        names = ('offsets', 'lengths', 'freqs', 'symbols')
+        typecodes = ('q', 'i', 'q', 'i')
+        paths = [os.path.join(self.directory, name) for name in names]
+        buffers = [array(t) for t in typecodes]
+        offsets, lengths, freqs, symbols = buffers
+        files = [open(path, 'wb') for path in paths]
+        try:
+            n = start = 0
+            for word, freq in words:
+                offsets.append(start)
+                lengths.append(len(word))
+                freqs.append(freq)
+                symbols.extend([self.id(x) for x in word])
+                start += len(word)
+                n += 1
+                if len(symbols) >= WRITE_BLOCK:
+                    for a, f in zip(buffers, files):
+                        a.tofile(f)
+                        del a[:]
+            for a, f in zip(buffers, files):
+                a.tofile(f)
+        finally:
+            for f in files:
+                f.close()
+        self.offsets, self.lengths, self.freqs, self.symbols = [MappedArray(path, t) for path, t in zip(paths, typecodes)]
+        self.n = n
+
+    def id(self, symbol):
+        try:
+            return self.ids[symbol]
+        except KeyError:
+            self.ids[symbol] = len(self.strings)
+            self.strings.append(symbol)
+            return self.ids[symbol]
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, j):
+        start = self.offsets.view[j]
+        strings = self.strings
+        return tuple([strings[x] for x in self.symbols.view[start:start+self.lengths.view[j]]]), self.freqs.view[j]
+
+    def __setitem__(self, j, item):
+        """replace the symbols of word j (with as many or fewer symbols; the frequency does not change)"""
+        word = item[0]
+        start = self.offsets.view[j]
+        if len(word) > self.lengths.view[j]:
+            raise ValueError('word %d cannot grow' % j)
+        self.symbols.view[start:start+len(word)] = array('i', [self.id(x) for x in word])
+        self.lengths.view[j] = len(word)
+
+    def __iter__(self):
+        for j in range(self.n):
+            yield self[j]
+
+    def close(self):
+        """remove the files"""
+        for a in (self.offsets, self.lengths, self.freqs, self.symbols):
+            a.close()
+        shutil.rmtree(self.directory)
+
+
+class DiskPairIndex(PairIndex):
+    """PairIndex whose postings from get_pair_statistics are in a memory-mapped file"""
+
+    def __init__(self, entries, base, starts, ends):
+        """entries: MappedArray of postings; base: pair -> k, whose postings in it are
+        [starts[k], ends[k])"""
+        PairIndex.__init__(self)
+        self.entries = entries
+        self.base = base
+        self.starts = starts
+        self.ends = ends
+
+    def counts(self, pair):
+        counts = PairIndex.counts(self, pair)
+        k = self.base.get(pair)
+        if k is not None:
+            counts.update(self.entries.view[self.starts[k]:self.ends[k]])
+        return counts
+
+    def words(self, pair):
+        if pair not in self.base:
+            return PairIndex.words(self, pair)
+        return [j for j, count in self.counts(pair).items() if count > 0]
+
+    def compact(self, pair):
+        # (only the postings in memory; the file's stay counted separately)
+        PairIndex.compact(self, pair, PairIndex.counts(self, pair))
+
+    def reset(self, pair):
+        self.base.pop(pair, None)
+        PairIndex.reset(self, pair)
+
+    def close(self):
+        self.entries.close()
+
+
+def get_pair_statistics(vocab, unkchar):
+    """learn_bpe.get_pair_statistics for a DiskVocab: its stats, and a DiskPairIndex"""
+    stats = defaultdict(int)
+    occurrences = Counter()
+    for word, freq in vocab:
+        for pair in word_pairs(word, unkchar):
+            stats[pair] += freq
+            occurrences[pair] += 1
+    # the postings of the k'th pair are at starts[k] (and fill up to ends[k])
+    ids = {}
+    starts = array('q')
+    start = 0
+    for pair, count in occurrences.items():
+        ids[pair] = len(starts)
+        starts.append(start)
+        start += count
+    del occurrences
+    ends = array('q', starts)
+    entries = MappedArray(os.path.join(vocab.directory, 'postings'), 'q', start)
+    view = entries.view
+    for j, (word, freq) in enumerate(vocab):
+        for pair in word_pairs(word, unkchar):
+            k = ids[pair]
+            view[ends[k]] = j
+            ends[k] += 1
+    return stats, DiskPairIndex(entries, ids, starts, ends)
+
+
+def word_pairs(word, unkchar):
+    pairs = zip(word, word[1:])
+    if unkchar in word:
+        pairs = [(prev, sym) for prev, sym in pairs if sym != unkchar and prev != unkchar]
+    return pairs
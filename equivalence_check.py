@@ -0,0 +1,563 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Author: Jonathan Graehl
+
+"""Check that every alternative engine gives exactly the reference output, and time them.
+
+A seeded random corpus (few letters, the unknown character, '</w>' and
+separator lookalikes, glossary strings and numbers) is segmented, learned from
+and counted by each engine, for codes versions (0, 1) and (0, 2), with and
+without glossaries and vocabulary filtering. The reference implementations are
+pure Python and cache nothing (e.g. each word is encoded from scratch); the
+engines are the compiled kernels, the caches (SubwordCache, word outputs,
+cache_words), --bytes, type tables, async_bpe, the model registry, dropout 0,
+--sweep-thresholds, parallel and out-of-core learning, merge logs, --dev, the
+artifact cache, the merge DAG of codes subsets, character n-gram segmentation,
+and the vocabulary counters (also parallel, and the --max-types error bound).
+Any difference from the reference is a failure.
+
+Each run is timed, and the table shows the speedup over the reference. With
+--golden, the digests of the reference outputs are also compared with those
+saved by --save-golden, so changes to the references themselves (and to chrF,
+which has no alternative engine) are caught too. Exits with 1 on any
+difference.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import sys
+import io
+import os
+import json
+import functools
+import time
+import random
+import hashlib
+import shutil
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+
+import apply_bpe
+import learn_bpe
+
+unkchar = '﷪'
+# word parts: few letters (so that pairs repeat and overlap), and edge cases
+PARTS = ['a', 'b', 'c', 'a', 'b', 'ab', 'é', unkchar, '</w>', '</w', 'w>', '@@', 'USA', '42']
+GLOSSARIES = ['USA', '</w>']
+RGLOSSARIES = ['[0-9]+']
+THRESHOLDS = [1, 2, 5, 50, 1 << 30]
+
+
+def random_corpus(seed, lines=300, words_per_line=12):
+    """lines of random words, with a few frequent words and many rare ones"""
+    r = random.Random(seed)
+    types = [''.join(r.choice(PARTS) for _ in range(r.randint(1, 6))) for _ in range(lines * 2)]
+    corpus = []
+    for _ in range(lines):
+        words = [types[min(int(r.paretovariate(0.8)) - 1, len(types) - 1)] for _ in range(r.randint(0, words_per_line))]
+        corpus.append(' '.join(words))
+    return corpus
+
+
+@contextmanager
+def kernels(compiled):
+    """use the compiled kernels module (or the python ones, if None) for applying and learning"""
+    # (resolved first, so that the ones restored are not the unset ones)
+    learn_bpe.load_kernels()
+    saved = apply_bpe.accel, apply_bpe.apply_merges, learn_bpe.update_pair_statistics, learn_bpe.replace_pair
+    if compiled is None:
+        apply_bpe.accel, apply_bpe.apply_merges = None, apply_bpe.apply_merges_py
+        learn_bpe.update_pair_statistics, learn_bpe.replace_pair = learn_bpe.update_pair_statistics_py, learn_bpe.replace_pair_py
+    else:
+        apply_bpe.accel, apply_bpe.apply_merges = compiled, compiled.apply_merges
+        learn_bpe.update_pair_statistics, learn_bpe.replace_pair = compiled.update_pair_statistics, compiled.replace_pair
+    try:
+        yield
+    finally:
+        apply_bpe.accel, apply_bpe.apply_merges, learn_bpe.update_pair_statistics, learn_bpe.replace_pair = saved
+
+
+def reference_segment(bpe, line):
+    """BPE.segment(line), encoding each glossary-free part of each word from scratch"""
+    output = []
+    for word in line.split():
+        new_word = []
+        isolated = False
+        for segment in bpe._isolate_glossaries(word):
+            if len(segment):
+                if isolated:
+                    new_word.append(segment)
+                else:
+                    new_word += apply_bpe.encode(segment, bpe.bpe_codes, bpe.bpe_codes_reverse, bpe.vocab, bpe.separator,
+                                                 bpe.version, {}, unkchar=bpe.unkchar, unktag=bpe.unktag)
+            isolated = not isolated
+        output += [x + bpe.separator for x in new_word[:-1]] + new_word[-1:]
+    return ' '.join(output)
+
+
+def reference_learn(vocab, version01, symbols):
+    out = io.StringIO()
+    with kernels(None):
+        learn_bpe.main(dict(vocab), out, symbols, version01=version01)
+    return out.getvalue()
+
+
+def bpe_of(codes, glossaries=False, vocab=None):
+    if glossaries:
+        return apply_bpe.BPE(io.StringIO(codes), vocab=vocab, glossaries=GLOSSARIES, rglossaries=RGLOSSARIES)
+    return apply_bpe.BPE(io.StringIO(codes), vocab=vocab)
+
+
+def segment_checks(corpus, codes, name, compiled, directory):
+    """(check name, reference, [(engine, run)]) for segmenting corpus with codes"""
+    text = ''.join(line + '\n' for line in corpus).encode('utf-8')
+    for glossaries in (False, True):
+        check = name + (' glossaries' if glossaries else '')
+
+        def reference(glossaries=glossaries):
+            bpe = bpe_of(codes, glossaries)
+            with kernels(None):
+                return [reference_segment(bpe, line) for line in corpus]
+
+        def segment(glossaries=glossaries, passes=1, batch=False):
+            bpe = bpe_of(codes, glossaries)
+            if batch:
+                bpe.cache_words([w for line in corpus for w in line.split()])
+            for _ in range(passes):
+                out = [bpe.segment(line) for line in corpus]
+            return out
+
+        def byte_segmenter(glossaries=glossaries):
+            segmenter = apply_bpe.ByteSegmenter(bpe_of(codes, glossaries))
+            parts = []
+            segmenter.segment_lines([line.encode('utf-8') for line in corpus], parts)
+            return b''.join(parts).decode('utf-8').split('\n')[:-1]
+
+        def type_table(glossaries=glossaries):
+            import type_table
+            path = os.path.join(directory, 'types')
+            with open(path, 'wb') as out:
+                type_table.first_pass(bpe_of(codes, glossaries), io.BytesIO(text), out)
+            out = io.BytesIO()
+            type_table.second_pass(type_table.read_table(path), io.BytesIO(text), out)
+            return out.getvalue().decode('utf-8').split('\n')[:-1]
+
+        def async_bpe(glossaries=glossaries):
+            import asyncio
+            from async_bpe import AsyncBPE
+
+            async def segment():
+                segmenter = AsyncBPE(bpe_of(codes, glossaries), window=0)
+                try:
+                    return list(await segmenter.asegment_many(corpus))
+                finally:
+                    segmenter.close()
+            return asyncio.run(segment())
+
+        def dropout(glossaries=glossaries):
+            d = apply_bpe.Dropout(bpe_of(codes, glossaries), 0)
+            return [d.segment(line) for line in corpus]
+
+        engines = [('BPE.segment', in_kernels(None, segment)),
+                   ('BPE.segment second pass', in_kernels(None, functools.partial(segment, passes=2))),
+                   ('BPE.cache_words', in_kernels(None, functools.partial(segment, batch=True)))]
+        if compiled is not None:
+            engines.append(('BPE.segment compiled', in_kernels(compiled, segment)))
+        engines += [('ByteSegmenter', in_kernels(compiled, byte_segmenter)),
+                    ('type_table passes', in_kernels(compiled, type_table)),
+                    ('AsyncBPE', in_kernels(compiled, async_bpe)),
+                    ('Dropout 0', in_kernels(compiled, dropout))]
+        if sys.version_info < (3, 7):
+            engines = [(e, run) for e, run in engines if e not in ('ByteSegmenter', 'type_table passes', 'AsyncBPE')]
+        yield check, reference, engines
+
+
+def vocabulary_checks(corpus, codes, name, compiled):
+    """segmenting with each of THRESHOLDS on the counts of the segmented corpus (--vocabulary-threshold)"""
+    bpe = bpe_of(codes, True)
+    with kernels(None):
+        counts = Counter(x for line in corpus for x in reference_segment(bpe, line).split())
+
+    def reference():
+        out = []
+        for t in THRESHOLDS:
+            bpe = bpe_of(codes, True, set(x for x, c in counts.items() if c >= t))
+            with kernels(None):
+                out.append([reference_segment(bpe, line) for line in corpus])
+        return out
+
+    def segment():
+        return [[b.segment(line) for line in corpus]
+                for b in [bpe_of(codes, True, set(x for x, c in counts.items() if c >= t)) for t in THRESHOLDS]]
+
+    def sweep():
+        s = apply_bpe.ThresholdSweep(bpe_of(codes, True), counts, THRESHOLDS)
+        return [list(x) for x in zip(*[s.segment_all(line) for line in corpus])] if corpus else [[] for _ in THRESHOLDS]
+
+    engines = [('BPE.segment', in_kernels(None, segment))]
+    if compiled is not None:
+        engines.append(('BPE.segment compiled', in_kernels(compiled, segment)))
+    engines.append(('ThresholdSweep', in_kernels(compiled, sweep)))
+    yield name, reference, engines
+
+
+def registry_checks(corpus, codes, name, compiled, directory):
+    """segmenting with two models of one BPERegistry (one with a vocabulary), in turns"""
+    bpe = bpe_of(codes)
+    with kernels(None):
+        counts = Counter(x for line in corpus for x in reference_segment(bpe, line).split())
+    paths = dict((x, os.path.join(directory, 'registry-' + x)) for x in ('codes', 'vocab'))
+    with io.open(paths['codes'], 'w', encoding='utf-8') as f:
+        f.write(codes)
+    with io.open(paths['vocab'], 'w', encoding='utf-8') as f:
+        f.write(''.join('%s %s\n' % x for x in sorted(counts.items())))
+
+    def reference():
+        bpes = [bpe_of(codes), bpe_of(codes, vocab=set(x for x, c in counts.items() if c >= 2))]
+        with kernels(None):
+            return [[reference_segment(b, line) for b in bpes] for line in corpus]
+
+    def registry(memory_budget=None):
+        from bpe_registry import BPERegistry
+        registry = BPERegistry(memory_budget)
+        registry.register('plain', paths['codes'])
+        registry.register('vocab', paths['codes'], vocab=paths['vocab'], vocabulary_threshold=2)
+        return [[registry.segment(m, line) for m in ('plain', 'vocab')] for line in corpus]
+
+    yield name, reference, [('BPERegistry', in_kernels(compiled, registry)),
+                            # (every segment reloads a model)
+                            ('BPERegistry budget 0', in_kernels(compiled, functools.partial(registry, 0)))]
+
+
+def reference_subset(bpe, bpevocab):
+    """BPE.write_subset output, with the recursive prerequisites the merge DAG replaced"""
+    seen = set()
+    def prereqs2(s, pair):
+        seen.add(s)
+        prereqs(pair[0])
+        prereqs(pair[1])
+    def prereqs(s):
+        if len(s) > 1 and s not in seen:
+            seen.add(s)
+            pair = bpe.bpe_codes_reverse.get(s, None)
+            if pair is not None:
+                prereqs2(s, pair)
+    for ab, pair in bpe.bpe_codes_reverse.items():
+        if apply_bpe.written(ab, bpe.separator) in bpevocab:
+            prereqs2(ab, pair)
+    out = io.StringIO()
+    apply_bpe.write_header(out, bpe.version)
+    for pair, _ in bpe.ordered_codes():
+        ab = pair[0] + pair[1]
+        if apply_bpe.written(ab, bpe.separator) in bpevocab or ab in seen:
+            apply_bpe.write_pair(pair, out)
+    return out.getvalue()
+
+
+def subset_checks(corpus, codes, name):
+    """codes subsets (bpe_subset.py --outcodes) for the BPE vocabularies of parts of corpus"""
+    bpe = bpe_of(codes)
+    bpevocabs = [learn_bpe.restricted_vocabulary(bpe, corpus[i::3]) for i in range(3)] + [{}]
+
+    def reference():
+        return [reference_subset(bpe, v) for v in bpevocabs]
+
+    def write_subset():
+        outs = []
+        for v in bpevocabs:
+            outs.append(io.StringIO())
+            bpe_of(codes).write_subset(outs[-1], v)
+        return [out.getvalue() for out in outs]
+
+    def write_subsets():
+        outs = [io.StringIO() for _ in bpevocabs]
+        bpe_of(codes).write_subsets(outs, bpevocabs)
+        return [out.getvalue() for out in outs]
+
+    yield name, reference, [('BPE.write_subset', write_subset), ('BPE.write_subsets', write_subsets)]
+
+
+def learn_checks(vocab, version01, symbols, name, compiled, directory):
+    """learning codes from vocab, and the BPE vocabulary of the training words (--write-vocabulary)"""
+
+    def learn(**options):
+        out = io.StringIO()
+        learn_bpe.main(dict(vocab), out, symbols, version01=version01, **options)
+        return out.getvalue()
+
+    def merge_log():
+        import merge_log
+        path = os.path.join(directory, 'merge-log')
+        with io.open(path, 'w', encoding='utf-8') as log:
+            learn(merge_log=log)
+        header, merges, end = merge_log.read_log(path)
+        out = io.StringIO()
+        merge_log.write_codes(header, merges, out)
+        return out.getvalue()
+
+    def cached():
+        from artifact_cache import ArtifactCache
+        cache = ArtifactCache(os.path.join(directory, 'cache'))
+        learn(cache=cache)
+        return learn(cache=cache)
+
+    engines = [('learn_bpe.main', in_kernels(None, learn))]
+    if compiled is not None:
+        engines.append(('learn_bpe.main compiled', in_kernels(compiled, learn)))
+    import merge_workers
+    if merge_workers.available():
+        engines.append(('learn workers=2', in_kernels(compiled, lambda: learn(num_workers=2))))
+    if sys.version_info >= (3, 0):
+        engines.append(('out of core', in_kernels(compiled, lambda: learn(out_of_core=directory))))
+    engines += [('merge log replay', in_kernels(compiled, merge_log)),
+                ('with --dev', in_kernels(compiled, lambda: learn(dev=dict(list(vocab.items())[::3])))),
+                ('artifact cache hit', in_kernels(compiled, cached))]
+    yield name, lambda: reference_learn(vocab, version01, symbols), engines
+
+    codes = reference_learn(vocab, version01, symbols)
+
+    def reference_pieces():
+        bpe = bpe_of(codes)
+        counts = Counter()
+        with kernels(None):
+            for w, c in vocab.items():
+                # (as BPE.pieces, keeping empty pieces)
+                for x in reference_segment(bpe, w).split(' '):
+                    counts[x[:-len(learn_bpe.endword)] if x.endswith(learn_bpe.endword) else x] += c
+        return sorted(counts.items())
+
+    def count_pieces():
+        return sorted(learn_bpe.count_pieces(bpe_of(codes), vocab.items()).items())
+
+    engines = [('learn_bpe.count_pieces', in_kernels(None, count_pieces))]
+    if compiled is not None:
+        engines.append(('learn_bpe.count_pieces compiled', in_kernels(compiled, count_pieces)))
+    yield name + ' vocabulary', reference_pieces, engines
+
+
+def count_checks(corpus, directory):
+    """word counts (get_vocab.py, also parallel and with --max-types, learn_bpe.get_vocabulary, count files)"""
+    import unicodedata
+    text = ''.join(line + '\n' for line in corpus).encode('utf-8')
+
+    def reference():
+        return sorted(Counter(unicodedata.normalize('NFC', w) for line in corpus for w in line.split()).items())
+
+    def get_vocab():
+        import get_vocab
+        return sorted(get_vocab.normalized_counts(get_vocab.count_raw(apply_bpe.line_blocks(io.BytesIO(text), 1 << 10))).items())
+
+    def get_vocab_main(*options):
+        import get_vocab
+        out = io.StringIO()
+        get_vocab.main(get_vocab.create_parser().parse_args(['NFC'] + list(options)), io.BytesIO(text), out)
+        return sorted((w, int(c)) for w, c in (line.split(' ') for line in out.getvalue().splitlines()))
+
+    def get_vocabulary():
+        return sorted(learn_bpe.get_vocabulary(corpus).items())
+
+    def count_file():
+        import count_file
+        path = os.path.join(directory, 'counts')
+        with open(path, 'wb') as out:
+            count_file.write_counts(Counter(w for line in corpus for w in line.split()).most_common(), out)
+        with io.open(path, encoding='utf-8', errors='replace') as f:
+            return sorted(learn_bpe.get_vocabulary(f, is_dict=True).items())
+
+    def dict_file():
+        f = io.StringIO(''.join('%s %s\n' % x for x in Counter(w for line in corpus for w in line.split()).most_common()))
+        return sorted(learn_bpe.get_vocabulary(f, is_dict=True).items())
+
+    yield 'word counts', reference, [('get_vocab.count_raw', get_vocab),
+                                     ('get_vocab.py --num-workers 2', lambda: get_vocab_main('--num-workers', '2', '--block-size', '1024')),
+                                     ('learn_bpe.get_vocabulary', get_vocabulary),
+                                     ('binary count file', count_file),
+                                     ('dict input', dict_file)]
+
+    # (get_vocab.py --max-types K: each count is a lower bound within N/(K+1), so
+    # every word counted more often is kept)
+    max_types = 10
+    exact = dict(reference())
+    bound = float(sum(exact.values())) / (max_types + 1)
+
+    def above_bound():
+        return sorted(w for w, c in exact.items() if c > bound)
+
+    def max_types_kept(*options):
+        counts = dict(get_vocab_main('--max-types', str(max_types), '--block-size', '256', *options))
+        return sorted(w for w, c in exact.items() if c > bound and c - bound <= counts.get(w, 0) <= c)
+
+    yield 'word counts above the --max-types bound', above_bound, [('get_vocab.py --max-types', max_types_kept),
+                                                                   ('get_vocab.py --max-types workers=2',
+                                                                    lambda: max_types_kept('--num-workers', '2'))]
+
+
+def char_ngram_checks(corpus, shortlist=20, n=2):
+    """segment-char-ngrams.py with a shortlist of the most frequent words of corpus"""
+    from segment_char_ngrams import CharNgramSegmenter, read_shortlist, segment_blocks
+    vocab_text = ''.join('%s %s\n' % x for x in Counter(w for line in corpus for w in line.split()).most_common())
+    lines = [line + '\n' for line in corpus]
+
+    def reference():
+        # (the per-character loop of segment-char-ngrams.py before CharNgramSegmenter)
+        vocab = [line.split()[0] for line in vocab_text.splitlines() if len(line.split()) == 2]
+        vocab = dict((y, x) for (x, y) in enumerate(vocab))
+        out = io.StringIO()
+        for line in lines:
+            for word in line.split():
+                if word not in vocab or vocab[word] > shortlist:
+                    i = 0
+                    while i * n < len(word):
+                        out.write(word[i * n:i * n + n])
+                        i += 1
+                        if i * n < len(word):
+                            out.write('@@')
+                        out.write(' ')
+                else:
+                    out.write(word + ' ')
+            out.write('\n')
+        return out.getvalue()
+
+    def segmenter():
+        return CharNgramSegmenter(read_shortlist(io.StringIO(vocab_text), shortlist), n)
+
+    def blocks(num_workers):
+        out = io.StringIO()
+        segment_blocks(segmenter(), iter(lines), out, num_workers, block_lines=50)
+        return out.getvalue()
+
+    yield 'char n-grams', reference, [('CharNgramSegmenter', lambda: segmenter().segment_lines(lines)),
+                                      ('segment_blocks', lambda: blocks(1)),
+                                      ('segment_blocks workers=2', lambda: blocks(2))]
+
+
+def chrf_checks(corpus, seed):
+    """chrF of corpus against a perturbed copy (no alternative engine: for --golden only)"""
+    import chrF
+    r = random.Random(seed)
+    hyp = [' '.join(w for w in line.split() if r.random() > 0.2) for line in corpus]
+
+    def reference():
+        correct, total, total_ref = [0] * 6, [0] * 6, [0] * 6
+        for ref_line, hyp_line in zip(corpus, hyp):
+            ngrams_ref = chrF.extract_ngrams(ref_line, max_length=6)
+            get = chrF.extract_ngrams(hyp_line, max_length=6)
+            chrF.get_correct(ngrams_ref, get, correct, total)
+            for rank in ngrams_ref:
+                total_ref[rank] += sum(ngrams_ref[rank].values())
+        return [correct, total, total_ref, list(chrF.f1(correct, total, total_ref, 6, 3))]
+
+    yield 'chrF', reference, []
+
+
+def in_kernels(compiled, run):
+    def run_in():
+        with kernels(compiled):
+            return run()
+    return run_in
+
+
+def digest(output):
+    return hashlib.sha1(json.dumps(output, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def timed(run):
+    start = time.time()
+    output = run()
+    return output, time.time() - start
+
+
+def all_checks(seed, lines, symbols, directory, compiled):
+    corpus = random_corpus(seed, lines)
+    vocab = learn_bpe.get_vocabulary(corpus)
+    for version01 in (False, True):
+        name = 'version (0, %d)' % (1 if version01 else 2)
+        for check in learn_checks(vocab, version01, symbols, 'learn ' + name, compiled, directory):
+            yield check
+        codes = reference_learn(vocab, version01, symbols)
+        for check in segment_checks(corpus, codes, 'segment ' + name, compiled, directory):
+            yield check
+        for check in vocabulary_checks(corpus, codes, 'segment ' + name + ' vocabulary threshold', compiled):
+            yield check
+        for check in registry_checks(corpus, codes, 'segment ' + name + ' registry', compiled, directory):
+            yield check
+        for check in subset_checks(corpus, codes, 'codes subsets ' + name):
+            yield check
+    for check in count_checks(corpus, directory):
+        yield check
+    for check in char_ngram_checks(corpus):
+        yield check
+    for check in chrf_checks(corpus, seed):
+        yield check
+
+
+def run_checks(seed=1, lines=300, symbols=200, only=None, out=None):
+    """run all checks (with only, those whose name contains it); returns ({check: reference digest},
+    [(check, engine) of the engines whose output differs]), writing the table to out"""
+    compiled = apply_bpe.load_accel()
+    directory = tempfile.mkdtemp(prefix='bpe-check-')
+    digests, failures = {}, []
+    if out is not None:
+        out.write('%-52s %-34s %9s %8s  %s\n' % ('check', 'engine', 'seconds', 'speedup', 'result'))
+    try:
+        for check, reference, engines in all_checks(seed, lines, symbols, directory, compiled):
+            if only is not None and only not in check:
+                continue
+            expected, reference_time = timed(reference)
+            digests[check] = digest(expected)
+            if out is not None:
+                out.write('%-52s %-34s %9.3f %8s  %s\n' % (check, 'reference', reference_time, '', digests[check][:12]))
+            for engine, run in engines:
+                output, t = timed(run)
+                same = output == expected
+                if not same:
+                    failures.append((check, engine))
+                if out is not None:
+                    out.write('%-52s %-34s %9.3f %7.2fx  %s\n' % (check, engine, t, reference_time / t if t else float('inf'),
+                                                                  'ok' if same else 'DIFFERS'))
+    finally:
+        shutil.rmtree(directory)
+    return digests, failures
+
+
+def create_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+    parser.add_argument('--seed', type=int, default=1, help="random corpus seed (default: %(default)s)")
+    parser.add_argument('--lines', type=int, default=300, help="random corpus lines (default: %(default)s)")
+    parser.add_argument('--symbols', type=int, default=200, help="codes to learn (default: %(default)s)")
+    parser.add_argument('--only', default=None, metavar='TEXT', help="run only the checks whose name contains TEXT")
+    parser.add_argument('--golden', default=None, metavar='PATH',
+                        help="compare the reference outputs with the digests in PATH (their seed, lines and symbols are used)")
+    parser.add_argument('--save-golden', default=None, metavar='PATH',
+                        help="save the digests of the reference outputs to PATH")
+    return parser
+
+
+def main(args, out):
+    golden = None
+    if args.golden:
+        with io.open(args.golden, encoding='utf-8') as f:
+            golden = json.load(f)
+        args.seed, args.lines, args.symbols = golden['seed'], golden['lines'], golden['symbols']
+    digests, failures = run_checks(args.seed, args.lines, args.symbols, args.only, out)
+    for check, engine in failures:
+        out.write('DIFFERS: %s: %s\n' % (check, engine))
+    if golden is not None:
+        for check, d in sorted(digests.items()):
+            if golden['digests'].get(check) != d:
+                failures.append((check, 'reference'))
+                out.write('DIFFERS from %s: %s: reference\n' % (args.golden, check))
+    if args.save_golden:
+        with io.open(args.save_golden, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(dict(seed=args.seed, lines=args.lines, symbols=args.symbols, digests=digests),
+                               sort_keys=True, indent=1, ensure_ascii=False) + '\n')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(create_parser().parse_args(), sys.stdout))
@@ -1,35 +1,149 @@
 #! /usr/bin/env python
-from __future__ import print_function
+# -*- coding: utf-8 -*-
+
+"""Count the (unicode-normalized) words of a text, most frequent first.
+
+Tokens are counted as raw UTF-8 bytes, read in binary blocks, and each distinct
+type is decoded and normalized only once. With --num-workers, blocks are
+counted by a process pool. With --max-types, memory is bounded by a
+Misra-Gries summary and counts are lower bounds (off by at most N/(K+1) for a
+text of N tokens).
+"""
+
+from __future__ import print_function, unicode_literals
+
 import sys
 import codecs
-import unicodedata
 import os
 from collections import Counter
 from unicodedata import normalize
 
-# python 2/3 compatibility
-if sys.version_info < (3, 0):
-    sys.stderr = codecs.getwriter('UTF-8')(sys.stderr)
-    sys.stdout = codecs.getwriter('UTF-8')(sys.stdout)
-    sys.stdin = codecs.getreader('UTF-8')(sys.stdin)
-else:
-    sys.stderr = codecs.getwriter('UTF-8')(sys.stderr.buffer)
-    sys.stdout = codecs.getwriter('UTF-8')(sys.stdout.buffer)
-    sys.stdin = codecs.getreader('UTF-8')(sys.stdin.buffer)
-
-# NFK?[DC] K makes roman numeral I -> ascii I. C means composed, D means decomposed
-if len(sys.argv) > 1:
-    unicodenormal = sys.argv[1]
-    if len(sys.argv) > 2:
-        print("WARNING: ignoring extra args %s\n"%sys.argv[2:], file=sys.stderr)
-else:
-    unicodenormal = os.environ.get('unicodenormal', 'NFC')
-c = Counter()
-
-for line in sys.stdin:
-    for word in line.split():
-        if len(word):
-            c[unicodedata.normalize(unicodenormal, word)] += 1
-
-for key,f in c.most_common():
-    print(key+" "+ str(f))
+
+def create_parser():
+    import argparse
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="count words of a text")
+
+    # NFK?[DC] K makes roman numeral I -> ascii I. C means composed, D means decomposed
+    parser.add_argument(
+        'unicodenormal', nargs='?', default=os.environ.get('unicodenormal', 'NFC'),
+        help="unicode normal form NFC, NFD, NFKC or NFKD (default: $unicodenormal or NFC)")
+    parser.add_argument(
+        '--input', '-i', default=None, metavar='PATH',
+        help="Input text (default: standard input).")
+    parser.add_argument(
+        '--num-workers', type=int, default=1,
+        help="Number of processes counting blocks of the input. If -1, use multiprocessing.cpu_count() (default: %(default)s)")
+    parser.add_argument(
+        '--block-size', type=int, default=1 << 24, metavar='BYTES',
+        help="read input in blocks of about this many bytes (default: %(default)s)")
+    parser.add_argument(
+        '--max-types', type=int, default=0, metavar='K',
+        help="keep at most about 2K types in memory (Misra-Gries summary); counts become lower bounds (default: exact)")
+    parser.add_argument(
+        '--min-count', type=int, default=1, metavar='C',
+        help="only output words with count >= C (default: %(default)s)")
+    parser.add_argument(
+        '--binary', action='store_true',
+        help="write a binary count file (for learn_bpe.py --dict-input) instead of text")
+    return parser
+
+
+def count_block(block):
+    """Counter of the whitespace-separated raw (UTF-8 bytes) tokens in block (of apply_bpe.line_blocks)"""
+    return Counter(block.split())
+
+
+def prune_counts(counts, max_types):
+    """Misra-Gries: once counts has more than 2*max_types entries, subtract the
+    (max_types+1)th largest count from all of them and drop those left <= 0"""
+    if max_types and len(counts) > 2 * max_types:
+        cut = sorted(counts.values(), reverse=True)[max_types]
+        for w, c in list(counts.items()):
+            if c <= cut:
+                del counts[w]
+            else:
+                counts[w] = c - cut
+    return counts
+
+
+def count_raw(blocks, num_workers=1, max_types=0):
+    """Counter of raw tokens over all blocks, in order of first occurrence"""
+    from multiprocessing import Pool, cpu_count
+    if num_workers < 0:
+        num_workers = cpu_count()
+    counts = Counter()
+    if num_workers <= 1:
+        for block in blocks:
+            counts.update(count_block(block))
+            prune_counts(counts, max_types)
+        return counts
+    pool = Pool(num_workers)
+    try:
+        batch = []
+        for block in blocks:
+            batch.append(block)
+            if len(batch) == 2 * num_workers:
+                for partial in pool.map(count_block, batch):
+                    counts.update(partial)
+                    prune_counts(counts, max_types)
+                batch = []
+        for partial in pool.map(count_block, batch):
+            counts.update(partial)
+            prune_counts(counts, max_types)
+    finally:
+        pool.close()
+        pool.join()
+    return counts
+
+
+def normalized_counts(raw, unicodenormal='NFC'):
+    """aggregate raw token counts by normalized word, normalizing each type once.
+
+    raw tokens are only split on ASCII whitespace, so they are decoded and split
+    again on unicode whitespace, giving the same words as str.split per line.
+    """
+    counts = Counter()
+    for token, c in raw.items():
+        for word in token.decode('utf-8').split():
+            counts[normalize(unicodenormal, word)] += c
+    return counts
+
+
+def write_counts(counts, out, mincount=1):
+    for key, f in counts.most_common():
+        if f < mincount:
+            break
+        out.write(key + " " + str(f) + "\n")
+
+
+def main(args, infile, out):
+    """out is a text file, or a binary file with args.binary"""
+    from apply_bpe import line_blocks
+    raw = count_raw(line_blocks(infile, args.block_size), args.num_workers, args.max_types)
+    counts = normalized_counts(raw, args.unicodenormal)
+    if args.binary:
+        import count_file
+        count_file.write_counts([(w, f) for w, f in counts.most_common() if f >= args.min_count], out)
+    else:
+        write_counts(counts, out, args.min_count)
+
+
+if __name__ == '__main__':
+    # python 2/3 compatibility
+    if sys.version_info < (3, 0):
+        sys.stderr = codecs.getwriter('UTF-8')(sys.stderr)
+        stdout = sys.stdout
+        sys.stdout = codecs.getwriter('UTF-8')(sys.stdout)
+        stdin = sys.stdin
+    else:
+        sys.stderr = codecs.getwriter('UTF-8')(sys.stderr.buffer)
+        stdout = sys.stdout.buffer
+        sys.stdout = codecs.getwriter('UTF-8')(sys.stdout.buffer)
+        stdin = sys.stdin.buffer
+
+    parser = create_parser()
+    args = parser.parse_args()
+    infile = stdin if args.input is None else open(args.input, 'rb')
+    main(args, infile, stdout if args.binary else sys.stdout)
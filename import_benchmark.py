@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Author: Jonathan Graehl
+
+"""Measure the startup cost of the modules and scripts.
+
+For each module, the cumulative import time reported by python -X importtime
+(best of --repeat fresh interpreters), and for each subword_nmt.py command, the
+wall time of running it with --help, both in milliseconds. The wall times
+include interpreter startup, which is also shown on its own.
+"""
+
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import time
+
+MODULES = ['apply_bpe', 'learn_bpe', 'get_vocab', 'learn_joint_bpe_and_vocab', 'bpe_subset',
+           'segment_char_ngrams', 'subword', 'chrF', 'type_table', 'bpe_registry', 'async_bpe', 'pair_index', 'merge_log', 'disk_vocab']
+
+
+def import_ms(module, repeat):
+    best = None
+    for _ in range(repeat):
+        err = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                             stderr=subprocess.PIPE, universal_newlines=True).stderr
+        for line in err.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                us = int(fields[1])
+                best = us if best is None else min(best, us)
+    return best / 1000.0 if best is not None else float('nan')
+
+
+def run_ms(args, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        t = time.time() - start
+        best = t if best is None else min(best, t)
+    return best * 1000
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help="runs per measurement (the best is reported) (default: %(default)s)")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(here)
+    import subword_nmt
+
+    print('%-28s %10s' % ('module', 'import ms'))
+    for module in MODULES:
+        print('%-28s %10.1f' % (module, import_ms(module, args.repeat)))
+    print()
+    print('%-28s %10s' % ('command', '--help ms'))
+    print('%-28s %10.1f' % ('(python -c pass)', run_ms([sys.executable, '-c', 'pass'], args.repeat)))
+    for command, _ in subword_nmt.COMMANDS:
+        print('%-28s %10.1f' % (command, run_ms([sys.executable, 'subword_nmt.py', command, '--help'], args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,18 +15,18 @@ from __future__ import unicode_literals
 
 import sys
 import codecs
-import re
 import copy
-import argparse
+import io
 import os
-import tempfile
 from collections import defaultdict, Counter
 
 # hack for python2/3 compatibility
 from io import open
-argparse.open = open
 
-import apply_bpe
+import merge_workers
+from pair_index import PairIndex
+
+endword = '</w>'
 
 
 def maybe_hex_int(x):
@@ -34,6 +34,8 @@ def maybe_hex_int(x):
 
 
 def common_parser_arguments(parser):
+    import argparse
+    import apply_bpe
     apply_bpe.common_parser_arguments(parser)
     parser.add_argument(
         '--output', '-o', type=argparse.FileType('w'), default=sys.stdout,
@@ -53,16 +55,62 @@ def common_parser_arguments(parser):
         help='Write to these vocabulary files after applying BPE. One per input text. Used for filtering in apply_bpe.py')
     parser.add_argument(
         '--min-count,', '-c', type=int, dest='mincount', default=1, help="drop from pre-bpe vocab any word with count below this")
+    parser.add_argument(
+        '--num-workers', type=int, default=1,
+        help="Number of processes used to build --write-vocabulary vocabularies (all languages share one pool). If -1, use multiprocessing.cpu_count() (default: %(default)s)")
+    parser.add_argument(
+        '--learn-workers', type=int, default=1,
+        help="Number of processes sharing the pair statistics updates of each merge while learning codes "
+             "(same codes as with 1; python 3.8+). If -1, use multiprocessing.cpu_count() (default: %(default)s)")
+    parser.add_argument(
+        '--target-tokens-per-word', type=float, default=None, metavar='RATIO',
+        help="Stop (before --symbols) once the training corpus has at most RATIO subword tokens per word")
+    parser.add_argument(
+        '--target-vocab-size', type=int, default=None, metavar='N',
+        help="Stop (before --symbols) once the training corpus has N distinct subword units, "
+             "i.e. about N lines in --write-vocabulary vocabularies of all training text")
+    parser.add_argument(
+        '--trace', type=argparse.FileType('w'), default=None, metavar='PATH',
+        help="Write a table of each merge's pair and frequency, and the training corpus tokens, tokens per word "
+             "and distinct subword units after it")
+    parser.add_argument(
+        '--out-of-core', default=None, metavar='DIR',
+        help="Keep the words and the initial pair index in memory-mapped files in a temporary directory in DIR "
+             "while learning, for vocabularies too large for memory (same codes; slower; python 3 only; see disk_vocab.py)")
+    parser.add_argument(
+        '--merge-log', type=argparse.FileType('w'), default=None, metavar='PATH',
+        help="Write a JSON lines record of each merge (frequency, words changed, pruning threshold), "
+             "for merge_log.py queries")
+    parser.add_argument(
+        '--dev', type=argparse.FileType('r'), default=None, metavar='PATH',
+        help="Held-out text: report its subword tokens per word, and the rate of its subword tokens not in the "
+             "training corpus segmentation, every --dev-every merges while learning (and in --merge-log)")
+    parser.add_argument(
+        '--dev-every', type=int, default=1000, metavar='N',
+        help="Merges between --dev reports (default: %(default)s)")
     parser.add_argument('--dict-input', action="store_true",
-                            help="If set, input file is instead of running text tokens a dictionary where each line contains a word count pair")
+                            help="If set, input file is instead of running text tokens a dictionary where each line contains a word count pair"
+                                 " (in any order), or a binary count file (get_vocab.py --binary)")
+    parser.add_argument('--dict-sorted', action="store_true",
+                            help="With --dict-input, the text dictionary is sorted by decreasing count (as get_vocab.py writes it): "
+                                 "stop reading at the first count below --mincount (unsorted input is an error)")
     parser.add_argument('--forcecodes', '-f', default=None, metavar='PATH',
                            help='apply these merges (--output from another learn_bpe.py) first')
     parser.add_argument('--grepforcecodes', '-g', default=None, metavar='RE',
                            help="use only --forcecodes A B parts that both whole-string match this regexp"
                                 "(not counting any </w> at end of B which is always allowed) e.g. [0-9]+")
+    parser.add_argument('--cache-dir', default=os.environ.get('BPE_CACHE_DIR'), metavar='PATH',
+                           help="reuse codes and vocabularies previously learned from identical word counts and options, "
+                                "kept in this directory (default: $BPE_CACHE_DIR, or no cache)")
+    parser.add_argument('--cache-size', type=int, default=1024, metavar='MB',
+                           help="remove least recently used --cache-dir entries beyond this size (default: %(default)s)")
 
 
 def create_parser():
+    import argparse
+    # hack for python2/3 compatibility
+    argparse.open = open
+
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter,
         description="learn BPE-based word segmentation")
@@ -76,21 +124,83 @@ def create_parser():
     return parser
 
 
-def get_vocabulary(fobj, is_dict=False, mincount=1):
+# lines of a dictionary parsed at once by dict_blocks
+DICT_BLOCK_LINES = 1 << 16
+
+
+def dict_blocks(fobj, mincount=1, is_sorted=False):
+    """Read a dictionary (lines of word and count, as written by get_vocab.py) in
+    blocks of DICT_BLOCK_LINES lines (of any iterable of lines; an io text file is
+    fastest), yielding the (word, count) items with count >= mincount of each.
+    Without is_sorted every line is read, so input need not be sorted by count.
+    With is_sorted, reading stops at the first count below mincount, and counts
+    that increase raise ValueError.
+    """
+    from itertools import islice
+    last = None
+    for lines in iter(lambda: list(islice(fobj, DICT_BLOCK_LINES)), []):
+        tokens = ''.join(lines).split()
+        if len(tokens) != 2 * len(lines):
+            for line in lines:
+                if len(line.split()) != 2:
+                    raise ValueError('dictionary line is not "word count": %r' % line)
+        words = tokens[0::2]
+        counts = [int(c) for c in tokens[1::2]]
+        if is_sorted:
+            if last is not None:
+                counts.insert(0, last)
+            if any(counts[i] < counts[i+1] for i in range(len(counts) - 1)):
+                raise ValueError('dictionary is not sorted by decreasing count')
+            if last is not None:
+                del counts[0]
+            last = counts[-1]
+            if mincount > 1 and last < mincount:
+                import count_file
+                cut = count_file.sorted_cut(counts, mincount)
+                yield zip(words[:cut], counts[:cut])
+                return
+            yield zip(words, counts)
+        elif mincount > 1:
+            yield ((w, c) for w, c in zip(words, counts) if c >= mincount)
+        else:
+            yield zip(words, counts)
+
+
+def get_dict_vocabulary(fobj, mincount=1, is_sorted=False):
+    """the vocabulary of a dictionary (see dict_blocks)"""
+    vocab = Counter()
+    for items in dict_blocks(fobj, mincount, is_sorted):
+        # dict.update: a repeated word keeps its last count, as Counter.update would add them
+        dict.update(vocab, items)
+    return vocab
+
+
+def iter_dict_vocabulary(fobj, mincount=1, is_sorted=False):
+    """the (word, count) items of a dictionary (text, or a binary count file), read as
+    get_vocabulary(fobj, True, ...) does, but one block at a time instead of into a dict.
+    (A word listed twice is yielded twice; get_vocab.py lists each word once.)"""
+    import count_file
+    name = getattr(fobj, 'name', None)
+    if name is not None and count_file.is_count_file(name):
+        return count_file.iter_counts(name, mincount)
+    from itertools import chain
+    return chain.from_iterable(dict_blocks(fobj, mincount, is_sorted))
+
+
+def get_vocabulary(fobj, is_dict=False, mincount=1, dict_sorted=False):
     """Read text and return dictionary that encodes vocabulary
     """
+    if is_dict:
+        import count_file
+        name = getattr(fobj, 'name', None)
+        if name is not None and count_file.is_count_file(name):
+            return count_file.read_counts(name, mincount)
+        return get_dict_vocabulary(fobj, mincount, dict_sorted)
     vocab = Counter()
     for line in fobj:
-        if is_dict:
-            word, count = line.strip().split()
-            c = int(count)
-            if c < mincount:
-                break
-            vocab[word] = c
-        else:
-            for word in line.split():
-                vocab[word] += 1
-    if mincount > 1 and not is_dict:
+        for word in line.split():
+            vocab[word] += 1
+    if mincount > 1:
         return dict((x,y) for x,y in vocab.items() if y >= mincount)
     return vocab
 
@@ -100,31 +210,98 @@ def write_vocabulary(vocab, vocab_file):
         vocab_file.write("{0} {1}\n".format(key, freq))
 
 
-def restricted_vocabulary(bpe, restrict):
-    vocab = restrict if isinstance(restrict, Counter) else get_vocabulary(restrict)
+def count_pieces(bpe, items):
+    """Counter of the BPE pieces of (word, count) items, each piece weighted by its word's count"""
     bpevocab = Counter()
-    for w, c in vocab.items():
+    items = list(items)
+    bpe.cache_words([w for w, c in items])
+    for w, c in items:
         for sw in bpe.pieces(w):
-            if sw.endswith(apply_bpe.endword):
+            if sw.endswith(endword):
                 sw = sw[:-4]
             bpevocab[sw] += c
     return bpevocab
 
 
-def make_vocabularies(bpe, inputfiles, vocabfiles):
-    for restrict, outf in zip(inputfiles, vocabfiles):
-        write_vocabulary(restricted_vocabulary(bpe, restrict), outf)
+def restricted_vocabulary(bpe, restrict):
+    vocab = restrict if isinstance(restrict, dict) else get_vocabulary(restrict)
+    return count_pieces(bpe, vocab.items())
+
+
+# BPE object of a restricted_vocabularies worker process (set once per process by the pool initializer)
+worker_bpe = None
+
+
+def init_vocabulary_worker(bpe):
+    global worker_bpe
+    worker_bpe = bpe
+
+
+def count_pieces_job(job):
+    n, items = job
+    return n, count_pieces(worker_bpe, items)
+
+
+def restricted_vocabularies(bpe, restricts, num_workers=1, jobs_per_worker=4):
+    """restricted_vocabulary for each of restricts; with num_workers > 1, the word
+    types of all of them are partitioned into contiguous chunks and segmented by a
+    single process pool. partial counts are merged in chunk order, so the result
+    (including the order of count ties) is identical to the serial path.
+    """
+    from multiprocessing import Pool, cpu_count
+    if num_workers < 0:
+        num_workers = cpu_count()
+    vocabs = [restrict if isinstance(restrict, dict) else get_vocabulary(restrict) for restrict in restricts]
+    if num_workers <= 1:
+        return [count_pieces(bpe, vocab.items()) for vocab in vocabs]
+    jobs = []
+    for n, vocab in enumerate(vocabs):
+        items = list(vocab.items())
+        step = max(1, -(-len(items) // (num_workers * jobs_per_worker)))
+        for i in range(0, len(items), step):
+            jobs.append((n, items[i:i+step]))
+    bpevocabs = [Counter() for _ in vocabs]
+    pool = Pool(num_workers, init_vocabulary_worker, (bpe,))
+    try:
+        for n, partial in pool.imap(count_pieces_job, jobs):
+            bpevocabs[n].update(partial)
+    finally:
+        pool.close()
+        pool.join()
+    return bpevocabs
+
+
+def make_vocabularies(bpe, inputfiles, vocabfiles, num_workers=1, cache=None):
+    if cache is None:
+        for bpevocab, outf in zip(restricted_vocabularies(bpe, inputfiles, num_workers), vocabfiles):
+            write_vocabulary(bpevocab, outf)
+            outf.close()
+        return
+    from artifact_cache import vocab_fingerprint, bpe_fingerprint
+    vocabs = [restrict if isinstance(restrict, dict) else get_vocabulary(restrict) for restrict in inputfiles]
+    bpekey = bpe_fingerprint(bpe)
+    keys = [cache.key('vocabulary', bpekey, vocab_fingerprint(vocab)) for vocab in vocabs]
+    texts = [cache.get(key, 'vocabulary') for key in keys]
+    missing = [i for i, text in enumerate(texts) if text is None]
+    for i, bpevocab in zip(missing, restricted_vocabularies(bpe, [vocabs[i] for i in missing], num_workers)):
+        out = io.StringIO()
+        write_vocabulary(bpevocab, out)
+        texts[i] = out.getvalue()
+        cache.put(keys[i], 'vocabulary', texts[i])
+    for text, outf in zip(texts, vocabfiles):
+        outf.write(text)
         outf.close()
 
 
-def update_pair_statistics(pair, changed, stats, indices):
+def update_pair_statistics_py(pair, changed, stats, indices):
     """Minimally update the indices and frequency of symbol pairs
 
     if we merge a pair of symbols, only pairs that overlap with occurrences
     of this pair are affected, and need to be updated.
     """
     stats[pair] = 0
-    indices[pair] = defaultdict(int)
+    indices.reset(pair)
+    add = indices.add
     first, second = pair
     new_pair = first+second
     for j, word, old_word, freq in changed:
@@ -143,14 +320,14 @@ def update_pair_statistics(pair, changed, stats, indices):
                 if i:
                     prev = old_word[i-1:i+1]
                     stats[prev] -= freq
-                    indices[prev][j] -= 1
+                    add(prev, j, -1)
                 if i < len(old_word)-2:
                     # assuming a symbol sequence "A B C B", if "B C" is merged, reduce the frequency of "C B".
                     # however, skip this if the sequence is A B C B C, because the frequency of "C B" will be reduced by the previous code block
                     if old_word[i+2] != first or i >= len(old_word)-3 or old_word[i+3] != second:
                         nex = old_word[i+1:i+3]
                         stats[nex] -= freq
-                        indices[nex][j] -= 1
+                        add(nex, j, -1)
                 i += 2
             else:
                 i += 1
@@ -166,50 +343,46 @@ def update_pair_statistics(pair, changed, stats, indices):
             if i:
                 prev = word[i-1:i+1]
                 stats[prev] += freq
-                indices[prev][j] += 1
+                add(prev, j, 1)
             # assuming a symbol sequence "A BC B", if "B C" is merged, increase the frequency of "BC B"
             # however, if the sequence is A BC BC, skip this step because the count of "BC BC" will be incremented by the previous code block
             if i < len(word)-1 and word[i+1] != new_pair:
                 nex = word[i:i+2]
                 stats[nex] += freq
-                indices[nex][j] += 1
+                add(nex, j, 1)
             i += 1
 
 
 def get_pair_statistics(vocab, unkchar):
-    """Count frequency of all symbol pairs, and create index"""
+    """Count frequency of all symbol pairs, and create index (see pair_index.PairIndex)"""
 
     # data structure of pair frequencies
     stats = defaultdict(int)
 
     #index from pairs to words
-    indices = defaultdict(lambda: defaultdict(int))
+    indices = PairIndex()
 
     for i, (word, freq) in enumerate(vocab):
-        prev_char = word[0]
-        for char in word[1:]:
-            if char != unkchar and prev_char != unkchar:
-                stats[prev_char, char] += freq
-                indices[prev_char, char][i] += 1
-            prev_char = char
+        pairs = zip(word, word[1:])
+        # only words with an unknown character need the check
+        if unkchar in word:
+            pairs = [(prev_char, char) for prev_char, char in pairs if char != unkchar and prev_char != unkchar]
+        for pair in pairs:
+            stats[pair] += freq
+            indices[pair].append(i)
 
     return stats, indices
 
 
-def replace_pair(pair, vocab, indices):
+def replace_pair_py(pair, vocab, indices):
     """Replace all occurrences of a symbol pair ('A', 'B') with a new symbol 'AB'"""
+    import re
     first, second = pair
     pair_str = ''.join(pair)
     pair_str = pair_str.replace('\\','\\\\')
     changes = []
     pattern = re.compile(r'(?<!\S)' + re.escape(first + ' ' + second) + r'(?!\S)')
-    if sys.version_info < (3, 0):
-        iterator = indices[pair].iteritems()
-    else:
-        iterator = indices[pair].items()
-    for j, freq in iterator:
-        if freq < 1:
-            continue
+    for j in indices.words(pair):
         word, freq = vocab[j]
         new_word = ' '.join(word)
         new_word = pattern.sub(pair_str, new_word)
@@ -221,10 +394,179 @@ def replace_pair(pair, vocab, indices):
     return changes
 
 
-def do_pair(most_frequent, outfile, sorted_vocab, indices, stats):
+# the kernels used by do_pair: set by load_kernels() (unless set before) to the compiled
+# ones if available (see apply_bpe.load_kernels), else the python ones
+update_pair_statistics = None
+replace_pair = None
+
+
+def load_kernels():
+    global update_pair_statistics, replace_pair
+    import apply_bpe
+    apply_bpe.load_kernels()
+    if update_pair_statistics is None:
+        update_pair_statistics = apply_bpe.accel.update_pair_statistics if apply_bpe.accel else update_pair_statistics_py
+    if replace_pair is None:
+        replace_pair = apply_bpe.accel.replace_pair if apply_bpe.accel else replace_pair_py
+
+
+class TokenBudget(object):
+    """Number of tokens of the training corpus (and optionally of distinct subword
+    units) under the merges learned so far, updated incrementally from each
+    merge's changed words, for stopping at a target and for a per-merge trace.
+
+    Counts are of the segmentation of the training words while learning, which
+    is what apply_bpe.py (without --vocabulary) gives for them. Pieces are keyed
+    like the merged symbols: the last piece of a word ends with '</w>'.
+    """
+
+    def __init__(self, sorted_vocab, tokens_per_word=None, vocab_size=None, trace=None, track_pieces=False):
+        self.tokens_per_word = tokens_per_word
+        self.vocab_size = vocab_size
+        self.trace = trace
+        self.words = sum(freq for word, freq in sorted_vocab)
+        # a separate end-of-word symbol (version 0.1) is not a token
+        self.tokens = sum(freq * len(merge_workers.word_pieces(word, endword)) for word, freq in sorted_vocab)
+        self.track_pieces = track_pieces or vocab_size is not None or trace is not None
+        self.pieces = Counter()
+        if self.track_pieces:
+            for word, freq in sorted_vocab:
+                for x, final in merge_workers.word_pieces(word, endword):
+                    self.pieces[x + endword if final else x] += freq
+        if trace is not None:
+            trace.write('merge\tpair\tfrequency\ttokens\ttokens/word\tvocabulary\n')
+            self.write_trace('', '', '')
+
+    def ratio(self):
+        return float(self.tokens) / self.words if self.words else 0
+
+    def update(self, pair, removed, pieces=None):
+        """after merging pair, which decreased the number of symbols by removed"""
+        if pair[1] != endword:
+            self.tokens -= removed
+        if pieces:
+            counts = self.pieces
+            for piece, d in pieces.items():
+                c = counts[piece] + d
+                if c:
+                    counts[piece] = c
+                else:
+                    del counts[piece]
+
+    def update_changes(self, pair, changes):
+        removed = sum(freq * (len(old_word) - len(word)) for j, word, old_word, freq in changes)
+        pieces = None
+        if self.track_pieces:
+            # (summed: ('t', 1) and the merged ('t</w>', 0) are the same piece)
+            pieces = Counter()
+            for (x, final), d in merge_workers.pieces_delta(changes, endword).items():
+                pieces[x + endword if final else x] += d
+        self.update(pair, removed, pieces)
+
+    def write_trace(self, i, pair, freq):
+        self.trace.write('%s\t%s\t%s\t%s\t%.4f\t%s\n' % (i, ' '.join(pair), freq, self.tokens, self.ratio(), len(self.pieces)))
+
+    def reached(self):
+        """the reason to stop, if a target is reached"""
+        if self.tokens_per_word is not None and self.ratio() <= self.tokens_per_word:
+            return 'reached {0:.4f} <= {1} tokens per word'.format(self.ratio(), self.tokens_per_word)
+        if self.vocab_size is not None and len(self.pieces) >= self.vocab_size:
+            return 'reached vocabulary size {0} >= {1}'.format(len(self.pieces), self.vocab_size)
+
+
+def piece_keys(word):
+    """the output pieces of word (a tuple of symbols), keyed as in TokenBudget.pieces"""
+    return [x + endword if final else x for x, final in merge_workers.word_pieces(word, endword)]
+
+
+def merge_all(word, pair):
+    """word with every non-overlapping occurrence of pair (left to right) merged"""
+    first, second = pair
+    new_word = []
+    i = 0
+    while i < len(word):
+        if i < len(word) - 1 and word[i] == first and word[i+1] == second:
+            new_word.append(first + second)
+            i += 2
+        else:
+            new_word.append(word[i])
+            i += 1
+    return tuple(new_word)
+
+
+class DevSet(object):
+    """Segmentation of held-out words under the merges learned so far, as apply_bpe.py
+    would segment them, for reporting their number of tokens and the rate of their
+    subword tokens not produced for the training corpus (see TokenBudget.pieces).
+
+    Each merge changes only the words whose segmentation has the merged pair (the
+    segmentation with one more merge differs only then), so it costs in proportion
+    to those words.
+    """
+
+    def __init__(self, vocab, version01):
+        self.words = [(tuple(x)+(endword,) if version01 else tuple(x[:-1])+(x[-1]+endword,), y) for (x, y) in vocab.items()]
+        self.count = sum(vocab.values())
+        # merged pair -> rank (the first, for a pair merged twice)
+        self.codes = {}
+        # pair -> ids of the words whose segmentation has it
+        self.index = defaultdict(set)
+        self.pieces = Counter()
+        for j, (word, freq) in enumerate(self.words):
+            for pair in zip(word, word[1:]):
+                self.index[pair].add(j)
+            for x in piece_keys(word):
+                self.pieces[x] += freq
+
+    def merge(self, pair):
+        codes = self.codes
+        if pair not in codes:
+            codes[pair] = len(codes)
+        words = self.words
+        pieces = self.pieces
+        index = self.index
+        for j in index.pop(pair, ()):
+            old_word, freq = words[j]
+            word = old_word
+            # as apply_bpe.apply_merges: the merged symbols may make a pair of an earlier merge
+            while True:
+                ranked = [(codes[p], p) for p in zip(word, word[1:]) if p in codes]
+                if not ranked:
+                    break
+                word = merge_all(word, min(ranked)[1])
+            words[j] = (word, freq)
+            for p in zip(old_word, old_word[1:]):
+                if p != pair:
+                    index[p].discard(j)
+            for p in zip(word, word[1:]):
+                index[p].add(j)
+            for x in piece_keys(old_word):
+                pieces[x] -= freq
+            for x in piece_keys(word):
+                pieces[x] += freq
+
+    def report(self, training_pieces):
+        """(tokens, tokens per word, fraction of tokens not among training_pieces)"""
+        tokens = sum(self.pieces.values())
+        unseen = sum(c for x, c in self.pieces.items() if c and x not in training_pieces)
+        return tokens, float(tokens) / self.count if self.count else 0, float(unseen) / tokens if tokens else 0
+
+
+def do_pair(most_frequent, outfile, sorted_vocab, indices, stats, workers=None, budget=None):
+    """write and apply the merge of most_frequent; returns the number of words it changed"""
     outfile.write('{0} {1}\n'.format(*most_frequent))
-    update_pair_statistics(most_frequent, replace_pair(most_frequent, sorted_vocab, indices), stats, indices)
+    if workers is not None:
+        removed, pieces, changed = workers.merge(most_frequent, stats, budget is not None and budget.track_pieces)
+        if budget is not None:
+            budget.update(most_frequent, removed, pieces)
+    else:
+        changes = replace_pair(most_frequent, sorted_vocab, indices)
+        if budget is not None:
+            budget.update_changes(most_frequent, changes)
+        update_pair_statistics(most_frequent, changes, stats, indices)
+        changed = len(changes)
     stats[most_frequent] = 0
+    return changed
 
 
 def prune_stats(stats, big_stats, threshold):
@@ -243,26 +585,121 @@ def prune_stats(stats, big_stats, threshold):
                 big_stats[item] = freq
 
 
-def main_args(args, infile, outfile, is_dict):
+def args_cache(args):
+    from artifact_cache import ArtifactCache
+    return ArtifactCache(args.cache_dir, args.cache_size << 20) if args.cache_dir else None
+
+
+def main_args(args, infile, outfile, is_dict, cache=None):
     return main(infile, outfile, num_symbols=args.symbols, min_frequency=args.min_frequency,
                 verbose=args.verbose, is_dict=is_dict, version01=args.version01,
                 forcecodes=args.forcecodes, grepforcecodes=args.grepforcecodes,
-                mincount=args.mincount, unkchar=args.unkchar)
+                mincount=args.mincount, unkchar=args.unkchar, cache=cache, num_workers=args.learn_workers,
+                target_tokens_per_word=args.target_tokens_per_word, target_vocab_size=args.target_vocab_size,
+                trace=args.trace, merge_log=args.merge_log, out_of_core=args.out_of_core,
+                dev=args.dev, dev_every=args.dev_every, dict_sorted=args.dict_sorted,
+                keep_vocab=args.vocab is not None)
 
 
-def main(infile, outfile, num_symbols, min_frequency=2, verbose=False, is_dict=False, version01=False, forcecodes=None, grepforcecodes=None, mincount=1, unkchar=u'\uFDEA'):
+def main(infile, outfile, num_symbols, min_frequency=2, verbose=False, is_dict=False, version01=False, forcecodes=None, grepforcecodes=None, mincount=1, unkchar=u'\uFDEA', cache=None, num_workers=1,
+         target_tokens_per_word=None, target_vocab_size=None, trace=None, merge_log=None, out_of_core=None,
+         dev=None, dev_every=1000, dict_sorted=False, keep_vocab=True):
     """Learn num_symbols BPE operations from vocabulary, and write to outfile.
+
+    With an ArtifactCache, codes learned before from the same word counts and
+    options are written instead of learning them again. With num_workers > 1
+    (python 3.8+), merges are applied by merge_workers.MergeWorkers processes.
+    Learning stops early once a target of TokenBudget is reached; trace gets
+    its table. merge_log gets the records read by merge_log.py. With
+    out_of_core (a directory), the words and pair index are in
+    disk_vocab.DiskVocab files there. dev (held-out text, or a dict of word
+    counts) is segmented along (see DevSet) and reported every dev_every
+    merges. dict_sorted: see dict_blocks.
+
+    Returns the vocabulary (word counts), except when out_of_core learns from a
+    dictionary file (is_dict) without keep_vocab: then the file is streamed to
+    the DiskVocab files without building the vocabulary, and None is returned.
     """
 
+    # (out of core, a dictionary is streamed to the word files instead of read into a dict)
+    stream = out_of_core is not None and is_dict and not keep_vocab and not isinstance(infile, dict)
+    if stream:
+        vocab = None
+        items = iter_dict_vocabulary(infile, mincount, dict_sorted)
+        if getattr(infile, 'name', '<stdin>') == '<stdin>':
+            cache = None
+    else:
+        vocab = infile if isinstance(infile, dict) else get_vocabulary(infile, is_dict, mincount, dict_sorted)
+        items = vocab.items()
+
+    if cache is not None:
+        from artifact_cache import vocab_fingerprint, file_fingerprint
+        fingerprint = 'file ' + file_fingerprint(infile.name) + ' sorted %s' % dict_sorted if stream else vocab_fingerprint(vocab)
+        key = cache.key('codes', fingerprint, num_symbols, min_frequency, version01,
+                        file_fingerprint(forcecodes), grepforcecodes, mincount, unkchar,
+                        target_tokens_per_word, target_vocab_size)
+        # (a trace, merge log or dev report needs the learning to run)
+        codes = cache.get(key, 'codes') if trace is None and merge_log is None and dev is None else None
+        if codes is not None:
+            sys.stderr.write("bpe codes found in cache %s\n" % cache.path(key, 'codes'))
+            outfile.write(codes)
+            return vocab
+        cached_outfile, outfile = outfile, io.StringIO()
+
+    import apply_bpe
+    load_kernels()
+
     # version 0.2 changes the handling of the end-of-word token ('</w>');
     # version numbering allows bckward compatibility
     apply_bpe.write_header(outfile, (0, 1 if version01 else 2))
 
-    vocab = infile if isinstance(infile, Counter) else get_vocabulary(infile, is_dict)
-    endword = '</w>'
-    sorted_vocab = sorted([(tuple(x)+(endword,) if version01 else tuple(x[:-1])+(x[-1]+endword,) , y) for (x,y) in vocab.items()], key=lambda x: x[1], reverse=True)
-
-    stats, indices = get_pair_statistics(sorted_vocab, unkchar)
+    if out_of_core is not None:
+        import disk_vocab
+        # (the order of the words does not matter for the codes)
+        sorted_vocab = disk_vocab.DiskVocab(((tuple(x)+(endword,) if version01 else tuple(x[:-1])+(x[-1]+endword,), y) for (x,y) in items),
+                                            out_of_core)
+    else:
+        sorted_vocab = sorted([(tuple(x)+(endword,) if version01 else tuple(x[:-1])+(x[-1]+endword,) , y) for (x,y) in vocab.items()], key=lambda x: x[1], reverse=True)
+
+    log = None
+    if merge_log is not None:
+        from merge_log import MergeLog
+        log = MergeLog(merge_log)
+        log.write(dict(type='header', version=[0, 1 if version01 else 2], symbols=num_symbols, min_frequency=min_frequency,
+                       words=len(sorted_vocab), tokens=sum(freq for word, freq in sorted_vocab)))
+
+    budget = None
+    if target_tokens_per_word is not None or target_vocab_size is not None or trace is not None or dev is not None:
+        budget = TokenBudget(sorted_vocab, target_tokens_per_word, target_vocab_size, trace, track_pieces=dev is not None)
+
+    if dev is not None:
+        dev = DevSet(dev if isinstance(dev, dict) else get_vocabulary(dev), version01)
+
+    def report_dev(ncodes):
+        tokens, ratio, unseen = dev.report(budget.pieces)
+        sys.stderr.write('dev: {0} codes, {1} tokens ({2:.4f} per word), {3:.2%} not in training segmentation\n'.format(
+            ncodes, tokens, ratio, unseen))
+        if log is not None:
+            log.write(dict(type='dev', codes=ncodes, tokens=tokens, tokens_per_word=ratio, unseen=unseen))
+
+    if num_workers < 0:
+        from multiprocessing import cpu_count
+        num_workers = cpu_count()
+    if num_workers > 1 and not merge_workers.available():
+        sys.stderr.write("parallel learning needs python 3.8+; learning in one process\n")
+        num_workers = 1
+    if num_workers > 1 and out_of_core is not None:
+        sys.stderr.write("out-of-core learning is in one process\n")
+        num_workers = 1
+    workers = None
+    if num_workers > 1:
+        workers = merge_workers.MergeWorkers(sorted_vocab, unkchar, num_workers)
+        stats, indices = workers.stats, None
+        sorted_vocab = None
+    elif out_of_core is not None:
+        stats, indices = disk_vocab.get_pair_statistics(sorted_vocab, unkchar)
+    else:
+        stats, indices = get_pair_statistics(sorted_vocab, unkchar)
     big_stats = copy.deepcopy(stats)
     # threshold is inspired by Zipfian assumption, but should only affect speed
     threshold = max(stats.values()) / 10
@@ -273,6 +710,7 @@ def main(infile, outfile, num_symbols, min_frequency=2, verbose=False, is_dict=F
         def matchcode(pair, grep):
             return True if grep is None else grep.match(pair[0]) and grep.match(pair[1])
         if grep is not None:
+            import re
             if isinstance(grep, str):
                 if not grep.startswith('^'):
                     grep = r'^' + grep
@@ -284,23 +722,42 @@ def main(infile, outfile, num_symbols, min_frequency=2, verbose=False, is_dict=F
         first = True
         stats = dict()
         for line in forcecodes:
-            if not (first and line.startswith(versionheaderbegin)):
+            if not (first and apply_bpe.version_line(line)):
                 a, b = line.strip().split()
                 pair = (a, b)
                 if matchcode(pair, grep):
                     if verbose and grep:
                         sys.stderr.write("grepforcecodes: %s %s\n" % pair)
-                    do_pair(pair, outfile, sorted_vocab, indices, big_stats)
+                    freq = big_stats.get(pair, 0)
+                    changed = do_pair(pair, outfile, sorted_vocab, indices, big_stats, workers, budget)
+                    if trace is not None:
+                        budget.write_trace('forced', pair, freq)
+                    if dev is not None:
+                        dev.merge(pair)
+                    if log is not None:
+                        log.write(dict(type='merge', rank=ncodes, pair=pair, frequency=freq, words=changed,
+                                       forced=True, threshold=threshold, rebuilt=False))
                     ncodes += 1
             first = False
         sys.stderr.write("forcecodes: added an additional %s --forcecodes\n (in addition to --num-symbols=%s)\n" % (ncodes, num_symbols))
 
+    if dev is not None:
+        report_dev(ncodes)
+
+    stop = 'symbols'
     for i in range(num_symbols):
+        reached = budget is not None and budget.reached()
+        if reached:
+            sys.stderr.write('{0}. Stopping\n'.format(reached))
+            stop = reached
+            break
+
         if stats:
             most_frequent = max(stats, key=lambda x: (stats[x], x))
 
         # we probably missed the best pair because of pruning; go back to full statistics
-        if not stats or (i and stats[most_frequent] < threshold):
+        rebuilt = not stats or (i and stats[most_frequent] < threshold)
+        if rebuilt:
             prune_stats(stats, big_stats, threshold)
             stats = copy.deepcopy(big_stats)
             most_frequent = max(stats, key=lambda x: (stats[x], x))
@@ -310,15 +767,39 @@ def main(infile, outfile, num_symbols, min_frequency=2, verbose=False, is_dict=F
 
         if stats[most_frequent] < min_frequency:
             sys.stderr.write('no pair has frequency >= {0}. Stopping\n'.format(min_frequency))
+            stop = 'min_frequency'
             break
 
         if verbose:
             sys.stderr.write('pair {0}: {1} {2} -> {1}{2} (frequency {3})\n'.format(i, most_frequent[0], most_frequent[1], stats[most_frequent]))
-        do_pair(most_frequent, outfile, sorted_vocab, indices, stats)
+        freq = stats[most_frequent]
+        changed = do_pair(most_frequent, outfile, sorted_vocab, indices, stats, workers, budget)
+        if trace is not None:
+            budget.write_trace(i, most_frequent, freq)
+        if log is not None:
+            log.write(dict(type='merge', rank=ncodes, pair=most_frequent, frequency=freq, words=changed,
+                           forced=False, threshold=threshold, rebuilt=bool(rebuilt)))
         ncodes += 1
+        if dev is not None:
+            dev.merge(most_frequent)
+            if not ncodes % dev_every:
+                report_dev(ncodes)
         if not i % 100:
             prune_stats(stats, big_stats, threshold)
+    if workers is not None:
+        workers.close()
+    if out_of_core is not None:
+        indices.close()
+        sorted_vocab.close()
+    if dev is not None and ncodes % dev_every:
+        report_dev(ncodes)
+    if log is not None:
+        log.write(dict(type='end', codes=ncodes, stop=stop))
+        log.close()
     sys.stderr.write("bpe codes has %s pairs\n" % (ncodes,))
+    if cache is not None:
+        cache.put(key, 'codes', outfile.getvalue())
+        cached_outfile.write(outfile.getvalue())
     return vocab
 
 
@@ -339,13 +820,23 @@ if __name__ == '__main__':
 
     # read/write files as UTF-8
     if args.input.name != '<stdin>':
-        args.input = codecs.open(args.input.name, encoding='utf-8')
+        # (an io text file reads lines in blocks; codecs readers read them one by one)
+        args.input = open(args.input.name, encoding='utf-8')
     if args.output.name != '<stdout>':
         args.output = codecs.open(args.output.name, 'w', encoding='utf-8')
-
-    vocab = main_args(args, args.input, args.output, args.dict_input)
-    if len(args.vocab):
+    if args.trace:
+        args.trace = codecs.open(args.trace.name, 'w', encoding='utf-8')
+    if args.merge_log:
+        args.merge_log = codecs.open(args.merge_log.name, 'w', encoding='utf-8')
+    if args.dev:
+        args.dev = codecs.open(args.dev.name, encoding='utf-8')
+
+    cache = args_cache(args)
+    vocab = main_args(args, args.input, args.output, args.dict_input, cache)
+    if args.vocab:
+        import apply_bpe
+        args.output.flush()
         with codecs.open(args.output.name, encoding='UTF-8') as codes:
             bpe = apply_bpe.BPE(codes, args.separator, None)
-            # apply BPE to each training corpus and get vocabulary
-            make_vocabularies(bpe, vocab, args.vocab)
+            # apply BPE to the training corpus and get vocabulary
+            make_vocabularies(bpe, [vocab], args.vocab, args.num_workers, cache)
@@ -16,7 +16,6 @@ from __future__ import unicode_literals
 
 import sys
 import codecs
-import argparse
 from collections import Counter
 
 import learn_bpe
@@ -24,9 +23,12 @@ import apply_bpe
 
 # hack for python2/3 compatibility
 from io import open
-argparse.open = open
 
 def create_parser():
+    import argparse
+    # hack for python2/3 compatibility
+    argparse.open = open
+
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter,
         description="learn BPE-based word segmentation")
@@ -59,23 +61,30 @@ if __name__ == '__main__':
         sys.exit(1)
 
     # read/write files as UTF-8
-    args.input = [codecs.open(f.name, encoding='UTF-8') for f in args.input]
+    args.input = [open(f.name, encoding='UTF-8') for f in args.input]
     args.vocab = [codecs.open(f.name, 'w', encoding='UTF-8') for f in args.vocab]
+    if args.trace:
+        args.trace = codecs.open(args.trace.name, 'w', encoding='UTF-8')
+    if args.merge_log:
+        args.merge_log = codecs.open(args.merge_log.name, 'w', encoding='UTF-8')
+    if args.dev:
+        args.dev = codecs.open(args.dev.name, encoding='UTF-8')
 
     # get combined vocabulary of all input texts
     full_vocab = Counter()
     vocabs = []
     for f in args.input:
-        v = learn_bpe.get_vocabulary(f, args.dict_input, args.mincount)
+        v = learn_bpe.get_vocabulary(f, args.dict_input, args.mincount, args.dict_sorted)
         vocabs.append(v)
         full_vocab += v
         f.seek(0)
 
     # learn BPE on combined vocabulary
+    cache = learn_bpe.args_cache(args)
     with codecs.open(args.output.name, 'w', encoding='UTF-8') as output:
-        learn_bpe.main_args(args, full_vocab, output, is_dict=True)
+        learn_bpe.main_args(args, full_vocab, output, is_dict=True, cache=cache)
 
     with codecs.open(args.output.name, encoding='UTF-8') as codes:
         bpe = apply_bpe.BPE(codes, args.separator, None)
         # apply BPE to each training corpus and get vocabulary
-        learn_bpe.make_vocabularies(bpe, vocabs, args.vocab)
+        learn_bpe.make_vocabularies(bpe, vocabs, args.vocab, args.num_workers, cache)
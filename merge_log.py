@@ -0,0 +1,167 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Author: Jonathan Graehl
+
+"""Query the merge log of learn_bpe.py --merge-log, without learning again.
+
+The log is JSON lines: a "header" record (codes version, options and the
+training words), one "merge" record per code in codes file order (rank, pair,
+frequency, number of words changed, whether it was forced, and the pruning
+threshold in effect and whether the statistics were rebuilt from the full
+statistics for it), "dev" records of --dev reports, and an "end" record
+(number of codes and why learning stopped). It is written by a background thread, so the learning loop only
+queues each record.
+
+    merge_log.py LOG created SUBWORD   the merges that built SUBWORD (from its characters)
+    merge_log.py LOG curve [--step N]  rank, frequency and words changed of every N'th merge
+    merge_log.py LOG codes             the codes file (same as learn_bpe.py --output)
+    merge_log.py LOG summary           header, end, and the number of rebuilds and forced codes
+"""
+
+from __future__ import unicode_literals
+
+import sys
+import codecs
+
+# hack for python2/3 compatibility
+from io import open
+
+endword = '</w>'
+
+
+class MergeLog(object):
+    """Writes records (dicts) as JSON lines to the text file out from a background thread"""
+
+    def __init__(self, out):
+        import threading
+        try:
+            import queue
+        except ImportError:
+            import Queue as queue
+        self.out = out
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, record):
+        self.queue.put(record)
+
+    def run(self):
+        import json
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            self.out.write(json.dumps(record, ensure_ascii=False, sort_keys=True) + '\n')
+
+    def close(self):
+        """write the remaining records (the file is not closed)"""
+        self.queue.put(None)
+        self.thread.join()
+        self.out.flush()
+
+
+def read_log(path):
+    """(header, list of merge records, end record or None) of the log at path"""
+    import json
+    header, merges, end = None, [], None
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            kind = record['type']
+            if kind == 'header':
+                header = record
+            elif kind == 'merge':
+                merges.append(record)
+            elif kind == 'end':
+                end = record
+    return header, merges, end
+
+
+def created(merges, subword):
+    """the merge records that build subword (or subword</w>) from characters, in rank order"""
+    made = {}
+    for m in merges:
+        merged = ''.join(m['pair'])
+        if merged not in made:
+            made[merged] = m
+    found = {}
+    todo = [s for s in (subword, subword + endword) if s in made]
+    while todo:
+        m = made[todo.pop()]
+        if m['rank'] not in found:
+            found[m['rank']] = m
+            todo.extend(x for x in m['pair'] if x in made)
+    return [found[rank] for rank in sorted(found)]
+
+
+def curve(merges, step=1):
+    """(rank, frequency, words) of every step'th merge"""
+    return [(m['rank'], m['frequency'], m['words']) for m in merges[::step]]
+
+
+def write_codes(header, merges, out):
+    import apply_bpe
+    apply_bpe.write_header(out, header['version'])
+    for m in merges:
+        out.write('{0} {1}\n'.format(*m['pair']))
+
+
+def create_parser():
+    import argparse
+    # hack for python2/3 compatibility
+    argparse.open = open
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+    parser.add_argument('log', metavar='LOG', help="learn_bpe.py --merge-log output")
+    parser.add_argument('query', choices=['created', 'curve', 'codes', 'summary'])
+    parser.add_argument('subword', nargs='?', metavar='SUBWORD', help="subword for 'created'")
+    parser.add_argument('--step', type=int, default=1, metavar='N',
+                        help="for 'curve', every N'th merge (default: %(default)s)")
+    return parser
+
+
+def main(args, out):
+    header, merges, end = read_log(args.log)
+    if args.query == 'created':
+        if args.subword is None:
+            sys.stderr.write("'created' needs a SUBWORD\n")
+            return 2
+        for m in created(merges, args.subword):
+            out.write('{0}\t{1} {2}\t{3}\t{4}\n'.format(m['rank'], m['pair'][0], m['pair'][1], m['frequency'], m['words']))
+    elif args.query == 'curve':
+        out.write('rank\tfrequency\twords\n')
+        for rank, freq, words in curve(merges, args.step):
+            out.write('{0}\t{1}\t{2}\n'.format(rank, freq, words))
+    elif args.query == 'codes':
+        write_codes(header, merges, out)
+    else:
+        for key in sorted(header):
+            if key != 'type':
+                out.write('{0}\t{1}\n'.format(key, header[key]))
+        out.write('merges\t{0}\n'.format(len(merges)))
+        out.write('forced\t{0}\n'.format(sum(1 for m in merges if m['forced'])))
+        out.write('rebuilds\t{0}\n'.format(sum(1 for m in merges if m['rebuilt'])))
+        if end is not None:
+            out.write('stop\t{0}\n'.format(end['stop']))
+    return 0
+
+
+if __name__ == '__main__':
+
+    # python 2/3 compatibility
+    if sys.version_info < (3, 0):
+        sys.stderr = codecs.getwriter('UTF-8')(sys.stderr)
+        sys.stdout = codecs.getwriter('UTF-8')(sys.stdout)
+    else:
+        sys.stderr = codecs.getwriter('UTF-8')(sys.stderr.buffer)
+        sys.stdout = codecs.getwriter('UTF-8')(sys.stdout.buffer)
+
+    parser = create_parser()
+    args = parser.parse_args()
+    if sys.version_info < (3, 0) and args.subword is not None:
+        args.subword = args.subword.decode('UTF-8')
+    sys.exit(main(args, sys.stdout))
@@ -0,0 +1,255 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Author: Jonathan Graehl
+
+"""Parallel merges for learn_bpe.py --learn-workers (Python 3.8+).
+
+The sorted vocabulary is encoded as symbol ids into one shared memory block
+(word offsets, frequencies and symbols), from which each worker process reads
+every num_workers'th word. A worker keeps its words and the pair -> word index
+for them, so for each merge it replaces the pair in its own affected words and
+returns the resulting pair frequency changes; the coordinator adds them to its
+statistics. Workers update exactly as replace_pair + update_pair_statistics do
+for their words, and every touched pair is reported (even if its total change
+is 0, since learn_bpe.prune_stats treats present and absent pairs differently),
+so the learned codes are identical to serial learning.
+"""
+
+from __future__ import unicode_literals
+
+from array import array
+from collections import defaultdict
+
+from pair_index import PairIndex
+
+
+def available():
+    try:
+        from multiprocessing import shared_memory
+        return True
+    except ImportError:
+        return False
+
+
+def pair_statistics(words, unk):
+    """learn_bpe.get_pair_statistics for words of symbol ids"""
+    stats = defaultdict(int)
+    indices = PairIndex()
+    for i, (word, freq) in enumerate(words):
+        pairs = zip(word, word[1:])
+        if unk in word:
+            pairs = [(prev, sym) for prev, sym in pairs if sym != unk and prev != unk]
+        for pair in pairs:
+            stats[pair] += freq
+            indices[pair].append(i)
+    return stats, indices
+
+
+def replace_pair(pair, new, words, indices):
+    """learn_bpe.replace_pair for words of symbol ids; new is the id of the merged symbol"""
+    first, second = pair
+    changes = []
+    for j in indices.words(pair):
+        word, freq = words[j]
+        new_word = []
+        i = 0
+        n = len(word)
+        while i < n:
+            if i < n - 1 and word[i] == first and word[i+1] == second:
+                new_word.append(new)
+                i += 2
+            else:
+                new_word.append(word[i])
+                i += 1
+        new_word = tuple(new_word)
+        words[j] = (new_word, freq)
+        changes.append((j, new_word, word, freq))
+    return changes
+
+
+def update_pair_statistics(pair, new, changed, stats, indices):
+    """learn_bpe.update_pair_statistics for words of symbol ids"""
+    stats[pair] = 0
+    indices.reset(pair)
+    add = indices.add
+    first, second = pair
+    for j, word, old_word, freq in changed:
+        n = len(old_word)
+        i = 0
+        while True:
+            try:
+                i = old_word.index(first, i)
+            except ValueError:
+                break
+            if i < n-1 and old_word[i+1] == second:
+                if i:
+                    prev = old_word[i-1:i+1]
+                    stats[prev] -= freq
+                    add(prev, j, -1)
+                if i < n-2:
+                    if old_word[i+2] != first or i >= n-3 or old_word[i+3] != second:
+                        nex = old_word[i+1:i+3]
+                        stats[nex] -= freq
+                        add(nex, j, -1)
+                i += 2
+            else:
+                i += 1
+
+        n = len(word)
+        i = 0
+        while True:
+            try:
+                i = word.index(new, i)
+            except ValueError:
+                break
+            if i:
+                prev = word[i-1:i+1]
+                stats[prev] += freq
+                add(prev, j, 1)
+            if i < n-1 and word[i+1] != new:
+                nex = word[i:i+2]
+                stats[nex] += freq
+                add(nex, j, 1)
+            i += 1
+
+
+def word_pieces(word, endword):
+    """(symbol, 1 if followed by a separate end-of-word symbol else 0) for the output pieces of word"""
+    if len(word) > 1 and word[-1] == endword:
+        return [(x, 0) for x in word[:-2]] + [(word[-2], 1)]
+    return [(x, 0) for x in word]
+
+
+def pieces_delta(changes, endword):
+    delta = defaultdict(int)
+    for j, word, old_word, freq in changes:
+        for piece in word_pieces(old_word, endword):
+            delta[piece] -= freq
+        for piece in word_pieces(word, endword):
+            delta[piece] += freq
+    return delta
+
+
+def layout(n, nsymbols):
+    """byte offsets of the offsets, frequencies and symbols arrays, and the total size"""
+    freqs = 8 * (n + 1)
+    symbols = freqs + 8 * n
+    return freqs, symbols, symbols + 4 * nsymbols
+
+
+def worker(conn, name, n, nsymbols, k, num_workers, unk, endword):
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=name)
+    freqs_at, symbols_at, end = layout(n, nsymbols)
+    buf = shm.buf
+    offsets = buf[:freqs_at].cast('q')
+    freqs = buf[freqs_at:symbols_at].cast('q')
+    symbols = buf[symbols_at:end].cast('i')
+    words = [(tuple(symbols[offsets[j]:offsets[j+1]]), freqs[j]) for j in range(k, n, num_workers)]
+    del offsets, freqs, symbols, buf
+    shm.close()
+
+    stats, indices = pair_statistics(words, unk)
+    conn.send(dict(stats))
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        first, second, new, track_pieces = message
+        pair = (first, second)
+        delta = defaultdict(int)
+        changes = replace_pair(pair, new, words, indices)
+        update_pair_statistics(pair, new, changes, delta, indices)
+        removed = sum(freq * (len(old_word) - len(word)) for j, word, old_word, freq in changes)
+        conn.send((dict(delta), removed, dict(pieces_delta(changes, endword)) if track_pieces else None, len(changes)))
+    conn.close()
+
+
+class MergeWorkers(object):
+
+    def __init__(self, sorted_vocab, unkchar, num_workers, endword='</w>'):
+        """start num_workers processes for sorted_vocab (list of (symbols, frequency)); self.stats are its pair statistics"""
+        from multiprocessing import Process, Pipe, shared_memory
+        self.symbols = []
+        self.ids = {}
+        self.endword = endword
+        offsets = array(str('q'), [0])
+        freqs = array(str('q'))
+        symbols = array(str('i'))
+        for word, freq in sorted_vocab:
+            symbols.extend(self.id(x) for x in word)
+            offsets.append(len(symbols))
+            freqs.append(freq)
+        n = len(freqs)
+        nsymbols = len(symbols)
+        unk = self.ids.get(unkchar, -1)
+        endword_id = self.ids.get(endword, -1)
+
+        freqs_at, symbols_at, end = layout(n, nsymbols)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, end))
+        try:
+            shm.buf[:freqs_at] = offsets.tobytes()
+            shm.buf[freqs_at:symbols_at] = freqs.tobytes()
+            shm.buf[symbols_at:end] = symbols.tobytes()
+            del offsets, freqs, symbols
+            self.conns = []
+            self.processes = []
+            for k in range(num_workers):
+                conn, child = Pipe()
+                p = Process(target=worker, args=(child, shm.name, n, nsymbols, k, num_workers, unk, endword_id))
+                p.daemon = True
+                p.start()
+                child.close()
+                self.conns.append(conn)
+                self.processes.append(p)
+            self.stats = defaultdict(int)
+            self.add(self.stats, [conn.recv() for conn in self.conns])
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def id(self, symbol):
+        try:
+            return self.ids[symbol]
+        except KeyError:
+            self.ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            return self.ids[symbol]
+
+    def add(self, stats, deltas):
+        symbols = self.symbols
+        for delta in deltas:
+            for (first, second), d in delta.items():
+                stats[symbols[first], symbols[second]] += d
+
+    def merge(self, pair, stats, track_pieces=False):
+        """replace pair in all words, updating stats as learn_bpe.update_pair_statistics would.
+        returns the decrease of the number of symbols (weighted by word frequency),
+        with track_pieces the change of the counts of output pieces (see learn_bpe.TokenBudget),
+        and the number of words changed"""
+        first, second = pair
+        if first not in self.ids or second not in self.ids:
+            # (a --forcecodes pair of unknown symbols) occurs in no word
+            stats[pair] = 0
+            return 0, {}, 0
+        message = (self.ids[first], self.ids[second], self.id(first + second), track_pieces)
+        for conn in self.conns:
+            conn.send(message)
+        stats[pair] = 0
+        results = [conn.recv() for conn in self.conns]
+        self.add(stats, [delta for delta, _, _, _ in results])
+        pieces = defaultdict(int)
+        if track_pieces:
+            symbols = self.symbols
+            endword = self.endword
+            for _, _, delta, _ in results:
+                for (x, final), d in delta.items():
+                    pieces[symbols[x] + endword if final else symbols[x]] += d
+        return sum(removed for _, removed, _, _ in results), pieces, sum(changed for _, _, _, changed in results)
+
+    def close(self):
+        for conn in self.conns:
+            conn.send(None)
+            conn.close()
+        for p in self.processes:
+            p.join()
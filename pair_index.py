@@ -0,0 +1,73 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Author: Jonathan Graehl
+
+"""Compact index from symbol pairs to the words they occur in, for learn_bpe.py.
+
+Each pair has an array of word ids (a posting list) instead of a dict of word
+id -> count: an occurrence added to word j appends j, one removed appends ~j
+(i.e. -j-1), so the number of occurrences of the pair in word j is the number
+of j minus the number of ~j entries. A list is compacted (to the net counts of
+its words) when it has doubled in length since it was last compacted, so
+memory stays proportional to the occurrences, and one array (8 bytes per
+entry, no int objects) per pair replaces a dict per pair.
+"""
+
+from array import array
+from collections import Counter
+
+# lists shorter than this are not compacted
+MIN_COMPACT = 64
+
+
+class PairIndex(dict):
+    """dict of pair -> posting list (array of word ids, see above)"""
+
+    def __init__(self):
+        dict.__init__(self)
+        # length of each list (of MIN_COMPACT or more entries) at which it is compacted next
+        self.limits = {}
+
+    def __missing__(self, pair):
+        postings = self[pair] = array('l')
+        return postings
+
+    def add(self, pair, j, delta):
+        """add delta (1 or -1) to the number of occurrences of pair in word j"""
+        postings = self[pair]
+        postings.append(j if delta > 0 else ~j)
+        n = len(postings)
+        if n >= MIN_COMPACT and n >= self.limits.get(pair, MIN_COMPACT):
+            self.compact(pair)
+
+    def reset(self, pair):
+        """forget all occurrences of pair"""
+        self.pop(pair, None)
+        self.limits.pop(pair, None)
+
+    def counts(self, pair):
+        """Counter of word id -> number of occurrences of pair (may be <= 0: removals are
+        counted as learn_bpe.update_pair_statistics made them)"""
+        counts = Counter(self.get(pair, ()))
+        for e in [e for e in counts if e < 0]:
+            counts[~e] -= counts.pop(e)
+        return counts
+
+    def words(self, pair):
+        """ids of the words in which pair occurs (count >= 1), in order of first addition"""
+        postings = self.get(pair)
+        if not postings:
+            return []
+        if min(postings) >= 0:
+            return list(dict.fromkeys(postings))
+        return [j for j, count in self.counts(pair).items() if count > 0]
+
+    def compact(self, pair, counts=None):
+        if counts is None:
+            counts = self.counts(pair)
+        compacted = array('l', counts.elements())
+        for j, count in counts.items():
+            if count < 0:
+                compacted.extend(array('l', [~j]) * -count)
+        self[pair] = compacted
+        self.limits[pair] = max(MIN_COMPACT, 2 * len(compacted))
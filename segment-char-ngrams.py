@@ -6,13 +6,17 @@ from __future__ import unicode_literals, division
 
 import sys
 import codecs
-import argparse
+
+from segment_char_ngrams import CharNgramSegmenter, read_shortlist, segment_blocks
 
 # hack for python2/3 compatibility
 from io import open
-argparse.open = open
 
 def create_parser():
+    import argparse
+    # hack for python2/3 compatibility
+    argparse.open = open
+
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter,
         description="segment rare words into character n-grams")
@@ -38,6 +42,9 @@ def create_parser():
     parser.add_argument(
         '--separator', '-s', type=str, default='@@', metavar='STR',
         help="Separator between non-final subword units (default: '%(default)s'))")
+    parser.add_argument(
+        '--num-workers', type=int, default=1,
+        help="Number of processes segmenting blocks of input lines. If -1, use multiprocessing.cpu_count() (default: %(default)s)")
 
     return parser
 
@@ -64,19 +71,5 @@ if __name__ == '__main__':
     if args.output.name != '<stdout>':
         args.output = codecs.open(args.output.name, 'w', encoding='utf-8')
 
-    vocab = [line.split()[0] for line in args.vocab if len(line.split()) == 2]
-    vocab = dict((y,x) for (x,y) in enumerate(vocab))
-
-    for line in args.input:
-      for word in line.split():
-        if word not in vocab or vocab[word] > args.shortlist:
-          i = 0
-          while i*args.n < len(word):
-            args.output.write(word[i*args.n:i*args.n+args.n])
-            i += 1
-            if i*args.n < len(word):
-              args.output.write(args.separator)
-            args.output.write(' ')
-        else:
-          args.output.write(word + ' ')
-      args.output.write('\n')
+    segmenter = CharNgramSegmenter(read_shortlist(args.vocab, args.shortlist), args.n, args.separator)
+    segment_blocks(segmenter, args.input, args.output, args.num_workers)
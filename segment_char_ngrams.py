@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Author: Rico Sennrich
+
+"""Segment rare words into character n-grams (used by segment-char-ngrams.py).
+
+Words in the vocabulary shortlist are left alone, all others are split into
+character n-grams joined by the separator.
+"""
+
+from __future__ import unicode_literals, division
+
+from itertools import islice
+
+
+def read_shortlist(vocab_file, shortlist):
+    """set of words of vocab_file (produced by get_vocab.py) with rank <= shortlist"""
+    vocab = [line.split()[0] for line in vocab_file if len(line.split()) == 2]
+    # a word listed more than once has the rank of its last occurrence
+    ranks = dict((y,x) for (x,y) in enumerate(vocab))
+    return set(w for w, rank in ranks.items() if rank <= shortlist)
+
+
+class CharNgramSegmenter(object):
+
+    def __init__(self, shortlist, n=2, separator='@@'):
+        self.shortlist = shortlist
+        self.n = n
+        self.separator = separator
+        self.cache = {}
+
+    def word(self, word):
+        """output for a single word, including the space that follows it"""
+        try:
+            return self.cache[word]
+        except KeyError:
+            pass
+        if word in self.shortlist:
+            out = word + ' '
+        else:
+            n = self.n
+            out = (self.separator + ' ').join(word[i:i+n] for i in range(0, len(word), n)) + ' '
+        self.cache[word] = out
+        return out
+
+    def segment(self, line):
+        """segment single line (whitespace-tokenized string); returns the output line including newline"""
+        word = self.word
+        return ''.join([word(w) for w in line.split()]) + '\n'
+
+    def segment_lines(self, lines):
+        return ''.join([self.segment(line) for line in lines])
+
+
+# segmenter of a segment_blocks worker process (set once per process by the pool initializer)
+worker_segmenter = None
+
+
+def init_worker(segmenter):
+    global worker_segmenter
+    worker_segmenter = segmenter
+
+
+def segment_lines_job(lines):
+    return worker_segmenter.segment_lines(lines)
+
+
+def blocks(infile, block_lines=10000):
+    """yield lists of up to block_lines lines of infile"""
+    while True:
+        block = list(islice(infile, block_lines))
+        if not block:
+            break
+        yield block
+
+
+def segment_blocks(segmenter, infile, out, num_workers=1, block_lines=10000):
+    """segment infile to out, one write per block of lines. with num_workers > 1,
+    blocks are segmented by a process pool and written in input order"""
+    from multiprocessing import Pool, cpu_count
+    if num_workers < 0:
+        num_workers = cpu_count()
+    if num_workers <= 1:
+        for block in blocks(infile, block_lines):
+            out.write(segmenter.segment_lines(block))
+        return
+    pool = Pool(num_workers, init_worker, (segmenter,))
+    try:
+        # at most 2 blocks per worker in flight, so memory does not grow with the input
+        while True:
+            batch = list(islice(blocks(infile, block_lines), 2 * num_workers))
+            if not batch:
+                break
+            for text in pool.map(segment_lines_job, batch):
+                out.write(text)
+    finally:
+        pool.close()
+        pool.join()
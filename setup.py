@@ -0,0 +1,16 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Build the optional compiled kernels (_bpe_accel) next to the scripts:
+
+    python setup.py build_ext --inplace
+
+The scripts work without it, using the pure Python functions.
+"""
+
+from setuptools import setup, Extension
+
+setup(
+    name='subword-nmt-accel',
+    ext_modules=[Extension('_bpe_accel', ['_bpe_accel.c'])],
+)
@@ -0,0 +1,303 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Author: Jonathan Graehl
+
+"""Learn BPE codes and vocabularies for a set of language files, and apply them,
+in one process (a replacement for subword.sh).
+
+Files are named like subword.sh expects: the language is the second
+'.'-separated field of the basename (train.en), and train.en is segmented to
+OUTDIR/train.bpe.en. Codes go to PREFIX.codes (PREFIX.codes.LANG with
+--separate), vocabularies to PREFIX.LANG.vcb.
+
+Word counts, codes and the BPE object stay in memory from learning to
+application, and all files are counted and segmented concurrently. A stage is
+skipped if PREFIX.manifest.json shows its outputs were made from inputs and
+options with the same content hash, and the outputs are unchanged since.
+
+Usage like subword.sh (defaults come from the same environment variables):
+
+    subword.py --create --apply train.en train.de
+    subword.py dev.en dev.de
+"""
+
+from __future__ import unicode_literals
+
+import sys
+import os
+import io
+import codecs
+import copy
+import hashlib
+from collections import Counter
+
+import learn_bpe
+import apply_bpe
+
+
+def create_parser():
+    import argparse
+    env = os.environ.get
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+
+    parser.add_argument('files', nargs='+', metavar='PATH', help="language files, e.g. train.en train.de")
+    parser.add_argument('--create', '-c', action='store_true', help="learn codes and vocabularies from the files")
+    parser.add_argument('--apply', '-a', action='store_true', help="with --create, also segment the files (without --create, they are always segmented)")
+    parser.add_argument('--separate', metavar='XY', default=None, choices=['00', '01', '10', '11'],
+                        help="as subword.sh -cXY: learn codes per language instead of jointly, with '#version: 0.1' "
+                             "models for the first language (X) and/or the others (Y): 01 for the others, 10 for "
+                             "the first, 00 for all; 11 learns joint codes as without --separate")
+    parser.add_argument('--prefix', default=env('subword_prefix', os.path.join(env('subword_dir', '.'), 'subword')),
+                        help="prefix of codes and vocabulary files (default: $subword_prefix or $subword_dir/subword)")
+    parser.add_argument('--outdir', default=env('subword_outdir') or None,
+                        help="directory for segmented files (default: $subword_outdir or next to each input)")
+    parser.add_argument('--separator', default=env('sep', '__LW_SW__'), help="(default: $sep or %(default)s)")
+    parser.add_argument('--symbols', '-s', type=int, default=int(env('subwords', 50000)), help="(default: $subwords or %(default)s)")
+    parser.add_argument('--min-count', type=int, dest='mincount', default=int(env('mincount', 2)), help="(default: $mincount or %(default)s)")
+    parser.add_argument('--min-frequency', type=int, default=int(env('minfreq', 20)), help="(default: $minfreq or %(default)s)")
+    parser.add_argument('--vocabulary-threshold', type=int, default=int(env('unkfreq', 2)), help="(default: $unkfreq or %(default)s)")
+    parser.add_argument('--dict-input', action='store_true', default=bool(env('dict_input')),
+                        help="files are word count dictionaries (default: $dict_input)")
+    parser.add_argument('--tokenizer', default=env('tokenizer') or None, metavar='CMD',
+                        help="shell command filtering each file before it is segmented, run with $lang set (default: $tokenizer)")
+    parser.add_argument('--include-bpe', action='store_true', default=not env('exclude_bpe_basename', '1'),
+                        help="also segment files with .bpe in their name (default: skip them, unless $exclude_bpe_basename is empty)")
+    parser.add_argument('--num-workers', type=int, default=-1,
+                        help="processes for counting, vocabularies and applying; -1 for multiprocessing.cpu_count() (default: %(default)s)")
+    parser.add_argument('--unkchar', default='﷪', help="never participates in merges (default: U+FDEA)")
+    parser.add_argument('--force', '-f', action='store_true', help="rerun every stage even if up to date")
+    return parser
+
+
+def separate_version01(xy):
+    """None for joint codes, else whether the first and the other languages' separate codes
+    are version 0.1, for subword.sh -cXY (or --separate XY)"""
+    return {'00': (True, True), '01': (False, True), '10': (True, False)}.get(xy)
+
+
+def lang(path):
+    fields = os.path.basename(path).split('.')
+    return fields[1] if len(fields) > 1 else ''
+
+
+def bpe_output(path, outdir=None):
+    base = os.path.basename(path)
+    l = lang(path)
+    if base.endswith('.' + l):
+        base = base[:-len(l)-1]
+    return os.path.join(outdir or os.path.dirname(path), '%s.bpe.%s' % (base, l))
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def stage_key(params, inputs):
+    """content hash of a stage's options and input files"""
+    import json
+    h = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8'))
+    for path in inputs:
+        h.update(file_hash(path).encode('utf-8'))
+    return h.hexdigest()
+
+
+class Manifest(object):
+    """PREFIX.manifest.json: for each output file, the stage key it was made with and its own hash"""
+
+    def __init__(self, path, force=False):
+        self.path = path
+        self.outputs = {}
+        if not force and os.path.exists(path):
+            import json
+            with open(path) as f:
+                self.outputs = json.load(f)
+
+    def up_to_date(self, key, outputs):
+        for path in outputs:
+            entry = self.outputs.get(os.path.abspath(path))
+            if entry is None or entry['key'] != key or not os.path.exists(path) or file_hash(path) != entry['hash']:
+                return False
+        return True
+
+    def record(self, key, outputs):
+        import json
+        for path in outputs:
+            self.outputs[os.path.abspath(path)] = {'key': key, 'hash': file_hash(path)}
+        with open(self.path, 'w') as f:
+            json.dump(self.outputs, f, indent=1, sort_keys=True)
+
+
+def count_job(job):
+    path, dict_input, mincount = job
+    with io.open(path, encoding='UTF-8') as f:
+        return learn_bpe.get_vocabulary(f, dict_input, mincount)
+
+
+def map_jobs(func, jobs, num_workers, initializer=None, initargs=()):
+    """func over jobs, in order; in a process pool if num_workers > 1"""
+    num_workers = min(num_workers, len(jobs))
+    if num_workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [func(job) for job in jobs]
+    from multiprocessing import Pool
+    pool = Pool(num_workers, initializer, initargs)
+    try:
+        return pool.map(func, jobs, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+# BPE object and vocabulary sets of an apply_job worker (set by the pool initializer)
+worker_bpe = None
+worker_vocabs = None
+
+
+def init_apply_worker(bpe, vocabs):
+    global worker_bpe, worker_vocabs
+    worker_bpe = bpe
+    worker_vocabs = vocabs
+
+
+def read_tokenized(path, tokenizer, l):
+    if not tokenizer:
+        return codecs.open(path, encoding='UTF-8')
+    import subprocess
+    env = dict(os.environ, lang=l)
+    with open(path, 'rb') as f:
+        text = subprocess.check_output(tokenizer, shell=True, stdin=f, env=env)
+    return io.StringIO(text.decode('UTF-8'))
+
+
+def apply_job(job):
+    path, out_path, codes_name, l, tokenizer = job
+    bpe = copy.copy(worker_bpe[codes_name])
+    bpe.vocab = worker_vocabs[l]
+    bpe.cache = apply_bpe.SubwordCache()
+    with read_tokenized(path, tokenizer, l) as infile:
+        with codecs.open(out_path, 'w', encoding='UTF-8') as out:
+            for line in infile:
+                out.write(bpe.segment(line).strip())
+                out.write('\n')
+    return out_path
+
+
+class Pipeline(object):
+
+    def __init__(self, args):
+        self.args = args
+        if args.num_workers < 0:
+            from multiprocessing import cpu_count
+            args.num_workers = cpu_count()
+        self.manifest = Manifest(args.prefix + '.manifest.json', args.force)
+        self.langs = [lang(f) for f in args.files]
+        self.separate = separate_version01(args.separate)
+        self.bpe = {}
+        self.vocabs = {}
+
+    def codes_path(self, l):
+        return self.args.prefix + '.codes' + ('.' + l if self.separate else '')
+
+    def vocab_path(self, l):
+        return '%s.%s.vcb' % (self.args.prefix, l)
+
+    def learn_params(self):
+        args = self.args
+        return dict(stage='learn', separator=args.separator, symbols=args.symbols, mincount=args.mincount,
+                    min_frequency=args.min_frequency, dict_input=args.dict_input, separate=self.separate,
+                    unkchar=args.unkchar, langs=self.langs)
+
+    def learn(self):
+        """learn codes and write vocabularies (unless up to date), and load the BPE objects"""
+        args = self.args
+        outputs = sorted(set([self.codes_path(l) for l in self.langs] + [self.vocab_path(l) for l in self.langs]))
+        key = stage_key(self.learn_params(), args.files)
+        if self.manifest.up_to_date(key, outputs):
+            sys.stderr.write('up to date: %s\n' % ' '.join(outputs))
+            return self.load()
+        vocabs = map_jobs(count_job, [(f, args.dict_input, args.mincount) for f in args.files], args.num_workers)
+        if self.separate:
+            groups = [([v], [l]) for v, l in zip(vocabs, self.langs)]
+            first, others = self.separate
+            version01 = [first] + [others] * (len(groups) - 1)
+        else:
+            full_vocab = Counter()
+            for v in vocabs:
+                full_vocab += v
+            groups = [(vocabs, self.langs)]
+            version01 = [False]
+            vocabs = [full_vocab]
+        for (group, langs), full_vocab, v01 in zip(groups, vocabs, version01):
+            codes_path = self.codes_path(langs[0])
+            with codecs.open(codes_path, 'w', encoding='UTF-8') as output:
+                learn_bpe.main(full_vocab, output, args.symbols, args.min_frequency, is_dict=True,
+                               version01=v01, mincount=args.mincount, unkchar=args.unkchar)
+            with codecs.open(codes_path, encoding='UTF-8') as codes:
+                bpe = apply_bpe.BPE(codes, args.separator, None)
+            self.bpe[codes_path] = bpe
+            for l, bpevocab in zip(langs, learn_bpe.restricted_vocabularies(bpe, group, args.num_workers)):
+                with codecs.open(self.vocab_path(l), 'w', encoding='UTF-8') as out:
+                    learn_bpe.write_vocabulary(bpevocab, out)
+                # what apply_bpe.read_vocabulary_set would read back from the file
+                self.vocabs[l] = set(w for w, c in bpevocab.items() if c >= args.vocabulary_threshold)
+        self.manifest.record(key, outputs)
+
+    def load(self):
+        """load codes and vocabularies written by an earlier learn"""
+        args = self.args
+        for l in self.langs:
+            codes_path = self.codes_path(l)
+            if codes_path not in self.bpe:
+                with codecs.open(codes_path, encoding='UTF-8') as codes:
+                    self.bpe[codes_path] = apply_bpe.BPE(codes, args.separator, None)
+            with codecs.open(self.vocab_path(l), encoding='UTF-8') as vocab:
+                self.vocabs[l] = apply_bpe.read_vocabulary_set(vocab, args.vocabulary_threshold)
+
+    def apply(self):
+        args = self.args
+        if not self.bpe:
+            self.load()
+        jobs = []
+        keys = []
+        for f, l in zip(args.files, self.langs):
+            if not args.include_bpe and '.bpe' in os.path.basename(f):
+                continue
+            out_path = bpe_output(f, args.outdir)
+            codes_path = self.codes_path(l)
+            params = dict(stage='apply', separator=args.separator, threshold=args.vocabulary_threshold,
+                          tokenizer=args.tokenizer, lang=l)
+            key = stage_key(params, [f, codes_path, self.vocab_path(l)])
+            if self.manifest.up_to_date(key, [out_path]):
+                sys.stderr.write('up to date: %s\n' % out_path)
+                continue
+            jobs.append((f, out_path, codes_path, l, args.tokenizer))
+            keys.append(key)
+        for out_path, key in zip(map_jobs(apply_job, jobs, args.num_workers, init_apply_worker, (self.bpe, self.vocabs)), keys):
+            sys.stderr.write('%s\n' % out_path)
+            self.manifest.record(key, [out_path])
+
+
+def main(args):
+    pipeline = Pipeline(args)
+    if args.create:
+        pipeline.learn()
+    if args.apply or not args.create:
+        pipeline.apply()
+
+
+if __name__ == '__main__':
+    # python 2/3 compatibility
+    if sys.version_info < (3, 0):
+        sys.stderr = codecs.getwriter('UTF-8')(sys.stderr)
+    else:
+        sys.stderr = codecs.getwriter('UTF-8')(sys.stderr.buffer)
+
+    parser = create_parser()
+    main(parser.parse_args())
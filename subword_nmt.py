@@ -0,0 +1,51 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Author: Jonathan Graehl
+
+"""Run any of the subword-nmt scripts from one entry point:
+
+    subword_nmt.py COMMAND [ARGS...]
+
+is the same as running the COMMAND script with ARGS (e.g. subword_nmt.py
+apply-bpe -c codes is apply_bpe.py -c codes). Only the chosen script is loaded.
+"""
+
+import os
+import sys
+
+COMMANDS = [
+    ('learn-bpe', 'learn_bpe.py'),
+    ('apply-bpe', 'apply_bpe.py'),
+    ('get-vocab', 'get_vocab.py'),
+    ('learn-joint-bpe-and-vocab', 'learn_joint_bpe_and_vocab.py'),
+    ('bpe-subset', 'bpe_subset.py'),
+    ('segment-char-ngrams', 'segment-char-ngrams.py'),
+    ('subword', 'subword.py'),
+    ('chrf', 'chrF.py'),
+    ('merge-log', 'merge_log.py'),
+]
+
+
+def usage(out):
+    out.write(__doc__.lstrip() + '\ncommands:\n')
+    for command, script in COMMANDS:
+        out.write('    %-28s %s\n' % (command, script))
+
+
+def main(argv):
+    scripts = dict(COMMANDS)
+    if not argv or argv[0] not in scripts:
+        if argv and argv[0] in ('-h', '--help'):
+            usage(sys.stdout)
+            return 0
+        usage(sys.stderr)
+        return 2
+    import runpy
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), scripts[argv[0]])
+    sys.argv = [path] + argv[1:]
+    runpy.run_path(path, run_name='__main__')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import copy
+import io
+import random
+
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+
+import apply_bpe
+import learn_bpe
+
+
+def random_vocab(seed, n=300):
+    r = random.Random(seed)
+    # few letters, so that words repeat symbols (a b a b, a a a) and pairs overlap
+    words = [''.join(r.choice('abcab﷪') for _ in range(r.randint(1, 9))) for _ in range(n)]
+    return dict((w, r.randint(1, 50)) for w in words)
+
+
+def learn(vocab, version01, kernels):
+    update_pair_statistics, replace_pair = kernels
+    saved = learn_bpe.update_pair_statistics, learn_bpe.replace_pair
+    learn_bpe.update_pair_statistics, learn_bpe.replace_pair = update_pair_statistics, replace_pair
+    try:
+        out = io.StringIO()
+        learn_bpe.main(vocab, out, 60, min_frequency=1, version01=version01)
+        return out.getvalue()
+    finally:
+        learn_bpe.update_pair_statistics, learn_bpe.replace_pair = saved
+
+
+# (apply_bpe loads the compiled kernels on first use only)
+apply_bpe.load_kernels()
+
+
+@unittest.skipIf(apply_bpe.accel is None, "_bpe_accel not built (python setup.py build_ext --inplace)")
+class TestAccel(unittest.TestCase):
+
+    def test_learn(self):
+        for seed in range(5):
+            vocab = random_vocab(seed)
+            for version01 in (False, True):
+                py = learn(vocab, version01, (learn_bpe.update_pair_statistics_py, learn_bpe.replace_pair_py))
+                c = learn(vocab, version01, (apply_bpe.accel.update_pair_statistics, apply_bpe.accel.replace_pair))
+                self.assertEqual(py, c)
+
+    def test_pair_statistics(self):
+        vocab = sorted(((tuple(w), f) for w, f in random_vocab(7).items()), key=lambda x: x[1], reverse=True)
+        stats, indices = learn_bpe.get_pair_statistics(vocab, '﷪')
+        results = []
+        for replace_pair, update_pair_statistics in ((learn_bpe.replace_pair_py, learn_bpe.update_pair_statistics_py),
+                                                     (apply_bpe.accel.replace_pair, apply_bpe.accel.update_pair_statistics)):
+            v, s, i = list(vocab), copy.deepcopy(stats), copy.deepcopy(indices)
+            for pair in (('a', 'b'), ('a', 'a'), ('ab', 'ab'), ('c', 'ab')):
+                changes = replace_pair(pair, v, i)
+                update_pair_statistics(pair, changes, s, i)
+            results.append((v, dict(s), dict((k, list(x)) for k, x in i.items())))
+        self.assertEqual(results[0], results[1])
+
+    def test_apply_merges(self):
+        vocab = random_vocab(3)
+        for version01 in (False, True):
+            out = io.StringIO()
+            learn_bpe.main(vocab, out, 60, min_frequency=1, version01=version01)
+            out.seek(0)
+            bpe = apply_bpe.BPE(out)
+            for word in list(vocab) + ['', 'a', 'ab</w>', '</w>', 'x</w>y']:
+                if word or version01:
+                    self.assertEqual(apply_bpe.accel.apply_merges(word, bpe.bpe_codes, bpe.version),
+                                     apply_bpe.apply_merges_py(word, bpe.bpe_codes, bpe.version))
+
+    def test_bad_pair(self):
+        stats, indices = learn_bpe.get_pair_statistics([(('a', 'b'), 1)], '﷪')
+        for pair in ((), ('a',), ('a', 'b', 'c')):
+            self.assertRaises(ValueError, apply_bpe.accel.update_pair_statistics, pair, [], stats, indices)
+            self.assertRaises(ValueError, apply_bpe.accel.replace_pair, pair, [], indices)
+        self.assertRaises(TypeError, apply_bpe.accel.update_pair_statistics, ['a', 'b'], [], stats, indices)
+
+if __name__ == '__main__':
+    unittest.main()
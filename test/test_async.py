@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import io
+
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+
+import learn_bpe
+from apply_bpe import BPE
+
+try:
+    import asyncio
+    from async_bpe import AsyncBPE
+except (ImportError, SyntaxError):
+    AsyncBPE = None
+
+sentences = ['newest lower', 'widerUSA new', 'lowest newer  wider', '', 'new new newest']
+
+
+@unittest.skipIf(AsyncBPE is None, "needs python 3.7+")
+class TestAsyncBPE(unittest.TestCase):
+
+    def setUp(self):
+        out = io.StringIO()
+        learn_bpe.main({'lower': 5, 'lowest': 3, 'newer': 6, 'wider': 3, 'new': 2}, out, 10, min_frequency=1)
+        out.seek(0)
+        self.bpe = BPE(out, glossaries=['USA'])
+
+    def run_batches(self, sentences=sentences, **kwargs):
+        async def run():
+            async with AsyncBPE(self.bpe, **kwargs) as abpe:
+                first = await abpe.asegment_many(sentences)
+                second = await asyncio.gather(*[abpe.asegment(s) for s in sentences])
+                return first, second, abpe.metrics()
+        return asyncio.run(run())
+
+    def test_same_as_segment(self):
+        expected = [self.bpe.segment(s) for s in sentences]
+        for kwargs in ({}, {'processes': 2}):
+            first, second, metrics = self.run_batches(**kwargs)
+            self.assertEqual(first, expected)
+            self.assertEqual(second, expected)
+            self.assertEqual(metrics['requests'], 10)
+            self.assertEqual(metrics['batches'], 2)
+            self.assertEqual(metrics['batch_size_max'], 5)
+            # the second batch's words were all segmented by the first
+            self.assertEqual(metrics['word_misses'], 7)
+
+    def test_shared_thread_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        expected = [self.bpe.segment(s) for s in sentences]
+        self.bpe.cache.clear()
+        with ThreadPoolExecutor(4) as executor:
+            first, second, metrics = self.run_batches(sentences * 20, executor=executor, max_batch=3)
+        self.assertEqual(first, expected * 20)
+        self.assertEqual(second, expected * 20)
+
+    def test_max_words(self):
+        expected = [self.bpe.segment(s) for s in sentences]
+
+        async def run():
+            async with AsyncBPE(self.bpe, max_words=3, max_batch=1) as abpe:
+                first = await abpe.asegment_many(sentences)
+                second = await abpe.asegment_many(sentences)
+                return first, second, abpe
+        first, second, abpe = asyncio.run(run())
+        self.assertEqual(first, expected)
+        self.assertEqual(second, expected)
+        self.assertLessEqual(abpe.metrics()['cached_words'], 3)
+        self.assertLessEqual(len(abpe.bpe.cache), 3)
+        self.assertLessEqual(len(abpe.bpe.cache.outputs), 3)
+        self.assertGreater(abpe.bpe.cache.clears, 0)
+        # the caller's BPE object is not changed
+        self.assertIsNone(self.bpe.cache.max_words)
+        self.assertIs(abpe.bpe.bpe_codes, self.bpe.bpe_codes)
+
+    def test_max_batch(self):
+        # full batches don't wait for the window
+        metrics = self.run_batches(sentences[:4], max_batch=2, window=60)[2]
+        self.assertEqual(metrics['batches'], 4)
+
+if __name__ == '__main__':
+    unittest.main()
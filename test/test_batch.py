@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import io
+import random
+
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+
+import apply_bpe
+import learn_bpe
+from apply_bpe import BPE
+
+
+class TestBatchEncoding(unittest.TestCase):
+
+    def setUp(self):
+        r = random.Random(4)
+        # few letters, so that words repeat symbols and pairs overlap
+        self.words = list(set(''.join(r.choice('abcab﷪') for _ in range(r.randint(1, 12))) for _ in range(500)))
+        self.codes = {}
+        for version01 in (False, True):
+            out = io.StringIO()
+            learn_bpe.main(dict((w, r.randint(1, 50)) for w in self.words), out, 60, min_frequency=1, version01=version01)
+            self.codes[version01] = out.getvalue()
+
+    def test_apply_merges_batch(self):
+        for codes in self.codes.values():
+            bpe = BPE(io.StringIO(codes))
+            self.assertEqual(apply_bpe.apply_merges_batch(self.words, bpe.bpe_codes, bpe.version),
+                             [apply_bpe.apply_merges_py(w, bpe.bpe_codes, bpe.version) for w in self.words])
+
+    def test_cache_words(self):
+        apply_bpe.load_kernels()
+        saved = apply_bpe.accel
+        # (cache_words only encodes in batches without the compiled kernels)
+        apply_bpe.accel = None
+        try:
+            for codes in self.codes.values():
+                expected = [BPE(io.StringIO(codes), glossaries=['ca']).segment(w) for w in self.words]
+                bpe = BPE(io.StringIO(codes), glossaries=['ca'])
+                bpe.cache_words(self.words)
+                cached = len(bpe.cache)
+                self.assertEqual([bpe.segment(w) for w in self.words], expected)
+                self.assertEqual(len(bpe.cache), cached)
+        finally:
+            apply_bpe.accel = saved
+
+    def test_word_outputs(self):
+        codes = self.codes[False]
+        sentence = ' '.join(self.words)
+        bpe = BPE(io.StringIO(codes))
+        expected = bpe.segment(sentence)
+        self.assertEqual(len(bpe.cache.outputs), len(self.words))
+        self.assertEqual(bpe.segment(sentence), expected)
+        fresh = BPE(io.StringIO(codes))
+        self.assertEqual([bpe.pieces(w) for w in self.words], [fresh.pieces(w) for w in self.words])
+        # changed settings are not answered from the outputs of the old ones
+        bpe.set_glossaries(['ca'])
+        self.assertEqual(bpe.segment(sentence), BPE(io.StringIO(codes), glossaries=['ca']).segment(sentence))
+        bpe.set_glossaries()
+        self.assertEqual(bpe.segment(sentence), expected)
+        bpe.separator = '##'
+        self.assertEqual(bpe.segment(sentence), expected.replace('@@', '##'))
+
+    def test_empty_output(self):
+        # the word '</w>' merges into nothing, output as an empty token (uncached and cached)
+        bpe = BPE(io.StringIO('#version: 0.2\n< /\n</ w\n</w ></w>\n'))
+        self.assertEqual(bpe.segment('a </w> b'), 'a  b')
+        self.assertEqual(bpe.segment('a </w> b'), 'a  b')
+        self.assertEqual(bpe.pieces('</w>'), [''])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import io
+
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+
+import learn_bpe
+from apply_bpe import BPE, SubwordCache, ThresholdSweep, written, write_header, write_pair, read_vocabulary_set, read_vocabulary_counts
+
+
+def recursive_prereqs(bpe, vocab):
+    """BPE.prereqs before the merge DAG (recursive)"""
+    seen = set()
+    def prereqs2(s, pair):
+        seen.add(s)
+        prereqs(pair[0])
+        prereqs(pair[1])
+    def prereqs(s):
+        if len(s) > 1 and s not in seen:
+            seen.add(s)
+            pair = bpe.bpe_codes_reverse.get(s, None)
+            if pair is not None:
+                prereqs2(s, pair)
+    for ab, pair in bpe.bpe_codes_reverse.items():
+        if written(ab, bpe.separator) in vocab:
+            prereqs2(ab, pair)
+    return seen
+
+
+def recursive_subset(bpe, bpevocab):
+    """BPE.write_subset before the merge DAG"""
+    out = io.StringIO()
+    write_header(out, bpe.version)
+    pre = recursive_prereqs(bpe, bpevocab)
+    for pair, _ in bpe.ordered_codes():
+        ab = pair[0] + pair[1]
+        if written(ab, bpe.separator) in bpevocab or ab in pre:
+            write_pair(pair, out)
+    return out.getvalue()
+
+
+class TestVocabularyFilter(unittest.TestCase):
+
+    def test_merged_endword(self):
+        # '</w>' is itself a merged symbol, so splitting the empty rest of 'x</w>' must stop
+        codes = '#version: 0.1\n< /\n</ w\n</w >\nx </w>\n'
+        bpe = BPE(io.StringIO(codes), vocab=set(['y']))
+        self.assertEqual(bpe.segment('x'), 'x@@ ')
+
+
+class TestSubwordCache(unittest.TestCase):
+
+    def test_interning(self):
+        cache = SubwordCache()
+        cache['lower'] = ['low', 'er']
+        cache['low'] = ['low']
+        cache['newer'] = ['new', 'er']
+        # each distinct subword is stored once
+        self.assertEqual(cache.subwords, ['low', 'er', 'new'])
+        self.assertEqual(cache.words['low'], 0)
+        self.assertEqual(cache.words['newer'], (2, 1))
+        self.assertIs(cache.words['low'], cache.ids['low'])
+        self.assertEqual(cache['lower'], ['low', 'er'])
+        self.assertEqual(cache.get('low'), ['low'])
+        self.assertIn('newer', cache)
+        self.assertEqual(len(cache), 3)
+
+    def test_hits_and_misses(self):
+        cache = SubwordCache()
+        self.assertIsNone(cache.get('low'))
+        self.assertRaises(KeyError, cache.__getitem__, 'low')
+        self.assertNotIn('low', cache)
+        cache['low'] = ['low']
+        cache.get('low')
+        cache['low']
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+        # membership tests are not counted
+        'low' in cache
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_bpe_accounting(self):
+        bpe = BPE(io.StringIO('#version: 0.2\nl o\nlo w\ne r</w>\nlo w</w>\n'))
+        self.assertEqual(bpe.segment('lower lower low'), 'low@@ er low@@ er low')
+        self.assertEqual(len(bpe.cache), 2)
+        self.assertEqual(bpe.cache.subwords, ['low', 'er'])
+        # the second lower is found in the word outputs in front of the subword cache
+        self.assertEqual(bpe.cache.misses, 2)
+        self.assertEqual(bpe.cache.hits, 1)
+        bpe.cache.clear()
+        self.assertEqual((len(bpe.cache), bpe.cache.subwords, bpe.cache.outputs), (0, [], {}))
+
+    def test_max_words(self):
+        cache = SubwordCache(max_words=2)
+        for word in ('a', 'b', 'c'):
+            cache[word] = [word]
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.subwords, ['c'])
+        self.assertEqual(cache.clears, 1)
+
+    def test_output_clears(self):
+        # emptying the word outputs, for the bound or for new settings, is counted too
+        bpe = BPE(io.StringIO('#version: 0.2\nl o\nlo w\ne r</w>\nlo w</w>\n'), glossaries=['USA'], max_cache_words=2)
+        bpe.segment('low lower')
+        self.assertEqual(bpe.cache.clears, 0)
+        # (low is in the subword cache, but lowUSA is a third output)
+        self.assertEqual(bpe.segment('lowUSA'), 'low@@ USA')
+        self.assertEqual((len(bpe.cache), len(bpe.cache.outputs), bpe.cache.clears), (2, 1, 1))
+        bpe.set_glossaries(['US'])
+        self.assertEqual(bpe.segment('lowUSA'), 'low@@ US@@ A')
+        self.assertEqual(bpe.cache.clears, 2)
+
+
+class TestMergeDAG(unittest.TestCase):
+
+    def test_subsets_match_recursive(self):
+        corpus = ['low lower lowest newer newest widest wider',
+                  'new news low lowly slow slower slowest',
+                  'the lowest of the new and the widest of the slow']
+        for version01 in (False, True):
+            out = io.StringIO()
+            learn_bpe.main(learn_bpe.get_vocabulary(corpus), out, 40, min_frequency=1, version01=version01)
+            out.seek(0)
+            bpe = BPE(out)
+            bpevocabs = [learn_bpe.restricted_vocabulary(bpe, [line]) for line in corpus]
+            bpevocabs.append({})
+            outs = [io.StringIO() for _ in bpevocabs]
+            bpe.write_subsets(outs, bpevocabs)
+            for bpevocab, subset in zip(bpevocabs, outs):
+                expected = recursive_subset(bpe, bpevocab)
+                self.assertEqual(subset.getvalue(), expected)
+                single = io.StringIO()
+                bpe.write_subset(single, bpevocab)
+                self.assertEqual(single.getvalue(), expected)
+                merged = set(bpe.bpe_codes_reverse)
+                self.assertEqual(bpe.prereqs(bpevocab), recursive_prereqs(bpe, bpevocab) & merged)
+
+    def test_deep_chain(self):
+        # a a -> aa, aa a -> aaa, ...: deeper than the recursion limit
+        depth = 3 * sys.getrecursionlimit()
+        pairs = [('a' * i, 'a') for i in range(1, depth)]
+        bpe = BPE(io.StringIO('#version: 0.2\n' + ''.join('%s %s\n' % pair for pair in pairs)))
+        out = io.StringIO()
+        bpe.write_subset(out, set(['a' * depth + '@@']))
+        self.assertEqual(out.getvalue().split('\n')[1:-1], ['%s %s' % pair for pair in pairs])
+        # only the prefix of the chain a shorter word needs
+        subset = bpe.merge_dag().subset(set(['a' * 10 + '@@']))
+        self.assertEqual(subset, pairs[:9])
+
+
+class TestThresholdSweep(unittest.TestCase):
+
+    def test_same_as_threshold(self):
+        corpus = ['low lower lowest newer newest widest wider',
+                  'new news low lowly slow slower slowestUSA']
+        out = io.StringIO()
+        learn_bpe.main(learn_bpe.get_vocabulary(corpus), out, 25, min_frequency=1)
+        codes = out.getvalue()
+        bpe = BPE(io.StringIO(codes), glossaries=['USA'])
+        bpevocab = learn_bpe.restricted_vocabulary(bpe, corpus)
+        # (a word listed twice counts with its highest count, as in read_vocabulary_set)
+        vocab_text = ''.join('%s %s\n' % x for x in sorted(bpevocab.items())) + 'lowe@@ 1\n'
+        maxcount = max(bpevocab.values())
+        thresholds = [1, 2, 3, maxcount, maxcount + 1, 1000]
+        sweep = ThresholdSweep(bpe, read_vocabulary_counts(io.StringIO(vocab_text)), thresholds)
+        expected = [BPE(io.StringIO(codes), glossaries=['USA'], vocab=read_vocabulary_set(io.StringIO(vocab_text), t))
+                    for t in thresholds]
+        for line in corpus + ['unseen words lowish', '']:
+            self.assertEqual(sweep.segment_all(line), [e.segment(line) for e in expected])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import io
+import tempfile
+
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+
+import learn_bpe
+from apply_bpe import BPE, ByteSegmenter
+import type_table
+
+
+class TestByteSegmenter(unittest.TestCase):
+
+    def setUp(self):
+        out = io.StringIO()
+        learn_bpe.main({'lower': 5, 'lowest': 3, 'newer': 6, 'wider': 3, 'new': 2}, out, 10, min_frequency=1)
+        out.seek(0)
+        self.bpe = BPE(out, glossaries=['USA'])
+
+    def segment(self, text, block_size):
+        out = io.BytesIO()
+        ByteSegmenter(self.bpe, block_size).segment_file(io.BytesIO(text.encode('utf-8')), out)
+        return out.getvalue().decode('utf-8')
+
+    def test_same_as_text(self):
+        # the second text has only '\n' line breaks (the bytes-only path); the first also others
+        for text in ('newest  lower\n\nwiderUSA new lowest \u3000\nlow er\r\nnewer\tnew\n\x1cwider',
+                     'newest  lower\n\nwiderUSA new\xa0lowest \u3000\nnewer\tnew\nwider\n'):
+            expected = ''.join(self.bpe.segment(line).strip() + '\n' for line in text.splitlines())
+            for block_size in (1, 3, 7, 1 << 20):
+                self.assertEqual(self.segment(text, block_size), expected)
+
+    def test_type_table(self):
+        text = 'newest  lower\n\nwiderUSA new\xa0lowest \u3000\r\nnewer\tnew\nwider\n'.encode('utf-8')
+        expected = self.segment(text.decode('utf-8'), 1 << 20).encode('utf-8')
+        for num_workers in (1, 2):
+            table = io.BytesIO()
+            self.assertEqual(type_table.first_pass(self.bpe, io.BytesIO(text), table, num_workers, block_size=5), 8)
+            with tempfile.NamedTemporaryFile(delete=False) as f:
+                f.write(table.getvalue())
+            try:
+                out = io.BytesIO()
+                type_table.second_pass(type_table.read_table(f.name), io.BytesIO(text), out)
+            finally:
+                os.remove(f.name)
+            self.assertEqual(out.getvalue(), expected)
+        with self.assertRaises(KeyError):
+            type_table.second_pass({}, io.BytesIO(text), io.BytesIO())
+
+    def test_empty_segmentation(self):
+        # the word '</w>' can merge into nothing, which BPE.segment outputs as an empty token
+        self.bpe = BPE(io.StringIO('#version: 0.2\n< /\n</ w\n</w ></w>\n'))
+        self.assertEqual(self.segment('a </w> b\n', 1 << 20), 'a  b\n')
+
+if __name__ == '__main__':
+    unittest.main()
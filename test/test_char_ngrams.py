@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import io
+
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+
+from segment_char_ngrams import CharNgramSegmenter, read_shortlist, segment_blocks
+
+corpus = ['low lower lowest newer newest widest wider',
+          '',
+          'new news  low lowly slow slower slowest été',
+          'the lowest of the new and the widest of the slow']
+
+vocab_text = 'the 6\nlow 4\nof 2\nnew 3\nthe 1\nbad line here\nslow 1\n'
+
+
+def reference_segment(lines, vocab_file, shortlist, n, separator='@@'):
+    """output of segment-char-ngrams.py before CharNgramSegmenter"""
+    out = io.StringIO()
+    vocab = [line.split()[0] for line in vocab_file if len(line.split()) == 2]
+    vocab = dict((y,x) for (x,y) in enumerate(vocab))
+    for line in lines:
+      for word in line.split():
+        if word not in vocab or vocab[word] > shortlist:
+          i = 0
+          while i*n < len(word):
+            out.write(word[i*n:i*n+n])
+            i += 1
+            if i*n < len(word):
+              out.write(separator)
+            out.write(' ')
+        else:
+          out.write(word + ' ')
+      out.write('\n')
+    return out.getvalue()
+
+
+class TestCharNgrams(unittest.TestCase):
+
+    def test_same_as_reference(self):
+        for shortlist in (0, 1, 3, 10):
+            for n in (1, 2, 3):
+                expected = reference_segment(corpus, io.StringIO(vocab_text), shortlist, n)
+                segmenter = CharNgramSegmenter(read_shortlist(io.StringIO(vocab_text), shortlist), n)
+                self.assertEqual(segmenter.segment_lines(corpus), expected)
+                # (again, from the cache)
+                self.assertEqual(segmenter.segment_lines(corpus), expected)
+
+    def test_blocks_and_workers(self):
+        lines = [line + '\n' for line in corpus] * 25
+        segmenter = CharNgramSegmenter(read_shortlist(io.StringIO(vocab_text), 2), 2)
+        expected = reference_segment(lines, io.StringIO(vocab_text), 2, 2)
+        for num_workers in (1, 2):
+            for block_lines in (1, 7, 10000):
+                out = io.StringIO()
+                segment_blocks(segmenter, iter(lines), out, num_workers, block_lines)
+                self.assertEqual(out.getvalue(), expected)
+
+if __name__ == '__main__':
+    unittest.main()
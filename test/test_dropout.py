@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import io
+
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+
+from apply_bpe import BPE, Dropout
+
+codes = '''#version: 0.2
+l o
+lo w</w>
+e r</w>
+lo w
+n e
+ne w
+e s
+es t</w>
+'''
+
+sentences = ['low lower newest lowest', 'new news slow', 'a aa lol']
+
+
+class TestDropout(unittest.TestCase):
+
+    def setUp(self):
+        self.bpe = BPE(io.StringIO(codes))
+
+    def test_no_dropout_is_deterministic_bpe(self):
+        dropout = Dropout(self.bpe, 0)
+        for sentence in sentences:
+            self.assertEqual(dropout.segment(sentence), self.bpe.segment(sentence))
+
+    def test_full_dropout_is_characters(self):
+        dropout = Dropout(self.bpe, 1)
+        self.assertEqual(dropout.segment('lower'), 'l@@ o@@ w@@ e@@ r')
+
+    def test_epochs_are_reproducible(self):
+        dropout = Dropout(self.bpe, 0.5, seed=1)
+        first = dropout.segment_epoch(sentences * 10, epoch=0)
+        second = dropout.segment_epoch(sentences * 10, epoch=1)
+        self.assertNotEqual(first, second)
+        self.assertEqual(Dropout(self.bpe, 0.5, seed=1).segment_epoch(sentences * 10, epoch=0), first)
+        for a, b in zip(first, sentences * 10):
+            self.assertEqual(a.replace('@@ ', ''), b)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import io
+import json
+
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+
+import equivalence_check
+
+golden_path = os.path.join(currentdir, 'golden_outputs.json')
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "equivalence_check.py needs python 3.7+")
+class TestEquivalence(unittest.TestCase):
+
+    def test_engines_match_golden_references(self):
+        with io.open(golden_path, encoding='utf-8') as f:
+            golden = json.load(f)
+        digests, failures = equivalence_check.run_checks(golden['seed'], golden['lines'], golden['symbols'])
+        self.assertEqual(failures, [])
+        # (if a reference output changed on purpose: equivalence_check.py --save-golden test/golden_outputs.json)
+        self.assertEqual(digests, golden['digests'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import io
+import random
+from collections import Counter
+
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+
+import get_vocab
+from apply_bpe import line_blocks
+
+
+def zipf_text(seed, lines=400, types=300):
+    r = random.Random(seed)
+    words = ['w%d' % i for i in range(types)]
+    weights = [1.0 / (i + 1) for i in range(types)]
+    return ''.join(' '.join(r.choices(words, weights, k=r.randint(0, 15))) + '\n' for _ in range(lines)).encode('utf-8')
+
+
+@unittest.skipIf(sys.version_info < (3, 6), "random.choices needs python 3.6+")
+class TestCountRaw(unittest.TestCase):
+
+    def setUp(self):
+        self.text = zipf_text(1)
+        self.counts = Counter(self.text.split())
+
+    def blocks(self):
+        return line_blocks(io.BytesIO(self.text), 1 << 8)
+
+    def test_parallel_matches_serial(self):
+        serial = get_vocab.count_raw(self.blocks())
+        self.assertEqual(serial, self.counts)
+        self.assertEqual(get_vocab.count_raw(self.blocks(), num_workers=2), serial)
+
+    def test_max_types_error_bound(self):
+        n = sum(self.counts.values())
+        for max_types in (5, 20, 50):
+            bound = float(n) / (max_types + 1)
+            for num_workers in (1, 2):
+                counts = get_vocab.count_raw(self.blocks(), num_workers, max_types)
+                self.assertLessEqual(len(counts), 2 * max_types)
+                for w, c in self.counts.items():
+                    # every count is a lower bound within n/(K+1), so every type above that is kept
+                    self.assertLessEqual(counts.get(w, 0), c)
+                    self.assertGreaterEqual(counts.get(w, 0), c - bound)
+                    if c > bound:
+                        self.assertIn(w, counts)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import io
+import random
+import shutil
+import tempfile
+from collections import Counter
+
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+
+import learn_bpe
+from apply_bpe import BPE
+from artifact_cache import ArtifactCache
+import merge_workers
+import merge_log
+from pair_index import PairIndex
+
+corpus = ['low lower lowest newer newest widest wider',
+          'new news low lowly slow slower slowest',
+          'the lowest of the new and the widest of the slow']
+
+
+def learn_codes(vocab, num_symbols=30):
+    out = io.StringIO()
+    learn_bpe.main(vocab, out, num_symbols, min_frequency=1)
+    out.seek(0)
+    return out
+
+
+class TestRestrictedVocabularies(unittest.TestCase):
+
+    def setUp(self):
+        self.vocabs = [learn_bpe.get_vocabulary([line]) for line in corpus]
+        full_vocab = Counter()
+        for v in self.vocabs:
+            full_vocab += v
+        self.bpe = BPE(learn_codes(full_vocab))
+
+    def test_parallel_matches_serial(self):
+        serial = [learn_bpe.restricted_vocabulary(self.bpe, v) for v in self.vocabs]
+        parallel = learn_bpe.restricted_vocabularies(self.bpe, self.vocabs, num_workers=2, jobs_per_worker=2)
+        self.assertEqual(serial, parallel)
+        for s, p in zip(serial, parallel):
+            self.assertEqual(list(s.items()), list(p.items()))
+
+
+class TestDictVocabulary(unittest.TestCase):
+
+    def setUp(self):
+        self.vocab = learn_bpe.get_vocabulary(corpus)
+        self.lines = ['{0} {1}\n'.format(w, c) for w, c in sorted(self.vocab.items(), key=lambda x: (-x[1], x[0]))]
+        self.block_lines = learn_bpe.DICT_BLOCK_LINES
+        # (blocks of 3 lines, so the early stop and the sort check cross blocks)
+        learn_bpe.DICT_BLOCK_LINES = 3
+
+    def tearDown(self):
+        learn_bpe.DICT_BLOCK_LINES = self.block_lines
+
+    def test_unsorted(self):
+        lines = list(reversed(self.lines))
+        self.assertEqual(learn_bpe.get_vocabulary(io.StringIO(''.join(lines)), True), self.vocab)
+        expected = dict((w, c) for w, c in self.vocab.items() if c >= 2)
+        self.assertEqual(learn_bpe.get_vocabulary(iter(lines), True, 2), expected)
+
+    def test_sorted(self):
+        for mincount in (1, 2, 3, 10):
+            expected = dict((w, c) for w, c in self.vocab.items() if c >= mincount)
+            self.assertEqual(learn_bpe.get_vocabulary(iter(self.lines), True, mincount, dict_sorted=True), expected)
+
+    def test_sorted_stops_reading(self):
+        lines = iter(self.lines + ['not a dictionary line\n'])
+        learn_bpe.get_vocabulary(lines, True, 2, dict_sorted=True)
+        # (only the block holding the first count below 2 was read)
+        self.assertEqual(len(list(lines)), len(self.lines) + 1 - 3 * (sum(c >= 2 for c in self.vocab.values()) // 3 + 1))
+
+    def test_sorted_checks_order(self):
+        lines = self.lines[:4] + ['uncommon 1000\n'] + self.lines[4:]
+        self.assertRaises(ValueError, learn_bpe.get_vocabulary, iter(lines), True, 1, True)
+
+
+@unittest.skipUnless(merge_workers.available(), "needs multiprocessing.shared_memory (python 3.8+)")
+class TestPairIndex(unittest.TestCase):
+
+    def test_counts_match_dict_index(self):
+        r = random.Random(2)
+        index = PairIndex()
+        expected = {}
+        for _ in range(5000):
+            pair = r.choice([('a', 'b'), ('b', 'c'), ('c', 'a')])
+            j = r.randint(0, 20)
+            delta = r.choice((1, 1, -1))
+            index.add(pair, j, delta)
+            counts = expected.setdefault(pair, {})
+            counts[j] = counts.get(j, 0) + delta
+        for pair, counts in expected.items():
+            # (compaction drops words with count 0)
+            self.assertEqual(dict((j, c) for j, c in index.counts(pair).items() if c), dict((j, c) for j, c in counts.items() if c))
+            self.assertEqual(sorted(index.words(pair)), sorted(j for j, c in counts.items() if c > 0))
+            self.assertLess(len(index[pair]), 5000)
+        index.reset(('a', 'b'))
+        self.assertEqual(index.words(('a', 'b')), [])
+
+
+class TestMergeWorkers(unittest.TestCase):
+
+    def learn(self, vocab, num_workers, version01=False):
+        out = io.StringIO()
+        learn_bpe.main(vocab, out, 200, min_frequency=1, version01=version01, num_workers=num_workers)
+        return out.getvalue()
+
+    def test_parallel_matches_serial(self):
+        r = random.Random(1)
+        # few letters (and the unknown character), so that pairs overlap and repeat within words
+        vocab = dict((''.join(r.choice('abcab\ufdea') for _ in range(r.randint(1, 12))), r.randint(1, 50)) for _ in range(500))
+        for version01 in (False, True):
+            serial = self.learn(vocab, 1, version01)
+            for num_workers in (2, 3):
+                self.assertEqual(self.learn(vocab, num_workers, version01), serial)
+
+
+class TestOutOfCore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_same_codes(self):
+        r = random.Random(3)
+        vocab = dict((''.join(r.choice('abcab\ufdea') for _ in range(r.randint(1, 12))), r.randint(1, 50)) for _ in range(500))
+        for version01 in (False, True):
+            codes = []
+            for out_of_core in (None, self.directory):
+                out = io.StringIO()
+                learn_bpe.main(vocab, out, 200, min_frequency=1, version01=version01, out_of_core=out_of_core)
+                codes.append(out.getvalue())
+            self.assertEqual(codes[0], codes[1])
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_streamed_dictionary(self):
+        import count_file
+        r = random.Random(4)
+        vocab = dict((''.join(r.choice('abcab\ufdea') for _ in range(r.randint(1, 12))), r.randint(1, 50)) for _ in range(500))
+        text = os.path.join(self.directory, 'vocab.txt')
+        with io.open(text, 'w', encoding='utf-8') as f:
+            f.write(''.join('{0} {1}\n'.format(w, c) for w, c in vocab.items()))
+        binary = os.path.join(self.directory, 'vocab.counts')
+        with open(binary, 'wb') as f:
+            count_file.write_counts(vocab.items(), f)
+        work = os.path.join(self.directory, 'work')
+        os.mkdir(work)
+        for mincount in (1, 10):
+            expected = io.StringIO()
+            learn_bpe.main(dict((w, c) for w, c in vocab.items() if c >= mincount), expected, 200, min_frequency=1)
+            for path in (text, binary):
+                with io.open(path, encoding='utf-8') as infile:
+                    out = io.StringIO()
+                    # (the counts go straight to the word files, never into a dict)
+                    self.assertIsNone(learn_bpe.main(infile, out, 200, min_frequency=1, is_dict=True, mincount=mincount,
+                                                     out_of_core=work, keep_vocab=False))
+                self.assertEqual(out.getvalue(), expected.getvalue())
+        self.assertEqual(os.listdir(work), [])
+
+
+class TestTokenBudget(unittest.TestCase):
+
+    def setUp(self):
+        self.vocab = learn_bpe.get_vocabulary(corpus)
+
+    def tokens(self, codes):
+        bpe = BPE(codes)
+        return sum(len(bpe.segment(line).split()) for line in corpus)
+
+    def test_trace_tokens(self):
+        for version01 in (False, True):
+            out, trace = io.StringIO(), io.StringIO()
+            learn_bpe.main(self.vocab, out, 30, min_frequency=1, version01=version01, trace=trace)
+            out.seek(0)
+            rows = [line.split('\t') for line in trace.getvalue().splitlines()[1:]]
+            self.assertEqual(len(rows), 31)
+            self.assertEqual(int(rows[0][3]), sum(len(w) * c for w, c in self.vocab.items()))
+            self.assertEqual(int(rows[-1][3]), self.tokens(out))
+
+    def test_target_tokens_per_word(self):
+        out = io.StringIO()
+        learn_bpe.main(self.vocab, out, 1000, min_frequency=1, target_tokens_per_word=2)
+        merges = len(out.getvalue().splitlines()) - 1
+        out.seek(0)
+        words = sum(self.vocab.values())
+        self.assertLessEqual(self.tokens(out), 2 * words)
+        fewer = io.StringIO()
+        learn_bpe.main(self.vocab, fewer, merges - 1, min_frequency=1)
+        fewer.seek(0)
+        self.assertGreater(self.tokens(fewer), 2 * words)
+
+    def pieces(self, codes):
+        """the distinct subword units of apply_bpe.py's segmentation of the training words"""
+        bpe = BPE(codes)
+        return len(set(x for word in self.vocab for x in bpe.segment(word).split()))
+
+    def test_target_vocab_size(self):
+        for version01 in (False, True):
+            trace = io.StringIO()
+            learn_bpe.main(self.vocab, io.StringIO(), 1000, min_frequency=1, version01=version01, trace=trace)
+            sizes = [int(line.split('\t')[5]) for line in trace.getvalue().splitlines()[1:]]
+            # (every size the vocabulary grows to while learning)
+            for target in range(sizes[0] + 1, max(sizes) + 1):
+                out, trace = io.StringIO(), io.StringIO()
+                learn_bpe.main(self.vocab, out, 1000, min_frequency=1, version01=version01, target_vocab_size=target, trace=trace)
+                merges = len(out.getvalue().splitlines()) - 1
+                out.seek(0)
+                size = self.pieces(out)
+                self.assertEqual(int(trace.getvalue().splitlines()[-1].split('\t')[5]), size)
+                # the first number of merges whose segmentation has the target size
+                self.assertGreaterEqual(size, target)
+                for fewer in range(merges):
+                    codes = io.StringIO()
+                    learn_bpe.main(self.vocab, codes, fewer, min_frequency=1, version01=version01)
+                    codes.seek(0)
+                    self.assertLess(self.pieces(codes), target)
+
+
+class TestMergeLog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.vocab = learn_bpe.get_vocabulary(corpus)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_replay_and_queries(self):
+        path = os.path.join(self.directory, 'log')
+        out = io.StringIO()
+        with io.open(path, 'w', encoding='utf-8') as log:
+            learn_bpe.main(self.vocab, out, 30, min_frequency=1, merge_log=log)
+        header, merges, end = merge_log.read_log(path)
+        self.assertEqual(header['words'], len(self.vocab))
+        self.assertEqual(end['codes'], 30)
+        replayed = io.StringIO()
+        merge_log.write_codes(header, merges, replayed)
+        self.assertEqual(replayed.getvalue(), out.getvalue())
+        made = merge_log.created(merges, 'lowest')
+        self.assertEqual(''.join(made[-1]['pair']), 'lowest</w>')
+        self.assertEqual(sorted(m['rank'] for m in made), [m['rank'] for m in made])
+        self.assertEqual([f for _, f, _ in merge_log.curve(merges)], [m['frequency'] for m in merges])
+
+
+class TestDevSet(unittest.TestCase):
+
+    dev = ['the lowliest newt is slower and wider', 'sloth news of the newest widow']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.vocab = learn_bpe.get_vocabulary(corpus)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_tokens_match_apply_bpe(self):
+        import json
+        for version01 in (False, True):
+            path = os.path.join(self.directory, 'log')
+            out = io.StringIO()
+            with io.open(path, 'w', encoding='utf-8') as log:
+                learn_bpe.main(self.vocab, out, 30, min_frequency=1, version01=version01, merge_log=log,
+                               dev=learn_bpe.get_vocabulary(self.dev), dev_every=7)
+            plain = io.StringIO()
+            learn_bpe.main(self.vocab, plain, 30, min_frequency=1, version01=version01)
+            self.assertEqual(out.getvalue(), plain.getvalue())
+            with io.open(path, encoding='utf-8') as log:
+                reports = [r for r in map(json.loads, log) if r['type'] == 'dev']
+            self.assertEqual([r['codes'] for r in reports], [0, 7, 14, 21, 28, 30])
+            out.seek(0)
+            bpe = BPE(out)
+            pieces = [x for line in self.dev for x in bpe.segment(line).split()]
+            self.assertEqual(reports[0]['tokens'], sum(len(w) for line in self.dev for w in line.split()))
+            self.assertEqual(reports[-1]['tokens'], len(pieces))
+            self.assertGreater(reports[-1]['unseen'], 0)
+
+
+class TestArtifactCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.vocab = learn_bpe.get_vocabulary(corpus)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def learn(self, cache, num_symbols=30):
+        out = io.StringIO()
+        learn_bpe.main(self.vocab, out, num_symbols, min_frequency=1, cache=cache)
+        return out.getvalue()
+
+    def test_cached_codes_match(self):
+        cache = ArtifactCache(self.directory)
+        codes = self.learn(None)
+        self.assertEqual(self.learn(cache), codes)
+        self.assertEqual(len(cache.entries()), 1)
+        self.assertEqual(self.learn(cache), codes)
+        self.assertEqual(len(cache.entries()), 1)
+        self.assertNotEqual(self.learn(cache, 10), codes)
+        self.assertEqual(len(cache.entries()), 2)
+
+    def test_eviction(self):
+        cache = ArtifactCache(self.directory, max_bytes=1)
+        self.learn(cache)
+        self.learn(cache, 10)
+        self.assertEqual(len(cache.entries()), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import io
+import os
+import random
+import shutil
+import tempfile
+
+import sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+
+import apply_bpe
+import learn_bpe
+from bpe_registry import BPERegistry, cache_bytes
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        vocab = {'lower': 5, 'lowest': 3, 'newer': 6, 'wider': 3, 'new': 2}
+        out = io.StringIO()
+        learn_bpe.main(vocab, out, 10, min_frequency=1)
+        self.codes = out.getvalue()
+        for name in ('a', 'b'):
+            with io.open(os.path.join(self.dir, name), 'w', encoding='utf-8') as f:
+                f.write(self.codes)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_segment(self):
+        registry = BPERegistry()
+        registry.register('a', os.path.join(self.dir, 'a'))
+        registry.register('b', os.path.join(self.dir, 'b'), separator='##')
+        self.assertFalse(registry.stats()['a']['loaded'])
+        bpe = apply_bpe.BPE(io.StringIO(self.codes))
+        sentence = 'newest lower wider'
+        self.assertEqual(registry.segment('a', sentence), bpe.segment(sentence))
+        self.assertEqual(registry.segment('b', sentence), bpe.segment(sentence).replace('@@', '##'))
+        # identical codes files share one table
+        self.assertIs(registry.get('a').bpe_codes, registry.get('b').bpe_codes)
+        self.assertEqual(len(registry.tables), 1)
+        registry.segment('a', sentence)
+        stats = registry.stats()['a']
+        self.assertTrue(stats['shared_codes'])
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['hits'], 3)
+
+    def test_budget(self):
+        registry = BPERegistry(memory_budget=0)
+        registry.register('a', os.path.join(self.dir, 'a'))
+        registry.register('b', os.path.join(self.dir, 'b'))
+        registry.segment('a', 'lower')
+        registry.segment('b', 'lower')
+        stats = registry.stats()
+        self.assertFalse(stats['a']['loaded'])
+        self.assertTrue(stats['b']['loaded'])
+        self.assertEqual(stats['a']['misses'], 1)
+        registry.segment('a', 'lower')
+        stats = registry.stats()
+        self.assertEqual(stats['a']['loads'], 2)
+        self.assertFalse(stats['b']['loaded'])
+        self.assertEqual(len(registry.tables), 1)
+
+    def test_memory_tracking(self):
+        registry = BPERegistry()
+        registry.register('a', os.path.join(self.dir, 'a'))
+        vocab = os.path.join(self.dir, 'vocab')
+        with io.open(vocab, 'w', encoding='utf-8') as f:
+            f.write('low@@ 2\ner 3\nnew@@ 1\n')
+        registry.register('b', os.path.join(self.dir, 'b'), vocab=vocab)
+        for sentence in ('newest lower', 'wider newer lowest', 'a b c d', 'newest lower'):
+            for name in ('a', 'b'):
+                registry.segment(name, sentence)
+                # the incremental estimate is the one counted from scratch
+                models = [m for m in registry.models.values() if m.bpe is not None]
+                full = sum(cache_bytes(m.bpe.cache) + m.vocab_bytes for m in models) + sum(t[2] for t in registry.tables.values())
+                self.assertEqual(registry.memory(), full)
+        registry.get('a').cache.clear()
+        registry.segment('a', 'lower')
+        self.assertEqual(registry.models['a'].bytes, cache_bytes(registry.get('a').cache))
+        registry.unload('a')
+        registry.unload('b')
+        self.assertEqual(registry.memory(), 0)
+
+    def test_budget_on_segment(self):
+        registry = BPERegistry()
+        registry.register('a', os.path.join(self.dir, 'a'))
+        registry.register('b', os.path.join(self.dir, 'b'))
+        registry.segment('b', 'lower')
+        registry.segment('a', 'lower')
+        # within budget after the loads; only a's cache growth exceeds it
+        registry.memory_budget = registry.memory() + 1000
+        registry.segment('a', ' '.join('w%d' % i for i in range(100)))
+        stats = registry.stats()
+        self.assertTrue(stats['a']['loaded'])
+        self.assertFalse(stats['b']['loaded'])
+
+    def check_memory(self, registry):
+        models = [m for m in registry.models.values() if m.bpe is not None]
+        full = sum(cache_bytes(m.bpe.cache) + m.vocab_bytes for m in models) + sum(t[2] for t in registry.tables.values())
+        self.assertEqual(registry.memory(), full)
+
+    def test_bounded_cache(self):
+        registry = BPERegistry()
+        registry.register('a', os.path.join(self.dir, 'a'), glossaries=['USA'])
+        registry.get('a').cache.max_words = 3
+        r = random.Random(1)
+        words = ['lower', 'newest', 'wider', 'lowUSA', 'newUSA', 'wide', 'new', 'USA']
+        bpe = apply_bpe.BPE(io.StringIO(self.codes), glossaries=['USA'])
+        for _ in range(50):
+            sentence = ' '.join(r.choice(words) for _ in range(r.randint(1, 4)))
+            self.assertEqual(registry.segment('a', sentence), bpe.segment(sentence))
+            self.check_memory(registry)
+        self.assertGreater(registry.get('a').cache.clears, 0)
+
+    def test_set_glossaries(self):
+        registry = BPERegistry()
+        registry.register('a', os.path.join(self.dir, 'a'), glossaries=['USA'])
+        registry.segment('a', 'lowerUSA newest wider')
+        self.check_memory(registry)
+        # (new settings empty the word outputs)
+        registry.get('a').set_glossaries(['US'])
+        self.assertEqual(registry.segment('a', 'lowerUSA'), apply_bpe.BPE(io.StringIO(self.codes), glossaries=['US']).segment('lowerUSA'))
+        self.check_memory(registry)
+
+if __name__ == '__main__':
+    unittest.main()
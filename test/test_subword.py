@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import io
+import shutil
+import subprocess
+import tempfile
+
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+
+import subword
+
+texts = {'en': 'low lower lowest newer newest widest wider\nnew news low lowly slow slower slowest\n',
+         'de': 'neu neuer neueste niedrig niedriger\nweit weiter weiteste neu neuer\n'}
+
+
+def read(path):
+    with io.open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.files = []
+        for l in ('en', 'de'):
+            path = os.path.join(self.dir, 'train.' + l)
+            with io.open(path, 'w', encoding='utf-8') as f:
+                f.write(texts[l])
+            self.files.append(path)
+        self.prefix = os.path.join(self.dir, 'subword')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def options(self):
+        return ['--separator', '@@', '--symbols', '20', '--min-count', '1', '--min-frequency', '1',
+                '--vocabulary-threshold', '1']
+
+    def run_pipeline(self, *args):
+        parser = subword.create_parser()
+        subword.main(parser.parse_args(['--create', '--apply', '--prefix', self.prefix, '--num-workers', '1'] +
+                                       self.options() + list(args) + self.files))
+
+    def script(self, name, *args):
+        subprocess.check_call([sys.executable, os.path.join(parentdir, name)] + list(args), stderr=subprocess.DEVNULL)
+
+    def test_joint_matches_scripts(self):
+        self.run_pipeline()
+        # what subword.sh -c runs
+        codes = os.path.join(self.dir, 'codes')
+        vocabs = [os.path.join(self.dir, 'vocab.' + l) for l in ('en', 'de')]
+        self.script('learn_joint_bpe_and_vocab.py', '--input', *(self.files + ['-o', codes, '--write-vocabulary'] + vocabs +
+                    ['--separator', '@@', '--symbols', '20', '--min-count', '1', '--min-frequency', '1']))
+        self.assertEqual(read(self.prefix + '.codes'), read(codes))
+        for path, vocab, l in zip(self.files, vocabs, ('en', 'de')):
+            self.assertEqual(read('%s.%s.vcb' % (self.prefix, l)), read(vocab))
+            out = os.path.join(self.dir, 'expected.' + l)
+            self.script('apply_bpe.py', '--codes', codes, '--vocabulary', vocab, '--vocabulary-threshold', '1',
+                        '--separator', '@@', '--input', path, '--output', out)
+            self.assertEqual(read(os.path.join(self.dir, 'train.bpe.' + l)), read(out))
+
+    def test_separate(self):
+        # as subword.sh -cXY: 01 and 10 make the language marked 1 --version01, 00 makes all of them --version01, 11 is joint
+        for xy, versions in (('00', ('0.1', '0.1')), ('01', ('0.2', '0.1')), ('10', ('0.1', '0.2'))):
+            self.run_pipeline('--separate', xy)
+            for l, version in zip(('en', 'de'), versions):
+                self.assertEqual(read('%s.codes.%s' % (self.prefix, l)).split('\n')[0], '#version: ' + version)
+        self.run_pipeline('--separate', '11')
+        self.assertEqual(read(self.prefix + '.codes').split('\n')[0], '#version: 0.2')
+
+    def test_up_to_date(self):
+        self.run_pipeline()
+        manifest = subword.Manifest(self.prefix + '.manifest.json')
+        out = os.path.join(self.dir, 'train.bpe.en')
+        key = manifest.outputs[os.path.abspath(out)]['key']
+        self.assertTrue(manifest.up_to_date(key, [out]))
+        self.assertFalse(manifest.up_to_date('other', [out]))
+        self.assertFalse(manifest.up_to_date(key, [out, os.path.join(self.dir, 'missing')]))
+        self.assertFalse(subword.Manifest(self.prefix + '.manifest.json', force=True).up_to_date(key, [out]))
+        with io.open(out, 'a', encoding='utf-8') as f:
+            f.write('changed\n')
+        self.assertFalse(manifest.up_to_date(key, [out]))
+        # a rerun remakes the changed output only
+        self.run_pipeline()
+        self.assertNotIn('changed', read(out))
+
+    def test_stage_key(self):
+        params = dict(stage='apply', lang='en')
+        key = subword.stage_key(params, self.files)
+        self.assertEqual(subword.stage_key(dict(lang='en', stage='apply'), self.files), key)
+        self.assertNotEqual(subword.stage_key(dict(params, lang='de'), self.files), key)
+        self.assertNotEqual(subword.stage_key(params, self.files[::-1]), key)
+        # content, not modification time
+        os.utime(self.files[0], (0, 0))
+        self.assertEqual(subword.stage_key(params, self.files), key)
+        with io.open(self.files[0], 'a', encoding='utf-8') as f:
+            f.write('more\n')
+        self.assertNotEqual(subword.stage_key(params, self.files), key)
+
+if __name__ == '__main__':
+    unittest.main()
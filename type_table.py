@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Author: Jonathan Graehl
+
+"""Type-first application of BPE (apply_bpe.py --write-types / --read-types).
+
+The first pass collects the distinct words of a corpus (with a process pool
+over blocks of lines), segments each of them once (with a process pool over
+the word list) and writes a table of their segmentations. The second pass
+rewrites the corpus from the table alone, with apply_bpe.ByteSegmenter. Either
+pass can be rerun on its own, and memory is bounded by the number of types.
+
+Table layout: the MAGIC line, then little-endian uint64 number of words, byte
+length of the words and byte length of the segmentations, then the UTF-8 words
+and their segmentations (as in the output, space separated), each separated by
+newlines. Words are most frequent first. (Python 3 only.)
+"""
+
+from __future__ import unicode_literals
+
+import struct
+from collections import Counter
+
+import apply_bpe
+
+MAGIC = b'#bpetypes 1\n'
+HEADER = struct.Struct('<QQQ')
+
+
+def block_types(block):
+    """Counter of the (bytes) words of an apply_bpe.line_blocks block"""
+    types = Counter()
+    for line in apply_bpe.block_lines(block):
+        types.update(line.split())
+    return types
+
+
+def collect_types(infile, num_workers=1, block_size=1 << 20):
+    """Counter of the words of binary file infile"""
+    blocks = apply_bpe.line_blocks(infile, block_size)
+    types = Counter()
+    if num_workers <= 1:
+        for block in blocks:
+            types.update(block_types(block))
+        return types
+    from multiprocessing import Pool
+    pool = Pool(num_workers)
+    try:
+        for partial in pool.imap(block_types, blocks):
+            types.update(partial)
+    finally:
+        pool.close()
+        pool.join()
+    return types
+
+
+# BPE object of a segment_job worker (set by the pool initializer)
+worker_bpe = None
+
+
+def init_segment_worker(bpe):
+    global worker_bpe
+    worker_bpe = bpe
+
+
+def segment_job(words):
+    words = [word.decode('utf-8') for word in words]
+    worker_bpe.cache_words(words)
+    return [worker_bpe.segment(word).encode('utf-8') for word in words]
+
+
+def segment_types(bpe, words, num_workers=1, jobs_per_worker=4):
+    """segmentations (as output bytes) of the list of bytes words"""
+    if num_workers <= 1:
+        init_segment_worker(bpe)
+        return segment_job(words)
+    step = max(1, -(-len(words) // (num_workers * jobs_per_worker)))
+    from multiprocessing import Pool
+    pool = Pool(num_workers, init_segment_worker, (bpe,))
+    try:
+        segmentations = []
+        for partial in pool.imap(segment_job, [words[i:i+step] for i in range(0, len(words), step)]):
+            segmentations.extend(partial)
+    finally:
+        pool.close()
+        pool.join()
+    return segmentations
+
+
+def write_table(words, segmentations, out):
+    blob = b'\n'.join(words)
+    segs = b'\n'.join(segmentations)
+    out.write(MAGIC)
+    out.write(HEADER.pack(len(words), len(blob), len(segs)))
+    out.write(blob)
+    out.write(segs)
+
+
+def read_table(path):
+    """dict of bytes word -> bytes segmentation, for apply_bpe.ByteSegmenter"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a segmentation table' % path)
+        n, nwords, nsegs = HEADER.unpack(f.read(HEADER.size))
+        if not n:
+            return {}
+        words = f.read(nwords).split(b'\n')
+        segmentations = f.read(nsegs).split(b'\n')
+    return dict(zip(words, segmentations))
+
+
+def first_pass(bpe, infile, out, num_workers=1, block_size=1 << 20):
+    """write the segmentation table of the words of binary file infile to binary file out; returns the number of types"""
+    words = [w for w, _ in collect_types(infile, num_workers, block_size).most_common()]
+    write_table(words, segment_types(bpe, words, num_workers), out)
+    return len(words)
+
+
+def second_pass(table, infile, out, bpe=None, block_size=1 << 20):
+    """segment binary file infile to binary file out with the words of table (see read_table) and,
+    for words not in it, bpe"""
+    apply_bpe.ByteSegmenter(bpe, block_size, table).segment_file(infile, out)